@@ -0,0 +1,97 @@
+"""
+推理后端一致性与吞吐基准
+
+分别用 torch、onnx、onnx-int8 后端编码同一批文本：
+1. 一致性：逐条计算 ONNX 向量与 torch 向量的余弦相似度，低于阈值时以非零状态退出
+2. 吞吐：记录每个后端的编码耗时和每秒处理的文本数
+
+用法:
+    python benchmarks/bench_embedding_backends.py [--corpus 语料目录] [--limit 2000]
+        [--backends onnx onnx-int8] [--min-cosine 0.99] [--min-cosine-int8 0.95]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.embedding import EmbeddingService
+from utils.config import Config
+
+SAMPLE_TEXTS = [
+    "当前大模型在中国的应用情况",
+    "合同编号 HT-2023-0457 的付款条款",
+    "The quarterly report shows revenue growth in the APAC region.",
+    "向量检索通过近似最近邻算法在海量数据中查找相似内容。",
+    "Please find attached the signed agreement and the invoice.",
+    "设备维护手册：每运行500小时需要更换一次滤芯。",
+]
+
+
+def load_texts(corpus_dir: str, limit: int):
+    """从语料目录读取分块，未指定目录时使用内置样例"""
+    if not corpus_dir:
+        return (SAMPLE_TEXTS * (limit // len(SAMPLE_TEXTS) + 1))[:limit]
+
+    from core.document_processor import DocumentProcessor
+    processor = DocumentProcessor()
+    extensions = [ext.lower() for ext in Config().get_file_extensions()]
+    texts = []
+    for root, _, files in os.walk(corpus_dir):
+        for filename in files:
+            if any(filename.lower().endswith(ext) for ext in extensions):
+                doc_info = processor.parse_document(os.path.join(root, filename))
+                if doc_info["content"]:
+                    texts.extend(processor.create_chunks(doc_info["content"]))
+            if len(texts) >= limit:
+                return texts[:limit]
+    return texts
+
+
+def run_backend(model_name: str, backend: str, texts, batch_size: int):
+    service = EmbeddingService(model_name, backend=backend)
+    service.encode(texts[:batch_size], batch_size=batch_size)  # 预热
+    started = time.perf_counter()
+    embeddings = service.encode(texts, batch_size=batch_size)
+    return embeddings, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推理后端一致性与吞吐基准")
+    parser.add_argument("--corpus", default="", help="语料目录，默认使用内置样例")
+    parser.add_argument("--limit", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--backends", nargs="+", default=["onnx", "onnx-int8"])
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="onnx 后端的最低余弦一致度")
+    parser.add_argument("--min-cosine-int8", type=float, default=0.95, help="onnx-int8 后端的最低余弦一致度")
+    args = parser.parse_args()
+
+    model_name = Config().get_model_name()
+    texts = load_texts(args.corpus, args.limit)
+    print(f"模型: {model_name}，文本数: {len(texts)}，批大小: {args.batch_size}")
+
+    reference, elapsed = run_backend(model_name, "torch", texts, args.batch_size)
+    print(f"{'torch':<10} 耗时: {elapsed:7.2f} 秒  吞吐: {len(texts) / elapsed:8.1f} 条/秒")
+
+    passed = True
+    for backend in args.backends:
+        embeddings, backend_elapsed = run_backend(model_name, backend, texts, args.batch_size)
+        # 向量均已归一化，点积即余弦相似度
+        cosine = np.sum(reference * embeddings, axis=1)
+        threshold = args.min_cosine_int8 if backend == "onnx-int8" else args.min_cosine
+        ok = cosine.min() >= threshold
+        passed = passed and ok
+        print(f"{backend:<10} 耗时: {backend_elapsed:7.2f} 秒  吞吐: {len(texts) / backend_elapsed:8.1f} 条/秒  "
+              f"加速: {elapsed / backend_elapsed:5.2f}x  "
+              f"余弦 最小/平均: {cosine.min():.4f}/{cosine.mean():.4f}  "
+              f"{'通过' if ok else f'未通过 (阈值 {threshold})'}")
+
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
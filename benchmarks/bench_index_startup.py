@@ -0,0 +1,127 @@
+"""
+索引加载启动时间基准
+
+生成指定规模的索引文件后，在独立子进程中分别以四种方式打开索引：
+1. 完整读入（原行为）
+2. 内存映射（mmap，需要 faiss 1.11 及以上版本，旧版本实际为完整读入）
+3. 后台加载（lazy_load）
+4. 后台加载 + 内存映射
+
+对每种方式记录构造 VectorStore 的耗时（即界面可以显示的时间）、
+首次搜索返回的时间和打开索引后的内存增量。内存映射的页面属于页缓存，
+多个进程共享同一份，因此同时列出私有内存（RssAnon）的增量。
+测试数据库中没有分块记录，搜索只计时，不回查结果。
+
+用法:
+    python benchmarks/bench_index_startup.py [--vectors 1000000] [--dimension 384] [--workdir 目录]
+"""
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = {
+    "完整读入": {"mmap": False, "lazy_load": False},
+    "内存映射": {"mmap": True, "lazy_load": False},
+    "后台加载": {"mmap": False, "lazy_load": True},
+    "后台加载+映射": {"mmap": True, "lazy_load": True},
+}
+
+
+def build_index(workdir: str, vectors: int, dimension: int):
+    """生成测试索引文件（已存在时复用）"""
+    import faiss
+
+    index_file = os.path.join(workdir, "faiss.index")
+    if os.path.exists(index_file):
+        return index_file
+    index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+    rng = np.random.default_rng(0)
+    batch = 100000
+    for start in range(0, vectors, batch):
+        count = min(batch, vectors - start)
+        index.add_with_ids(rng.random((count, dimension), dtype=np.float32),
+                           np.arange(start, start + count, dtype=np.int64))
+    faiss.write_index(index, index_file)
+    return index_file
+
+
+def memory_mb() -> dict:
+    """进程当前的常驻内存和私有内存（MB），仅支持 Linux"""
+    result = {"VmRSS": float("nan"), "RssAnon": float("nan")}
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                key = line.split(":")[0]
+                if key in result:
+                    result[key] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return result
+
+
+def run_child(workdir: str, options: dict):
+    """子进程：打开索引并执行一次搜索，输出计时结果"""
+    os.chdir(workdir)  # VectorStore 在当前目录下创建 documents.db
+    from core.vector_store import VectorStore
+
+    logging.disable(logging.CRITICAL)
+    baseline = memory_mb()
+    started = time.perf_counter()
+    store = VectorStore(index_file="faiss.index", load_wait_timeout=3600, **options)
+    constructed = time.perf_counter() - started
+    query = np.random.default_rng(1).random(store.dimension, dtype=np.float32)
+    store.search(query, 10)
+    first_search = time.perf_counter() - started
+    print(json.dumps({
+        "constructed": constructed,
+        "first_search": first_search,
+        "rss": memory_mb()["VmRSS"] - baseline["VmRSS"],
+        "anon": memory_mb()["RssAnon"] - baseline["RssAnon"],
+    }))
+    os._exit(0)  # 跳过退出时保存索引
+
+
+def main():
+    parser = argparse.ArgumentParser(description="索引加载启动时间基准")
+    parser.add_argument("--vectors", type=int, default=1000000)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--workdir", default="", help="索引文件目录，默认使用临时目录")
+    parser.add_argument("--child", default="", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.workdir, json.loads(args.child))
+        return
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        workdir = args.workdir or tempdir
+        started = time.perf_counter()
+        index_file = build_index(workdir, args.vectors, args.dimension)
+        print(f"索引: {args.vectors} 个 {args.dimension} 维向量，"
+              f"{os.path.getsize(index_file) / 1024 / 1024:.0f} MB，生成耗时 {time.perf_counter() - started:.1f} 秒")
+
+        for name, options in MODES.items():
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--workdir", workdir,
+                 "--dimension", str(args.dimension), "--child", json.dumps(options)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{name:<10} 构造耗时: {result['constructed']:7.3f} 秒  "
+                  f"首次搜索: {result['first_search']:7.3f} 秒  "
+                  f"RSS增量: {result['rss']:8.1f} MB  私有内存增量: {result['anon']:8.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+搜索结果回查（hydration）延迟基准
+
+在临时目录中生成包含大量分块记录的 documents 表，随机抽取 top_k 个 faiss_id，
+比较两种回查方式的延迟：
+1. 逐条回查（原实现）：每个命中执行一次 COUNT(*) 和一次无索引的 faiss_id 查询
+2. 批量回查（VectorStore._hydrate）：faiss_id 索引 + 单条 json_each 查询
+
+逐条回查在百万行时每次搜索需要数秒，默认只运行少量次数。
+
+用法:
+    python benchmarks/bench_search_hydration.py [--rows 1000000] [--top-k 50]
+        [--queries 200] [--legacy-queries 3]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.vector_store import VectorStore
+
+
+def populate(store: VectorStore, rows: int, chunks_per_file: int = 20):
+    """批量写入测试记录"""
+    text = "示例分块内容 sample chunk text " * 8
+    metadata = json.dumps({"file_type": ".txt", "file_size": 4096})
+    cursor = store.conn.cursor()
+    batch = 50000
+    for start in range(0, rows, batch):
+        cursor.executemany('''
+        INSERT INTO documents (file_path, chunk_index, chunk_text, metadata, faiss_id)
+        VALUES (?, ?, ?, ?, ?)
+        ''', (
+            (f"/corpus/dir{i // 10000}/file{i // chunks_per_file}.txt", i % chunks_per_file, text, metadata, i)
+            for i in range(start, min(start + batch, rows))
+        ))
+    store.conn.commit()
+
+
+def legacy_hydrate(store: VectorStore, hits):
+    """原实现的逐条回查，NOT INDEXED 模拟 faiss_id 没有索引的情况"""
+    cursor = store.conn.cursor()
+    results = []
+    for idx, distance in hits:
+        cursor.execute('SELECT COUNT(*) FROM documents')
+        cursor.fetchone()
+        cursor.execute(f'''
+        SELECT file_path, chunk_text, metadata FROM documents NOT INDEXED
+        WHERE faiss_id = {idx}
+        ''')
+        row = cursor.fetchone()
+        if row:
+            results.append((row[0], distance, {"chunk_text": row[1], "metadata": json.loads(row[2])}))
+    return results
+
+
+def measure(func, store, queries):
+    timings = []
+    for hits in queries:
+        started = time.perf_counter()
+        func(store, hits)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(f"{name:<8} 次数: {len(timings):>5}  中位数: {statistics.median(timings):10.3f} ms  "
+          f"p95: {p95:10.3f} ms")
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="搜索结果回查延迟基准")
+    parser.add_argument("--rows", type=int, default=1000000, help="documents 表的记录数")
+    parser.add_argument("--top-k", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200, help="批量回查的测量次数")
+    parser.add_argument("--legacy-queries", type=int, default=3, help="逐条回查的测量次数，0 表示跳过")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)  # VectorStore 在当前目录下创建 documents.db
+        try:
+            store = VectorStore(index_file=os.path.join(workdir, "faiss.index"))
+            started = time.perf_counter()
+            populate(store, args.rows)
+            print(f"已生成 {args.rows} 条记录，耗时 {time.perf_counter() - started:.1f} 秒，top_k: {args.top_k}")
+
+            queries = [
+                [(int(idx), float(rank)) for rank, idx in enumerate(rng.choice(args.rows, args.top_k, replace=False))]
+                for _ in range(max(args.queries, args.legacy_queries))
+            ]
+            batched = report("批量回查", measure(lambda s, hits: s._hydrate(hits), store, queries[:args.queries]))
+            if args.legacy_queries > 0:
+                legacy = report("逐条回查", measure(legacy_hydrate, store, queries[:args.legacy_queries]))
+                print(f"加速: {legacy / batched:.0f}x")
+                # 结果及顺序与逐条回查一致
+                sample = queries[0]
+                assert store._hydrate(sample) == legacy_hydrate(store, sample)
+            del store
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
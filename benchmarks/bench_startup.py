@@ -0,0 +1,123 @@
+"""
+启动开销基准
+
+在独立的解释器中导入各入口模块，记录导入耗时以及被连带导入的重型依赖
+（sentence_transformers、torch、faiss、文档解析库等）。主窗口和命令行入口在导入阶段
+不应加载这些依赖，它们由后台预热线程或首次使用时再导入。
+
+加 --warmup 时另外测量创建 SearchService 并完成预热（加载嵌入模型、等待索引加载）的耗时，
+即界面显示后到搜索框可用的时间；该项会在当前目录下读写 documents.db 等文件，
+建议在测试目录中运行。
+
+加 --check 时，任一入口模块连带导入了重型依赖、或导入耗时超过 --max-import-seconds，
+则以非零状态退出，可用于持续集成中防止启动性能回退。
+
+用法:
+    python benchmarks/bench_startup.py [--repeat 3] [--warmup] [--check] [--max-import-seconds 1.0]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 入口模块及其所需的可选依赖（缺少时跳过）
+ENTRY_MODULES = {
+    "ui.main_window": "PyQt6",
+    "core.workers": "PyQt6",
+    "docseeker": None,
+    "core.search_service": None,
+}
+
+HEAVY_MODULES = [
+    "sentence_transformers", "transformers", "torch", "onnxruntime",
+    "faiss", "tika", "pdfplumber", "docx",
+]
+
+# 子进程中执行的测量代码
+_IMPORT_PROBE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+_WARMUP_PROBE = """
+import json, logging, sys, time
+sys.path.insert(0, {root!r})
+logging.disable(logging.CRITICAL)
+started = time.perf_counter()
+from core.search_service import SearchService
+imported = time.perf_counter()
+service = SearchService()
+constructed = time.perf_counter()
+service.warmup()
+ready = time.perf_counter()
+service.search("预热测试查询", 10)
+searched = time.perf_counter()
+print(json.dumps({{"import": imported - started, "construct": constructed - imported,
+                   "warmup": ready - constructed, "first_search": searched - ready}}))
+"""
+
+
+def module_available(name) -> bool:
+    if name is None:
+        return True
+    try:
+        __import__(name)
+        return True
+    except ImportError:
+        return False
+
+
+def run_probe(code: str) -> dict:
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="启动开销基准")
+    parser.add_argument("--repeat", type=int, default=3, help="每个入口模块的测量次数，取中位数")
+    parser.add_argument("--warmup", action="store_true", help="同时测量搜索服务创建和预热的耗时")
+    parser.add_argument("--check", action="store_true", help="发现启动回退时以非零状态退出")
+    parser.add_argument("--max-import-seconds", type=float, default=1.0,
+                        help="--check 时入口模块允许的最长导入耗时")
+    args = parser.parse_args()
+
+    failures = []
+    for module, requirement in ENTRY_MODULES.items():
+        if not module_available(requirement):
+            print(f"{module:<22} 跳过（未安装 {requirement}）")
+            continue
+        runs = [run_probe(_IMPORT_PROBE.format(root=ROOT, module=module, heavy=HEAVY_MODULES))
+                for _ in range(args.repeat)]
+        seconds = statistics.median(run["seconds"] for run in runs)
+        heavy = sorted(set().union(*(run["heavy"] for run in runs)))
+        print(f"{module:<22} 导入耗时: {seconds * 1000:8.1f} ms  重型依赖: {', '.join(heavy) or '无'}")
+        # core.search_service 本身依赖 faiss，只检查导入时间
+        if module != "core.search_service" and heavy:
+            failures.append(f"{module} 导入时加载了 {', '.join(heavy)}")
+        if seconds > args.max_import_seconds:
+            failures.append(f"{module} 导入耗时 {seconds:.2f} 秒，超过 {args.max_import_seconds} 秒")
+
+    if args.warmup:
+        result = run_probe(_WARMUP_PROBE.format(root=ROOT))
+        print(f"搜索服务  导入: {result['import']:.2f} 秒  创建: {result['construct']:.2f} 秒  "
+              f"预热: {result['warmup']:.2f} 秒  首次搜索: {result['first_search'] * 1000:.1f} ms")
+
+    if failures:
+        print("\n".join(["", "启动回退:"] + failures))
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,26 @@
 """
 核心模块包，提供文档处理、向量化、存储和搜索功能
+
+子模块按需导入：解析子进程只需导入 document_processor，
+不应连带加载嵌入模型、FAISS 或 PyQt。
 """
 
-from .document_processor import DocumentProcessor
-from .embedding import EmbeddingService
-from .vector_store import VectorStore
-from .search_service import SearchService
-from .workers import IndexingWorker
+import importlib
+
+_EXPORTS = {
+    'DocumentProcessor': '.document_processor',
+    'ParallelDocumentParser': '.document_processor',
+    'EmbeddingService': '.embedding',
+    'VectorStore': '.vector_store',
+    'SearchService': '.search_service',
+    'IndexingPipeline': '.pipeline',
+    'IndexingWorker': '.workers',
+}
+
+__all__ = list(_EXPORTS)
+
 
-__all__ = [
-    'DocumentProcessor',
-    'EmbeddingService',
-    'VectorStore',
-    'SearchService',
-    'IndexingWorker'
-] 
\ No newline at end of file
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
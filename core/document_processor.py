@@ -1,10 +1,13 @@
 import os
-from typing import List, Dict
-from tika import parser
-import pdfplumber
-from docx import Document
+from typing import List, Dict, Iterator, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
 from utils.logger import Logger
 
+# 各格式的解析库在首次解析该格式时才导入，避免拖慢程序启动
+
 class DocumentProcessor:
     def __init__(self, chunk_size: int = 512):
         self.logger = Logger.get_logger(__name__)
@@ -34,6 +37,8 @@ class DocumentProcessor:
 
     def _parse_pdf(self, file_path: str) -> Dict:
         """解析PDF文件"""
+        import pdfplumber
+        
         text = ""
         metadata = {}
         
@@ -53,6 +58,8 @@ class DocumentProcessor:
 
     def _parse_docx(self, file_path: str) -> Dict:
         """解析DOCX文件"""
+        from docx import Document
+        
         doc = Document(file_path)
         text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
         
@@ -82,6 +89,8 @@ class DocumentProcessor:
 
     def _parse_with_tika(self, file_path: str) -> Dict:
         """使用Tika解析其他格式文件"""
+        from tika import parser
+        
         parsed = parser.from_file(file_path)
         return {
             "content": parsed.get("content", ""),
@@ -109,4 +118,119 @@ class DocumentProcessor:
             # 移动滑动窗口，考虑重叠
             start = end - overlap
 
-        return chunks 
\ No newline at end of file
+        return chunks
+
+
+def _parse_in_subprocess(file_path: str) -> Dict:
+    """在子进程中解析文档（模块级函数，便于进程池序列化）"""
+    return DocumentProcessor().parse_document(file_path)
+
+
+class ParallelDocumentParser:
+    """
+    基于进程池的并行文档解析器
+    
+    pdfplumber、python-docx 均为纯Python实现并持有GIL，线程无法并行解析。
+    本类把 parse_document 分发到进程池中执行，并提供：
+    1. 单文件超时：超时文件所在的进程池会被终止并重建，不会拖住整个批次
+    2. 崩溃隔离：子进程崩溃导致进程池损坏时重建进程池，受牵连的文件
+       在独立的单进程池中重试，只有真正导致崩溃的文件会失败
+    
+    parse 方法是线程安全的，可由多个线程同时调用。
+    """
+    
+    def __init__(self, max_workers: Optional[int] = None, timeout: float = 120.0):
+        """
+        Args:
+            max_workers: 子进程数量，默认使用CPU核心数
+            timeout: 单个文件的解析超时时间，单位秒
+        """
+        self.logger = Logger.get_logger(__name__)
+        self.max_workers = max_workers or os.cpu_count() or 4
+        self.timeout = timeout
+        self._lock = Lock()
+        self._executor = None
+        self._generation = 0
+        
+    @staticmethod
+    def _terminate(executor: ProcessPoolExecutor):
+        """强制终止进程池（超时任务仍在子进程中运行，shutdown 无法释放）"""
+        terminate = getattr(executor, 'terminate_workers', None)
+        if terminate is not None:
+            terminate()
+        else:
+            for process in list((executor._processes or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+        
+    def _restart(self, generation: int):
+        """终止并丢弃指定代次的共享进程池，下次提交任务时重新创建"""
+        with self._lock:
+            if generation != self._generation or self._executor is None:
+                return  # 其他线程已经重建过
+            executor, self._executor = self._executor, None
+            self._generation += 1
+        self._terminate(executor)
+        self.logger.warning("解析进程池已重建")
+        
+    def parse(self, file_path: str) -> Dict:
+        """
+        在子进程中解析单个文档
+        
+        Raises:
+            TimeoutError: 解析超时
+            RuntimeError: 解析进程崩溃
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            generation = self._generation
+            future = self._executor.submit(_parse_in_subprocess, file_path)
+            
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.logger.error("文档解析超时(%.0f秒): %s", self.timeout, file_path)
+            self._restart(generation)
+            raise TimeoutError(f"文档解析超时: {file_path}")
+        except BrokenProcessPool:
+            # 可能是本文件导致崩溃，也可能是其他文件超时或崩溃时受到牵连
+            self._restart(generation)
+            self.logger.warning("解析进程池损坏，单独重试文件: %s", file_path)
+            return self._parse_isolated(file_path)
+            
+    def _parse_isolated(self, file_path: str) -> Dict:
+        """在独立的单进程池中解析文档，崩溃不会影响其他文件"""
+        executor = ProcessPoolExecutor(max_workers=1)
+        try:
+            return executor.submit(_parse_in_subprocess, file_path).result(timeout=self.timeout)
+        except FutureTimeoutError:
+            self.logger.error("文档解析超时(%.0f秒): %s", self.timeout, file_path)
+            raise TimeoutError(f"文档解析超时: {file_path}")
+        except BrokenProcessPool:
+            self.logger.error("解析进程崩溃，放弃文件: %s", file_path)
+            raise RuntimeError(f"解析进程崩溃: {file_path}")
+        finally:
+            self._terminate(executor)
+            
+    def parse_many(self, file_paths: List[str]) -> Iterator[Tuple[str, Optional[Dict]]]:
+        """
+        并行解析多个文档，按输入顺序返回 (文件路径, 解析结果)
+        
+        解析失败或超时的文件结果为 None
+        """
+        def parse_safe(file_path: str):
+            try:
+                return file_path, self.parse(file_path)
+            except Exception:
+                return file_path, None
+                
+        with ThreadPoolExecutor(max_workers=self.max_workers) as threads:
+            yield from threads.map(parse_safe, file_paths)
+            
+    def shutdown(self):
+        """关闭进程池"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
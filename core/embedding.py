@@ -1,29 +1,283 @@
-from sentence_transformers import SentenceTransformer
 import numpy as np
-from typing import List, Union
+import time
+from collections import deque
+from threading import Lock
+from typing import Any, Callable, List, Optional, Union
+from core.embedding_cache import EmbeddingCache
 from utils.logger import Logger
 
+def padded_token_count(lengths: List[int], batch_size: int) -> int:
+    """按给定顺序分批时，补齐到每批最长序列后的总token数"""
+    return sum(
+        max(lengths[start:start + batch_size]) * len(lengths[start:start + batch_size])
+        for start in range(0, len(lengths), batch_size)
+    )
+
+
 class EmbeddingService:
-    def __init__(self, model_name: str = 'paraphrase-multilingual-MiniLM-L12-v2'):
-        """初始化嵌入服务"""
+    # 可选的推理后端
+    BACKENDS = ('torch', 'onnx', 'onnx-int8')
+    
+    def __init__(self, model_name: str = 'paraphrase-multilingual-MiniLM-L12-v2',
+                 bucket_by_length: bool = True,
+                 cache: Optional[EmbeddingCache] = None,
+                 backend: str = 'torch'):
+        """
+        初始化嵌入服务
+        
+        Args:
+            model_name: 模型名称
+            bucket_by_length: 是否按token长度分桶编码，减少批内补齐的无效计算
+            cache: 可选的持久化嵌入缓存，命中的分块不再经过模型
+            backend: 推理后端，torch、onnx 或 onnx-int8（动态int8量化）
+        """
         self.logger = Logger.get_logger(__name__)
-        self.logger.info("初始化嵌入服务，使用模型: %s", model_name)
-        self.model = SentenceTransformer(model_name)
+        self.logger.info("初始化嵌入服务，使用模型: %s，后端: %s", model_name, backend)
+        if backend not in self.BACKENDS:
+            raise ValueError(f"不支持的推理后端: {backend}")
+        self.model_name = model_name
+        self.backend = backend
+        # 不同后端的向量存在细微差异，缓存按后端区分
+        self.cache_key = model_name if backend == 'torch' else f"{model_name}#{backend}"
+        self.bucket_by_length = bucket_by_length
+        self.cache = cache
+        # 模型在首次编码（或 warmup）时才加载，导入 sentence_transformers/torch 需要数秒
+        self._model = None
+        self._model_lock = Lock()
+        
+    @property
+    def model(self):
+        """编码模型，首次访问时加载"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    self._model = self._load_model()
+        return self._model
+        
+    def _load_model(self):
+        started = time.perf_counter()
+        if self.backend == 'torch':
+            from sentence_transformers import SentenceTransformer
+            model = SentenceTransformer(self.model_name)
+        else:
+            from core.onnx_encoder import OnnxEncoder
+            model = OnnxEncoder(self.model_name, quantize=(self.backend == 'onnx-int8'))
+        self.logger.info("嵌入模型加载完成，耗时 %.2f 秒", time.perf_counter() - started)
+        return model
         
-    def encode(self, texts: Union[str, List[str]], batch_size: int = 32) -> np.ndarray:
-        """将文本转换为向量"""
+    def is_loaded(self) -> bool:
+        """模型是否已加载"""
+        return self._model is not None
+        
+    def warmup(self):
+        """加载模型并执行一次编码，使首次查询不再承担初始化开销（不写入嵌入缓存）"""
+        self._encode_with_model(["warmup"], batch_size=1, bucket_by_length=False)
+        
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32,
+               bucket_by_length: Optional[bool] = None, use_cache: bool = True) -> np.ndarray:
+        """
+        将文本转换为向量
+        
+        Args:
+            use_cache: 是否使用持久化的嵌入缓存。查询文本应传 False：缓存面向文档分块的重复编码，
+                查询写入缓存只会增加磁盘写入并挤出分块的嵌入
+        """
         self.logger.debug("开始文本编码，批大小: %d", batch_size)
         if isinstance(texts, str):
             texts = [texts]
             
         self.logger.debug("待编码文本数量: %d", len(texts))
+        if bucket_by_length is None:
+            bucket_by_length = self.bucket_by_length
+            
+        if self.cache is None or not use_cache or not texts:
+            embeddings = self._encode_with_model(texts, batch_size, bucket_by_length)
+        else:
+            embeddings = self._encode_cached(texts, batch_size, bucket_by_length)
+        
+        self.logger.debug("编码完成，生成向量数量: %d", len(embeddings))
+        return embeddings
+        
+    def _encode_with_model(self, texts: List[str], batch_size: int,
+                           bucket_by_length: bool) -> np.ndarray:
+        """使用模型编码"""
+        if bucket_by_length and len(texts) > 1:
+            return self._encode_bucketed(texts, batch_size)
         # 使用模型进行编码
-        embeddings = self.model.encode(
+        return self.model.encode(
             texts,
             batch_size=batch_size,
             show_progress_bar=True,
             normalize_embeddings=True
         )
         
-        self.logger.debug("编码完成，生成向量数量: %d", len(embeddings))
-        return embeddings 
\ No newline at end of file
+    def _encode_cached(self, texts: List[str], batch_size: int,
+                       bucket_by_length: bool) -> np.ndarray:
+        """先查嵌入缓存，只对未命中的文本运行模型"""
+        cached = self.cache.get_many(self.cache_key, texts)
+        missing = [i for i, vector in enumerate(cached) if vector is None]
+        self.logger.debug("嵌入缓存命中 %d/%d", len(texts) - len(missing), len(texts))
+        
+        if missing:
+            # 同一批次中重复的文本只编码一次
+            missing_texts = list(dict.fromkeys(texts[i] for i in missing))
+            computed = self._encode_with_model(missing_texts, batch_size, bucket_by_length)
+            self.cache.put_many(self.cache_key, missing_texts, computed)
+            vectors = dict(zip(missing_texts, computed))
+            for i in missing:
+                cached[i] = vectors[texts[i]]
+                
+        return np.vstack(cached).astype(np.float32, copy=False)
+        
+    def cache_stats(self) -> Optional[dict]:
+        """获取嵌入缓存统计信息，未启用缓存时返回 None"""
+        return self.cache.stats() if self.cache is not None else None
+        
+    def token_lengths(self, texts: List[str]) -> List[int]:
+        """计算文本截断到模型最大长度后的token数（不补齐）"""
+        encoded = self.model.tokenizer(
+            texts,
+            add_special_tokens=True,
+            truncation=True,
+            max_length=self.model.max_seq_length
+        )
+        return [len(ids) for ids in encoded['input_ids']]
+        
+    def _encode_bucketed(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """
+        按token长度排序后分桶编码，再恢复原始顺序
+        
+        SentenceTransformer 内部按字符数排序，中英文混排时字符数与token数相差较大，
+        同一批次仍会被补齐到最长序列。这里按真实token数分桶，每个桶单独作为一批编码。
+        """
+        lengths = self.token_lengths(texts)
+        order = np.argsort(lengths, kind='stable')
+        embeddings = None
+        
+        for start in range(0, len(texts), batch_size):
+            bucket = order[start:start + batch_size]
+            bucket_embeddings = self.model.encode(
+                [texts[i] for i in bucket],
+                batch_size=len(bucket),
+                show_progress_bar=False,
+                normalize_embeddings=True
+            )
+            if embeddings is None:
+                embeddings = np.empty((len(texts), bucket_embeddings.shape[1]),
+                                      dtype=bucket_embeddings.dtype)
+            embeddings[bucket] = bucket_embeddings
+            
+        self.logger.debug(
+            "分桶编码完成，补齐后token数: %d（按到达顺序为 %d）",
+            padded_token_count(sorted(lengths), batch_size),
+            padded_token_count(lengths, batch_size)
+        )
+        return embeddings
+
+
+class EmbeddingBatcher:
+    """
+    跨文档的嵌入批处理器
+    
+    按文件逐个调用 encode 时，只有一两个分块的小文件也会单独执行一次前向计算。
+    本类把多个文档的分块拼成满 batch_size 的批次统一编码，再把向量按顺序
+    分发回各自的文档；最早的待编码分块等待超过 max_delay 时强制刷新，
+    保证延迟有上界。
+    
+    非线程安全，应由单个线程调用。
+    """
+    
+    def __init__(self, embedding_service: EmbeddingService,
+                 callback: Callable[[Any, np.ndarray], None],
+                 batch_size: int = 256, max_delay: float = 0.5,
+                 encode_batch_size: int = 32,
+                 error_callback: Optional[Callable[[Any, Exception], None]] = None):
+        """
+        Args:
+            embedding_service: 嵌入服务实例
+            callback: 文档全部分块编码完成时调用，参数为 (文档标识, 向量数组)
+            batch_size: 每次调用 encode 拼接的分块数
+            max_delay: 分块最长等待时间，单位秒
+            encode_batch_size: 模型前向计算的批大小，encode 会在拼接窗口内按长度分桶
+            error_callback: 可选，批次编码失败时对批次涉及的每个文档调用，参数为 (文档标识, 异常)
+        """
+        self.logger = Logger.get_logger(__name__)
+        self.embedding_service = embedding_service
+        self.callback = callback
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.encode_batch_size = encode_batch_size
+        self.error_callback = error_callback
+        self._pending = deque()  # 待编码的文档条目，按到达顺序
+        self._pending_count = 0  # 尚未编码的分块数
+        self._oldest = None  # 最早未编码分块的到达时间
+        
+    def add(self, key: Any, texts: List[str]):
+        """加入一个文档的全部分块，凑满批次时立即编码"""
+        if not texts:
+            self.callback(key, np.zeros((0, 0), dtype=np.float32))
+            return
+            
+        now = time.monotonic()
+        self._pending.append({'key': key, 'texts': texts, 'offset': 0, 'parts': [], 'arrived': now})
+        self._pending_count += len(texts)
+        if self._oldest is None:
+            self._oldest = now
+            
+        while self._pending_count >= self.batch_size:
+            self._encode_batch(self.batch_size)
+            
+    def time_until_due(self) -> Optional[float]:
+        """距离必须刷新还剩多少秒，没有待编码分块时返回 None"""
+        if self._oldest is None:
+            return None
+        return max(0.0, self.max_delay - (time.monotonic() - self._oldest))
+        
+    def flush_if_due(self):
+        """最早的分块等待超时时刷新"""
+        remaining = self.time_until_due()
+        if remaining is not None and remaining <= 0:
+            self.flush()
+            
+    def flush(self):
+        """编码所有待处理分块"""
+        while self._pending_count > 0:
+            self._encode_batch(min(self._pending_count, self.batch_size))
+            
+    def _encode_batch(self, size: int):
+        """从队首取出 size 个分块编码，并把结果分发回所属文档"""
+        texts = []
+        spans = []
+        for entry in self._pending:
+            if len(texts) >= size:
+                break
+            take = min(size - len(texts), len(entry['texts']) - entry['offset'])
+            texts.extend(entry['texts'][entry['offset']:entry['offset'] + take])
+            spans.append((entry, take))
+            
+        try:
+            embeddings = self.embedding_service.encode(texts, batch_size=self.encode_batch_size)
+        except Exception as e:
+            # 丢弃本批次涉及的文档，避免同一批分块反复失败
+            self.logger.error(f"批次编码失败，丢弃 {len(spans)} 个文档: {str(e)}")
+            for entry, _ in spans:
+                self._pending.remove(entry)
+                self._pending_count -= len(entry['texts']) - entry['offset']
+                if self.error_callback:
+                    self.error_callback(entry['key'], e)
+            self._oldest = self._pending[0]['arrived'] if self._pending else None
+            return
+        
+        start = 0
+        for entry, take in spans:
+            entry['parts'].append(embeddings[start:start + take])
+            entry['offset'] += take
+            start += take
+        self._pending_count -= len(texts)
+        
+        # 已完成的文档出队并回调
+        while self._pending and self._pending[0]['offset'] == len(self._pending[0]['texts']):
+            entry = self._pending.popleft()
+            self.callback(entry['key'], np.vstack(entry['parts']))
+            
+        self._oldest = self._pending[0]['arrived'] if self._pending else None
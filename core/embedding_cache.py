@@ -0,0 +1,162 @@
+"""
+持久化的内容寻址嵌入缓存
+
+以 (模型名称, 分块内容哈希) 为键把向量保存在 SQLite 中，重复的分块
+（公共页眉、跨目录的重复文件、clear_all 之后未变化的文件）无需再次编码。
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, List, Optional
+import numpy as np
+from utils.logger import Logger
+
+
+class EmbeddingCache:
+    """
+    基于SQLite的嵌入缓存
+
+    特点：
+    1. 以模型名称和分块SHA-256哈希为键，切换模型不会读到旧向量
+    2. 条目数超过上限时按最近访问时间淘汰（LRU）
+    3. 统计命中与未命中次数
+    4. 线程安全
+    """
+
+    # 单条SQL中查询的最大键数
+    _LOOKUP_BATCH = 500
+
+    def __init__(self, db_path: str = "embedding_cache.db", max_entries: int = 200000):
+        """
+        Args:
+            db_path: 缓存数据库文件路径
+            max_entries: 最多缓存的向量条数
+        """
+        self.logger = Logger.get_logger(__name__)
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        cursor = self.conn.cursor()
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS embeddings (
+            model TEXT NOT NULL,
+            chunk_hash TEXT NOT NULL,
+            vector BLOB NOT NULL,
+            last_access INTEGER NOT NULL,
+            PRIMARY KEY (model, chunk_hash)
+        ) WITHOUT ROWID
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings(last_access)')
+        self.conn.commit()
+        cursor.execute('SELECT COUNT(*) FROM embeddings')
+        self.entries = cursor.fetchone()[0]
+        self.logger.info("嵌入缓存已打开: %s，包含 %d 条向量", db_path, self.entries)
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """计算分块内容哈希"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        批量查询缓存
+
+        Returns:
+            与 texts 等长的列表，未命中的位置为 None
+        """
+        hashes = [self.hash_text(text) for text in texts]
+        found: Dict[str, np.ndarray] = {}
+        now = time.time_ns()
+
+        with self.lock:
+            cursor = self.conn.cursor()
+            unique_hashes = list(set(hashes))
+            for start in range(0, len(unique_hashes), self._LOOKUP_BATCH):
+                batch = json.dumps(unique_hashes[start:start + self._LOOKUP_BATCH])
+                cursor.execute('''
+                SELECT chunk_hash, vector FROM embeddings
+                WHERE model = ? AND chunk_hash IN (SELECT value FROM json_each(?))
+                ''', (model, batch))
+                for chunk_hash, vector in cursor.fetchall():
+                    found[chunk_hash] = np.frombuffer(vector, dtype=np.float32)
+
+                # 刷新命中条目的访问时间
+                cursor.execute('''
+                UPDATE embeddings SET last_access = ?
+                WHERE model = ? AND chunk_hash IN (SELECT value FROM json_each(?))
+                ''', (now, model, batch))
+            self.conn.commit()
+
+            results = [found.get(chunk_hash) for chunk_hash in hashes]
+            hit_count = sum(1 for vector in results if vector is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+        return results
+
+    def put_many(self, model: str, texts: List[str], vectors: np.ndarray):
+        """批量写入缓存，超过容量时淘汰最久未访问的条目"""
+        if len(texts) == 0:
+            return
+        now = time.time_ns()
+        rows = [
+            (model, self.hash_text(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.executemany('''
+            INSERT OR REPLACE INTO embeddings (model, chunk_hash, vector, last_access)
+            VALUES (?, ?, ?, ?)
+            ''', rows)
+            self.entries += cursor.rowcount if cursor.rowcount > 0 else 0
+            if self.entries > self.max_entries:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """淘汰到容量的90%，避免每次写入都触发淘汰（调用方需持有 lock）"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT COUNT(*) FROM embeddings')
+        self.entries = cursor.fetchone()[0]
+        excess = self.entries - int(self.max_entries * 0.9)
+        if excess <= 0:
+            return
+        cursor.execute('''
+        DELETE FROM embeddings WHERE (model, chunk_hash) IN (
+            SELECT model, chunk_hash FROM embeddings ORDER BY last_access LIMIT ?
+        )
+        ''', (excess,))
+        self.entries -= cursor.rowcount
+        self.logger.info("嵌入缓存淘汰 %d 条向量，剩余 %d 条", cursor.rowcount, self.entries)
+
+    def stats(self) -> Dict:
+        """获取缓存统计信息"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": self.entries,
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0
+            }
+
+    def clear(self):
+        """清空缓存"""
+        with self.lock:
+            self.conn.execute('DELETE FROM embeddings')
+            self.conn.commit()
+            self.entries = 0
+
+    def close(self):
+        """关闭数据库连接"""
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,73 @@
+"""
+混合检索的结果融合
+
+向量检索返回距离（越小越相关），FTS5 的 bm25() 返回负分（越小越相关），
+两者的数值不可比，融合只使用排名（RRF）或各自归一化后的分数（加权）。
+融合后的分数都在 [0, 1] 区间，越大越相关。
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = 60,
+                           weights: Optional[Sequence[float]] = None) -> List[Tuple[int, float]]:
+    """
+    倒数排名融合（Reciprocal Rank Fusion）
+
+    每个结果的得分为 sum(weight / (k + rank))，rank 从 1 开始。
+    得分除以理论最大值（在所有列表中都排第一），归一化到 [0, 1]。
+
+    Args:
+        rankings: 各检索方式按相关度排序的ID列表
+        k: 平滑常数，越大排名靠后的结果影响越大
+        weights: 各列表的权重，默认相同
+
+    Returns:
+        按融合得分降序排列的 (ID, 得分) 列表
+    """
+    weights = list(weights) if weights is not None else [1.0] * len(rankings)
+    scores: Dict[int, float] = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + weight / (k + rank)
+    best = sum(weights) / (k + 1)
+    if best <= 0:
+        return []
+    return sorted(((item, score / best) for item, score in scores.items()),
+                  key=lambda pair: pair[1], reverse=True)
+
+
+def _normalize(hits: Sequence[Tuple[int, float]]) -> Dict[int, float]:
+    """把 (ID, 越小越相关的分数) 线性归一化为 [0, 1] 的相关度"""
+    if not hits:
+        return {}
+    values = [value for _, value in hits]
+    low, high = min(values), max(values)
+    if high == low:
+        return {item: 1.0 for item, _ in hits}
+    return {item: (high - value) / (high - low) for item, value in hits}
+
+
+def weighted_fusion(vector_hits: Sequence[Tuple[int, float]], lexical_hits: Sequence[Tuple[int, float]],
+                    vector_weight: float = 0.5) -> List[Tuple[int, float]]:
+    """
+    加权分数融合
+
+    两路结果各自按最小-最大归一化后加权求和，只出现在一路中的结果另一路记 0 分。
+
+    Args:
+        vector_hits: (ID, 距离) 列表
+        lexical_hits: (ID, bm25 分数) 列表
+        vector_weight: 向量相关度的权重，关键词相关度权重为 1 - vector_weight
+
+    Returns:
+        按融合得分降序排列的 (ID, 得分) 列表
+    """
+    vector_scores = _normalize(vector_hits)
+    lexical_scores = _normalize(lexical_hits)
+    scores = {
+        item: vector_weight * vector_scores.get(item, 0.0)
+        + (1.0 - vector_weight) * lexical_scores.get(item, 0.0)
+        for item in set(vector_scores) | set(lexical_scores)
+    }
+    return sorted(scores.items(), key=lambda pair: pair[1], reverse=True)
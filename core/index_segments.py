@@ -0,0 +1,560 @@
+"""
+分段存储的FAISS索引
+
+磁盘布局：
+    faiss.index                   基础段（完整索引，只在合并时整体重写）
+    faiss.index.segments/*.seg    增量段（每次保存追加一个，只包含上次保存之后的变化）
+
+内存中由三部分组成：只读的基础段、容纳新增向量的暴力增量索引、
+以及记录基础段中已删除向量ID的墓碑集合。搜索同时查询基础段和增量索引并合并结果。
+增量段写入时先写临时文件、fsync 后再改名，并带有 SHA-256 校验；
+增量过多时在后台把所有段合并为新的基础段。
+"""
+
+import hashlib
+import os
+import re
+import struct
+from threading import Lock, RLock, Thread
+from typing import Callable, Iterable, List, Optional, Set, Tuple
+import faiss
+import numpy as np
+from utils.logger import Logger
+
+
+def reconstruct_all(index) -> np.ndarray:
+    """按存储顺序取出索引中的全部向量"""
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    except RuntimeError:
+        # IVF索引需要先建立直接映射才能取回向量
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_n(0, index.ntotal)
+
+
+def reconstruct_ids(index, ids: np.ndarray) -> np.ndarray:
+    """按ID批量取回向量（IndexIDMap2）"""
+    if len(ids) == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    try:
+        return index.reconstruct_batch(ids)
+    except RuntimeError:
+        # IVF索引需要先建立直接映射才能取回向量
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_batch(ids)
+
+
+def search_parameters(index, selector) -> faiss.SearchParameters:
+    """
+    构造带 IDSelector 的搜索参数
+
+    传入参数后索引不再使用自身的 nprobe / efSearch，需要从索引中复制过来。
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    try:
+        ivf = faiss.extract_index_ivf(inner)
+        params = faiss.SearchParametersIVF(sel=selector)
+        params.nprobe = ivf.nprobe
+        return params
+    except RuntimeError:
+        pass  # 非IVF索引
+    if hasattr(inner, 'hnsw'):
+        params = faiss.SearchParametersHNSW(sel=selector)
+        params.efSearch = inner.hnsw.efSearch
+        return params
+    return faiss.SearchParameters(sel=selector)
+
+
+def merge_results(parts: List[Tuple[np.ndarray, np.ndarray]], nq: int, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    按距离合并多个索引的搜索结果
+
+    Args:
+        parts: 各索引返回的 (距离, ID) 数组
+        nq: 查询向量数
+        k: 每个查询保留的结果数
+
+    Returns:
+        与 faiss Index.search 相同的 (距离, ID) 数组，不足 k 个时以 -1 填充
+    """
+    if not parts:
+        return (np.full((nq, k), np.inf, dtype=np.float32),
+                np.full((nq, k), -1, dtype=np.int64))
+    distances = np.hstack([part[0] for part in parts])
+    labels = np.hstack([part[1] for part in parts])
+    distances[labels < 0] = np.inf
+    order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+    distances = np.take_along_axis(distances, order, axis=1)
+    labels = np.take_along_axis(labels, order, axis=1)
+    if labels.shape[1] < k:
+        pad = k - labels.shape[1]
+        distances = np.pad(distances, ((0, 0), (0, pad)), constant_values=np.inf)
+        labels = np.pad(labels, ((0, 0), (0, pad)), constant_values=-1)
+    return distances, labels
+
+
+def fsync_directory(path: str):
+    """fsync 目录，确保改名操作落盘（Windows 不支持，忽略）"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_atomic(path: str, write: Callable[[str], None]):
+    """写临时文件并 fsync 后改名为目标文件，中途崩溃不会破坏原文件"""
+    temp_path = path + ".tmp"
+    write(temp_path)
+    with open(temp_path, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(temp_path, path)
+    fsync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+class SegmentCorruptError(Exception):
+    """增量段文件损坏或不完整"""
+    pass
+
+
+class SegmentedIndex:
+    """
+    基础段 + 增量段的向量索引
+
+    特点：
+    1. 保存只写入变化部分，耗时与变化量成正比，与索引总大小无关
+    2. 基础段在内存中只读，可以内存映射打开
+    3. 增量段带校验和，写入过程崩溃不影响已有数据
+    4. 增量超过阈值后在后台线程中合并，合并期间可以继续读写
+
+    对外提供与 IndexIDMap2 相近的接口：ntotal、add_with_ids、remove_ids、search、reconstruct。
+    新增同一ID的向量会覆盖旧向量。
+    """
+
+    MAGIC = b"DSKSEG01"
+    _HEADER = struct.Struct("<8sIQQ")  # 魔数、维度、删除数、新增数
+    _SEGMENT_NAME = re.compile(r"^(\d{8})\.seg$")
+
+    def __init__(self, index_file: str, dimension: int, base=None,
+                 build_base: Optional[Callable[[np.ndarray, np.ndarray], object]] = None,
+                 read_base: Optional[Callable[[str], object]] = None,
+                 reopen_base: bool = False,
+                 compact_ratio: float = 0.2, compact_min_vectors: int = 10000,
+                 max_segments: int = 64, exact_filter_limit: int = 4096):
+        """
+        Args:
+            index_file: 基础段文件路径，增量段保存在 index_file + ".segments" 目录
+            dimension: 向量维度
+            base: 已加载的基础段（IndexIDMap2），为空时使用空的暴力索引
+            build_base: 合并时由 (向量, ID) 构建新基础段的函数，默认构建暴力索引
+            read_base: 从文件读取基础段的函数，reopen_base 为真时用于合并后重新打开
+            reopen_base: 合并后是否从文件重新打开基础段（用于内存映射）
+            compact_ratio: 增量向量数或墓碑数超过基础段的该比例时触发合并
+            compact_min_vectors: 增量向量数低于该值时不因比例触发合并
+            max_segments: 增量段文件数超过该值时触发合并
+            exact_filter_limit: 过滤搜索的候选向量不超过该值时取回向量直接计算距离
+        """
+        self.logger = Logger.get_logger(__name__)
+        self.index_file = index_file
+        self.segment_dir = index_file + ".segments"
+        self.dimension = dimension
+        self.build_base = build_base or self._build_flat
+        self.read_base = read_base or faiss.read_index
+        self.reopen_base = reopen_base
+        self.compact_ratio = compact_ratio
+        self.compact_min_vectors = compact_min_vectors
+        self.max_segments = max_segments
+        self.exact_filter_limit = exact_filter_limit
+
+        # lock 保护内存中的结构；compact_lock 保证同时只有一个合并任务
+        self.lock = RLock()
+        self.compact_lock = Lock()
+        self._set_base(base if base is not None else self._build_flat(
+            np.zeros((0, dimension), dtype=np.float32), np.zeros(0, dtype=np.int64)))
+        self._reset_delta()
+        self._pending_added: Set[int] = set()
+        self._pending_removed: Set[int] = set()
+        self._next_seq = 1
+
+    def _build_flat(self, vectors: np.ndarray, ids: np.ndarray):
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(self.dimension))
+        if len(ids):
+            index.add_with_ids(vectors, ids)
+        return index
+
+    def _set_base(self, base):
+        self.base = base
+        self._base_ids = np.sort(faiss.vector_to_array(base.id_map))
+        self.tombstones: Set[int] = set()
+
+    def _reset_delta(self):
+        self.delta = faiss.IndexIDMap2(faiss.IndexFlatL2(self.dimension))
+        self._delta_ids: Set[int] = set()
+
+    def _contains_base(self, ids: np.ndarray) -> np.ndarray:
+        """逐个判断ID是否在基础段中"""
+        if len(self._base_ids) == 0:
+            return np.zeros(len(ids), dtype=bool)
+        positions = np.minimum(np.searchsorted(self._base_ids, ids), len(self._base_ids) - 1)
+        return self._base_ids[positions] == ids
+
+    @property
+    def ntotal(self) -> int:
+        """有效向量总数"""
+        with self.lock:
+            return self.base.ntotal - len(self.tombstones) + self.delta.ntotal
+
+    @property
+    def is_dirty(self) -> bool:
+        """是否有尚未保存的变化"""
+        with self.lock:
+            return bool(self._pending_added or self._pending_removed)
+
+    def ids(self) -> np.ndarray:
+        """所有有效向量的ID"""
+        with self.lock:
+            base_ids = self._base_ids
+            if self.tombstones:
+                base_ids = base_ids[~np.isin(base_ids, np.fromiter(self.tombstones, dtype=np.int64))]
+            return np.concatenate([base_ids, faiss.vector_to_array(self.delta.id_map)])
+
+    def segment_count(self) -> int:
+        """磁盘上的增量段数量"""
+        return len(self._list_segments())
+
+    # ---- 读写 ----
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        """添加向量，已存在的ID会被覆盖"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension)
+        ids = np.asarray(ids, dtype=np.int64)
+        with self.lock:
+            self._apply_add(vectors, ids)
+            self._pending_added.update(ids.tolist())
+
+    def remove_ids(self, ids: Iterable[int]) -> int:
+        """删除向量，返回实际删除的数量"""
+        ids = [int(i) for i in ids]
+        with self.lock:
+            removed = self._apply_remove(ids)
+            self._pending_removed.update(ids)
+            self._pending_added.difference_update(ids)
+            return removed
+
+    def _apply_add(self, vectors: np.ndarray, ids: np.ndarray):
+        if len(ids) == 0:
+            return
+        self._apply_remove(ids.tolist())
+        self.delta.add_with_ids(vectors, ids)
+        self._delta_ids.update(ids.tolist())
+
+    def _apply_remove(self, ids: List[int]) -> int:
+        in_delta = [i for i in ids if i in self._delta_ids]
+        if in_delta:
+            self.delta.remove_ids(np.array(in_delta, dtype=np.int64))
+            self._delta_ids.difference_update(in_delta)
+        candidates = np.array([i for i in ids if i not in self.tombstones], dtype=np.int64)
+        in_base = candidates[self._contains_base(candidates)]
+        self.tombstones.update(in_base.tolist())
+        return len(in_delta) + len(in_base)
+
+    def _locate(self, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """判断每个ID是否为基础段中的有效向量、是否在增量索引中（调用方需持有 lock）"""
+        in_delta = np.isin(ids, faiss.vector_to_array(self.delta.id_map))
+        in_base = self._contains_base(ids) & ~in_delta
+        if self.tombstones and in_base.any():
+            in_base &= ~np.isin(ids, np.fromiter(self.tombstones, dtype=np.int64))
+        return in_base, in_delta
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        """逐个判断ID是否为有效向量"""
+        ids = np.asarray(ids, dtype=np.int64)
+        with self.lock:
+            in_base, in_delta = self._locate(ids)
+        return in_base | in_delta
+
+    def reconstruct(self, faiss_id: int) -> np.ndarray:
+        """按ID取回向量"""
+        with self.lock:
+            if faiss_id in self._delta_ids:
+                return self.delta.reconstruct(faiss_id)
+            if faiss_id in self.tombstones or not self._contains_base(np.array([faiss_id]))[0]:
+                raise KeyError(faiss_id)
+            return reconstruct_ids(self.base, np.array([faiss_id], dtype=np.int64))[0]
+
+    def search(self, queries: np.ndarray, k: int,
+               candidate_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        在基础段和增量索引中分别搜索并按距离合并
+
+        Args:
+            queries: 查询向量
+            k: 每个查询返回的结果数
+            candidate_ids: 只在这些ID中搜索（元数据过滤的结果），为空时不过滤
+
+        Returns:
+            与 faiss Index.search 相同的 (距离, ID) 数组，不足 k 个时以 -1 填充
+        """
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dimension)
+        with self.lock:
+            if candidate_ids is not None:
+                return self._search_candidates(queries, k, np.asarray(candidate_ids, dtype=np.int64))
+            parts = []
+            if self.base.ntotal > len(self.tombstones):
+                if self.tombstones:
+                    selector = faiss.IDSelectorNot(faiss.IDSelectorBatch(
+                        np.fromiter(self.tombstones, dtype=np.int64)))
+                    parts.append(self.base.search(queries, k, params=search_parameters(self.base, selector)))
+                else:
+                    parts.append(self.base.search(queries, k))
+            if self.delta.ntotal > 0:
+                parts.append(self.delta.search(queries, min(k, self.delta.ntotal)))
+        return merge_results(parts, len(queries), k)
+
+    def _search_candidates(self, queries: np.ndarray, k: int,
+                           candidate_ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        只在候选ID中搜索（调用方需持有 lock）
+
+        候选较少时取回向量精确计算距离，不受近似索引召回率的影响；
+        候选较多时把候选集合作为 IDSelector 传给基础段和增量索引，由 faiss 在搜索中跳过其他向量。
+        """
+        in_base, in_delta = self._locate(candidate_ids)
+        base_hits = candidate_ids[in_base]
+        delta_hits = candidate_ids[in_delta]
+        if len(base_hits) + len(delta_hits) == 0:
+            return merge_results([], len(queries), k)
+
+        if len(base_hits) + len(delta_hits) <= self.exact_filter_limit:
+            ids = np.concatenate([base_hits, delta_hits])
+            vectors = np.vstack([reconstruct_ids(self.base, base_hits),
+                                 reconstruct_ids(self.delta, delta_hits)])
+            distances, positions = faiss.knn(queries, vectors, min(k, len(ids)))
+            return merge_results([(distances, ids[positions])], len(queries), k)
+
+        parts = []
+        if len(base_hits):
+            selector = faiss.IDSelectorBatch(base_hits)
+            parts.append(self.base.search(queries, k, params=search_parameters(self.base, selector)))
+        if len(delta_hits):
+            selector = faiss.IDSelectorBatch(delta_hits)
+            parts.append(self.delta.search(queries, min(k, len(delta_hits)),
+                                           params=faiss.SearchParameters(sel=selector)))
+        return merge_results(parts, len(queries), k)
+
+    # ---- 增量段 ----
+
+    def _segment_path(self, seq: int) -> str:
+        return os.path.join(self.segment_dir, f"{seq:08d}.seg")
+
+    def _list_segments(self) -> List[Tuple[int, str]]:
+        if not os.path.isdir(self.segment_dir):
+            return []
+        segments = []
+        for name in os.listdir(self.segment_dir):
+            match = self._SEGMENT_NAME.match(name)
+            if match:
+                segments.append((int(match.group(1)), os.path.join(self.segment_dir, name)))
+        return sorted(segments)
+
+    def save(self) -> bool:
+        """
+        把上次保存之后的变化写成一个增量段
+
+        Returns:
+            bool: 是否写入了新的增量段
+        """
+        with self.lock:
+            if not self._pending_added and not self._pending_removed:
+                return False
+            removed = np.array(sorted(self._pending_removed), dtype=np.int64)
+            added = np.array(sorted(self._pending_added), dtype=np.int64)
+            vectors = (self.delta.reconstruct_batch(added) if len(added)
+                       else np.zeros((0, self.dimension), dtype=np.float32))
+            seq = self._next_seq
+
+            payload = removed.tobytes() + added.tobytes() + np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+            header = self._HEADER.pack(self.MAGIC, self.dimension, len(removed), len(added))
+
+            def write(path):
+                with open(path, 'wb') as f:
+                    f.write(header)
+                    f.write(payload)
+                    f.write(hashlib.sha256(header + payload).digest())
+
+            os.makedirs(self.segment_dir, exist_ok=True)
+            write_atomic(self._segment_path(seq), write)
+            self._next_seq = seq + 1
+            self._pending_added.clear()
+            self._pending_removed.clear()
+            self.logger.info("已写入增量段 %d：新增 %d 个向量，删除 %d 个向量", seq, len(added), len(removed))
+            return True
+
+    def _read_segment(self, path: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """读取并校验增量段，返回 (删除的ID, 新增的ID, 新增的向量)"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < self._HEADER.size + 32:
+            raise SegmentCorruptError(f"增量段不完整: {path}")
+        body, digest = data[:-32], data[-32:]
+        if hashlib.sha256(body).digest() != digest:
+            raise SegmentCorruptError(f"增量段校验失败: {path}")
+        magic, dimension, n_removed, n_added = self._HEADER.unpack_from(body)
+        if magic != self.MAGIC or dimension != self.dimension:
+            raise SegmentCorruptError(f"增量段格式不匹配: {path}")
+        offset = self._HEADER.size
+        removed = np.frombuffer(body, dtype=np.int64, count=n_removed, offset=offset)
+        offset += removed.nbytes
+        added = np.frombuffer(body, dtype=np.int64, count=n_added, offset=offset)
+        offset += added.nbytes
+        vectors = np.frombuffer(body, dtype=np.float32, count=n_added * dimension,
+                                offset=offset).reshape(n_added, dimension)
+        return removed, added, vectors
+
+    def _replay(self, segments: List[Tuple[int, str]]):
+        """按顺序把增量段应用到内存结构（调用方需持有 lock）"""
+        for seq, path in segments:
+            try:
+                removed, added, vectors = self._read_segment(path)
+            except (OSError, SegmentCorruptError) as e:
+                # 增量段改名前已 fsync，损坏通常意味着磁盘故障；保留文件以便排查
+                self.logger.error("跳过无法读取的增量段 %d: %s", seq, str(e))
+                os.replace(path, path + ".corrupt")
+                continue
+            # 同一段内先删除后新增，新增会覆盖基础段中的同ID向量
+            self._apply_remove(removed.tolist())
+            self._apply_add(vectors, added)
+            self._next_seq = max(self._next_seq, seq + 1)
+
+    def load_segments(self):
+        """加载磁盘上的所有增量段"""
+        with self.lock:
+            segments = self._list_segments()
+            self._replay(segments)
+            if segments:
+                self.logger.info("已加载 %d 个增量段，增量向量 %d 个，已删除 %d 个基础段向量",
+                                 len(segments), self.delta.ntotal, len(self.tombstones))
+
+    # ---- 合并 ----
+
+    def needs_compaction(self) -> bool:
+        """增量或墓碑是否已经多到值得合并"""
+        with self.lock:
+            threshold = max(self.compact_min_vectors, self.base.ntotal * self.compact_ratio)
+            return (self.delta.ntotal >= threshold
+                    or len(self.tombstones) >= max(1, self.base.ntotal * self.compact_ratio)
+                    or self.segment_count() > self.max_segments)
+
+    def compact_async(self) -> Optional[Thread]:
+        """在后台线程中合并，已有合并任务在运行时直接返回"""
+        if self.compact_lock.locked():
+            return None
+        thread = Thread(target=self.compact, name="faiss-segment-compaction", daemon=True)
+        thread.start()
+        return thread
+
+    def live_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """取出全部有效向量及其ID"""
+        with self.lock:
+            base, tombstones = self.base, set(self.tombstones)
+            delta_ids = faiss.vector_to_array(self.delta.id_map)
+            delta_vectors = reconstruct_all(self.delta.index)
+        # 基础段只读，读取大量向量时不需要持有锁
+        base_ids = faiss.vector_to_array(base.id_map)
+        base_vectors = reconstruct_all(base.index)
+        if tombstones:
+            keep = ~np.isin(base_ids, np.fromiter(tombstones, dtype=np.int64))
+            base_ids, base_vectors = base_ids[keep], base_vectors[keep]
+        return (np.vstack([base_vectors, delta_vectors]).astype(np.float32),
+                np.concatenate([base_ids, delta_ids]).astype(np.int64))
+
+    def compact(self) -> bool:
+        """
+        把基础段和所有增量段合并为新的基础段
+
+        耗时的构建和写盘不持有 lock，期间的读写照常进行；
+        换入新基础段时，重放合并开始之后写入的增量段和未保存的变化。
+        """
+        if not self.compact_lock.acquire(blocking=False):
+            return False
+        try:
+            with self.lock:
+                self.save()
+                merged_seq = self._next_seq - 1
+            # 快照之后的变化会在换入时重放，重复应用同一变化的结果不变
+            vectors, ids = self.live_vectors()
+
+            new_base = self.build_base(vectors, ids)
+            write_atomic(self.index_file, lambda path: faiss.write_index(new_base, path))
+            if self.reopen_base:
+                new_base = self.read_base(self.index_file)
+
+            with self.lock:
+                old_delta = self.delta
+                pending_added = sorted(self._pending_added)
+                pending_removed = sorted(self._pending_removed)
+
+                self._set_base(new_base)
+                self._reset_delta()
+                segments = self._list_segments()
+                self._replay([(seq, path) for seq, path in segments if seq > merged_seq])
+                self._apply_remove(pending_removed)
+                if pending_added:
+                    self._apply_add(old_delta.reconstruct_batch(np.array(pending_added, dtype=np.int64)),
+                                    np.array(pending_added, dtype=np.int64))
+
+                # 已合并的增量段不再需要（残留也无妨，重放是幂等的）
+                for seq, path in segments:
+                    if seq <= merged_seq:
+                        os.remove(path)
+                self.logger.info("增量段合并完成，基础段包含 %d 个向量", self.base.ntotal)
+            return True
+        except Exception as e:
+            self.logger.error("增量段合并失败: %s", str(e))
+            return False
+        finally:
+            self.compact_lock.release()
+
+    def write_full(self, path: str):
+        """把全部有效向量写成单个索引文件（用于导出）"""
+        with self.lock:
+            if not self.tombstones and self.delta.ntotal == 0:
+                faiss.write_index(self.base, path)
+                return
+        vectors, ids = self.live_vectors()
+        faiss.write_index(self.build_base(vectors, ids), path)
+
+    def reset(self, base=None):
+        """
+        用新的基础段替换全部内容并删除所有增量段
+
+        base 为空时清空索引并删除基础段文件，否则立即写入基础段文件。
+        """
+        with self.compact_lock, self.lock:
+            for _, path in self._list_segments():
+                os.remove(path)
+            if base is None:
+                if os.path.exists(self.index_file):
+                    os.remove(self.index_file)
+                base = self._build_flat(np.zeros((0, self.dimension), dtype=np.float32),
+                                        np.zeros(0, dtype=np.int64))
+            else:
+                write_atomic(self.index_file, lambda path: faiss.write_index(base, path))
+            self._set_base(base)
+            self._reset_delta()
+            self._pending_added.clear()
+            self._pending_removed.clear()
+            self._next_seq = 1
+
+    def destroy(self):
+        """删除基础段和全部增量段文件"""
+        self.reset()
+        if os.path.isdir(self.segment_dir) and not os.listdir(self.segment_dir):
+            os.rmdir(self.segment_dir)
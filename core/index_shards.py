@@ -0,0 +1,254 @@
+"""
+按目录分片的向量索引
+
+directories 表中的每个目录对应一个独立的 SegmentedIndex 分片，文件保存在 shards/ 目录下；
+不属于任何目录的文件（以及旧版本的全局索引）放在默认分片 faiss.index 中。
+搜索只并行查询默认分片和已启用目录的分片再合并 top-k，
+删除目录时直接删除其分片文件。
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import RLock
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import faiss
+import numpy as np
+from utils.logger import Logger
+from .index_segments import SegmentedIndex, merge_results
+
+
+class ShardedIndex:
+    """
+    目录分片索引
+
+    向量ID在所有分片中全局唯一，删除时无需知道向量所在的分片。
+    对外提供与 SegmentedIndex 相近的接口，新增向量时按文件路径路由到分片。
+    """
+
+    DEFAULT = ""
+
+    def __init__(self, create_shard: Callable[[str], SegmentedIndex], max_workers: Optional[int] = None):
+        """
+        Args:
+            create_shard: 由分片键（目录路径，默认分片为空串）创建并加载分片的函数
+            max_workers: 并行搜索的线程数
+        """
+        self.logger = Logger.get_logger(__name__)
+        self.create_shard = create_shard
+        self.lock = RLock()
+        self.shards: Dict[str, SegmentedIndex] = {self.DEFAULT: create_shard(self.DEFAULT)}
+        self.enabled: Dict[str, bool] = {self.DEFAULT: True}
+        # faiss 搜索期间释放 GIL，多个分片可以真正并行
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or min(8, os.cpu_count() or 1),
+                                           thread_name_prefix="shard-search")
+
+    @staticmethod
+    def shard_file(shard_dir: str, key: str) -> str:
+        """目录分片的索引文件路径"""
+        return os.path.join(shard_dir, hashlib.sha1(key.encode('utf-8')).hexdigest()[:16] + ".index")
+
+    # ---- 分片管理 ----
+
+    def add_shard(self, key: str, enabled: bool = True) -> SegmentedIndex:
+        """添加目录分片，已存在时只更新启用状态"""
+        with self.lock:
+            if key not in self.shards:
+                self.shards[key] = self.create_shard(key)
+            self.enabled[key] = enabled
+            return self.shards[key]
+
+    def set_enabled(self, key: str, enabled: bool):
+        """启用或停用目录分片，停用的分片不参与搜索"""
+        with self.lock:
+            if key in self.shards:
+                self.enabled[key] = enabled
+
+    def drop_shard(self, key: str):
+        """删除目录分片及其文件"""
+        with self.lock:
+            shard = self.shards.pop(key, None)
+            self.enabled.pop(key, None)
+        if shard is not None:
+            shard.destroy()
+            self.logger.info("已删除目录分片: %s", key)
+
+    def route(self, file_path: str) -> str:
+        """文件所属的分片：包含该文件的最深目录，不属于任何目录时为默认分片"""
+        best = self.DEFAULT
+        for key in self.shards:
+            if key and file_path.startswith(os.path.join(key, '')) and len(key) > len(best):
+                best = key
+        return best
+
+    def searchable_shards(self) -> List[SegmentedIndex]:
+        """参与搜索的分片：默认分片和已启用的目录分片"""
+        with self.lock:
+            return [shard for key, shard in self.shards.items() if self.enabled.get(key, True)]
+
+    def all_shards(self) -> List[SegmentedIndex]:
+        with self.lock:
+            return list(self.shards.values())
+
+    # ---- 读写 ----
+
+    @property
+    def ntotal(self) -> int:
+        """所有分片的有效向量总数"""
+        return sum(shard.ntotal for shard in self.all_shards())
+
+    @property
+    def default(self) -> SegmentedIndex:
+        return self.shards[self.DEFAULT]
+
+    def ids(self) -> np.ndarray:
+        """所有有效向量的ID"""
+        return np.concatenate([shard.ids() for shard in self.all_shards()])
+
+    def searchable_mask(self, ids: np.ndarray) -> np.ndarray:
+        """逐个判断ID是否在参与搜索的分片中（用于过滤不经过 faiss 的检索结果）"""
+        ids = np.asarray(ids, dtype=np.int64)
+        mask = np.zeros(len(ids), dtype=bool)
+        for shard in self.searchable_shards():
+            mask |= shard.contains(ids)
+        return mask
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray, file_paths: List[str]):
+        """添加向量，按 file_paths 中对应的文件路径路由到分片"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        with self.lock:
+            groups: Dict[str, List[int]] = {}
+            for position, file_path in enumerate(file_paths):
+                groups.setdefault(self.route(file_path), []).append(position)
+            for key, positions in groups.items():
+                self.shards[key].add_with_ids(vectors[positions], ids[positions])
+
+    def remove_ids(self, ids: Iterable[int]) -> int:
+        """从所有分片中删除向量，返回实际删除的数量"""
+        ids = [int(i) for i in ids]
+        if not ids:
+            return 0
+        return sum(shard.remove_ids(ids) for shard in self.all_shards())
+
+    def relocate(self, ids: Iterable[int], file_path: str) -> int:
+        """
+        文件移动或重命名后，把其向量移到新路径所属的分片（向量不变，无需重新编码）
+
+        Returns:
+            int: 跨分片移动的向量数，已在目标分片中时为 0
+        """
+        ids = np.asarray([int(i) for i in ids], dtype=np.int64)
+        if len(ids) == 0:
+            return 0
+        with self.lock:
+            target = self.shards[self.route(file_path)]
+            outside = ids[~target.contains(ids)]
+            if len(outside) == 0:
+                return 0
+            vectors, found = [], []
+            for faiss_id in outside:
+                try:
+                    vectors.append(self.reconstruct(int(faiss_id)))
+                    found.append(int(faiss_id))
+                except KeyError:
+                    continue
+            if not found:
+                return 0
+            self.remove_ids(found)
+            target.add_with_ids(np.vstack(vectors), np.array(found, dtype=np.int64))
+            return len(found)
+
+    def reconstruct(self, faiss_id: int) -> np.ndarray:
+        """按ID取回向量"""
+        for shard in self.all_shards():
+            try:
+                return shard.reconstruct(faiss_id)
+            except KeyError:
+                continue
+        raise KeyError(faiss_id)
+
+    def search(self, queries: np.ndarray, k: int,
+               candidate_ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        并行搜索默认分片和已启用的目录分片，合并 top-k
+
+        Args:
+            candidate_ids: 只在这些ID中搜索，为空时不过滤
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        queries = queries.reshape(-1, queries.shape[-1])
+        shards = [shard for shard in self.searchable_shards() if shard.ntotal > 0]
+        if len(shards) == 1:
+            return shards[0].search(queries, k, candidate_ids)
+        parts = list(self.executor.map(lambda shard: shard.search(queries, k, candidate_ids), shards))
+        return merge_results(parts, len(queries), k)
+
+    # ---- 持久化 ----
+
+    def save(self) -> bool:
+        """保存所有分片的变化，返回是否有分片写入了增量段"""
+        saved = False
+        for shard in self.all_shards():
+            saved = shard.save() or saved
+        return saved
+
+    def compact_if_needed(self):
+        """在后台合并增量过多的分片"""
+        for shard in self.all_shards():
+            if shard.needs_compaction():
+                shard.compact_async()
+
+    def rebalance(self, paths_by_id: Callable[[np.ndarray], Dict[int, str]]) -> int:
+        """
+        把默认分片中属于某个目录的向量移动到该目录的分片
+        （升级旧版本全局索引、或新添加的目录覆盖了已索引的文件时）
+
+        Args:
+            paths_by_id: 查询向量ID对应文件路径的函数
+
+        Returns:
+            int: 移动的向量数
+        """
+        with self.lock:
+            if len(self.shards) == 1 or self.default.ntotal == 0:
+                return 0
+            vectors, ids = self.default.live_vectors()
+            paths = paths_by_id(ids)
+            targets = np.array([self.route(paths.get(int(i), "")) for i in ids], dtype=object)
+            moved = targets != self.DEFAULT
+            if not moved.any():
+                return 0
+            for key in set(targets[moved]):
+                mask = targets == key
+                self.shards[key].add_with_ids(vectors[mask], ids[mask])
+            self.default.remove_ids(ids[moved])
+            self.logger.info("已把 %d 个向量从默认分片移动到目录分片", int(moved.sum()))
+            return int(moved.sum())
+
+    def live_vectors(self) -> Tuple[np.ndarray, np.ndarray]:
+        """取出所有分片的有效向量及其ID"""
+        parts = [shard.live_vectors() for shard in self.all_shards()]
+        return (np.vstack([part[0] for part in parts]),
+                np.concatenate([part[1] for part in parts]))
+
+    def write_full(self, path: str):
+        """把所有分片合并写成单个索引文件（用于导出）"""
+        shards = [shard for shard in self.all_shards() if shard.ntotal > 0]
+        if len(shards) <= 1:
+            (shards[0] if shards else self.default).write_full(path)
+            return
+        vectors, ids = self.live_vectors()
+        faiss.write_index(self.default.build_base(vectors, ids), path)
+
+    def reset(self, base=None):
+        """
+        清空所有目录分片，默认分片替换为 base（为空时清空）
+
+        目录分片本身保留，之后新增的向量照常路由。
+        """
+        for key, shard in list(self.shards.items()):
+            if key == self.DEFAULT:
+                shard.reset(base)
+            else:
+                shard.reset()
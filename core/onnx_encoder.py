@@ -0,0 +1,173 @@
+"""
+ONNX Runtime 推理后端
+
+把 SentenceTransformer 模型的 Transformer 部分导出为 ONNX，可选动态 int8 量化，
+在纯CPU的索引节点上替代 PyTorch 推理。导出结果缓存在 models/ 目录下，
+之后加载时只需要 onnxruntime 和 transformers 的分词器，不再导入 torch。
+"""
+
+import inspect
+import json
+import os
+from typing import List
+import numpy as np
+from utils.logger import Logger
+
+
+class OnnxEncoder:
+    """
+    与 SentenceTransformer.encode 接口兼容的 ONNX 编码器
+
+    仅支持 Transformer + Pooling（均值或CLS）[+ Normalize] 结构的模型，
+    paraphrase-multilingual-MiniLM-L12-v2 等常用模型均属此类。
+    """
+
+    META_FILE = "docseeker_onnx.json"
+
+    def __init__(self, model_name: str, quantize: bool = False,
+                 cache_dir: str = "models", num_threads: int = 0):
+        """
+        Args:
+            model_name: SentenceTransformer 模型名称
+            quantize: 是否使用动态 int8 量化模型
+            cache_dir: 导出模型的缓存目录
+            num_threads: 推理线程数，0 表示由 onnxruntime 自动决定
+        """
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.logger = Logger.get_logger(__name__)
+        export_dir = os.path.join(cache_dir, model_name.replace('/', '_'))
+        fp32_path = os.path.join(export_dir, "model.onnx")
+        if not os.path.exists(fp32_path):
+            self._export(model_name, export_dir)
+
+        model_path = fp32_path
+        if quantize:
+            model_path = os.path.join(export_dir, "model_int8.onnx")
+            if not os.path.exists(model_path):
+                self._quantize(fp32_path, model_path)
+
+        with open(os.path.join(export_dir, self.META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.max_seq_length = meta["max_seq_length"]
+        self.pooling = meta["pooling"]
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [item.name for item in self.session.get_inputs()]
+        self.logger.info("已加载ONNX模型: %s", model_path)
+
+    def _export(self, model_name: str, export_dir: str):
+        """使用 torch 把模型导出为 ONNX（只在首次使用时执行）"""
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        self.logger.info("导出ONNX模型: %s -> %s", model_name, export_dir)
+        st_model = SentenceTransformer(model_name, device='cpu')
+        modules = list(st_model.children())
+        # 末尾的 Normalize 模块等价于 normalize_embeddings=True，可以忽略
+        module_types = [type(module).__name__ for module in modules]
+        if module_types[-1] == 'Normalize':
+            module_types.pop()
+        if module_types != ['Transformer', 'Pooling']:
+            raise ValueError("ONNX后端仅支持 Transformer + Pooling 结构的模型")
+        # 兼容不同版本 sentence-transformers 的池化配置格式
+        pooling_config = modules[1].get_config_dict()
+        pooling_mode = pooling_config.get("pooling_mode")
+        if pooling_config.get("pooling_mode_mean_tokens"):
+            pooling_mode = "mean"
+        elif pooling_config.get("pooling_mode_cls_token"):
+            pooling_mode = "cls"
+        if pooling_mode not in ("mean", "cls"):
+            raise ValueError("ONNX后端仅支持均值或CLS池化")
+
+        auto_model = modules[0].auto_model.eval()
+        tokenizer = st_model.tokenizer
+
+        class HiddenStateModule(torch.nn.Module):
+            """只输出最后一层隐状态，池化在 numpy 中完成"""
+
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask, token_type_ids=None):
+                return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                                  token_type_ids=token_type_ids).last_hidden_state
+
+        sample = tokenizer(["示例文本 sample text"], padding=True, return_tensors='pt')
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids")
+                       if name in sample]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        # 新版 torch 默认使用 dynamo 导出器，这里固定使用 TorchScript 导出器
+        export_options = {}
+        if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+            export_options['dynamo'] = False
+        
+        os.makedirs(export_dir, exist_ok=True)
+        with torch.no_grad():
+            torch.onnx.export(
+                HiddenStateModule(auto_model),
+                tuple(sample[name] for name in input_names),
+                os.path.join(export_dir, "model.onnx"),
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+                **export_options
+            )
+        tokenizer.save_pretrained(export_dir)
+        with open(os.path.join(export_dir, self.META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({
+                "model_name": model_name,
+                "max_seq_length": st_model.max_seq_length,
+                "pooling": pooling_mode
+            }, f, indent=4, ensure_ascii=False)
+
+    def _quantize(self, fp32_path: str, int8_path: str):
+        """动态 int8 量化（权重量化为int8，激活在运行时量化）"""
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        self.logger.info("量化ONNX模型: %s", int8_path)
+        quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    def encode(self, texts: List[str], batch_size: int = 32,
+               show_progress_bar: bool = False,
+               normalize_embeddings: bool = True) -> np.ndarray:
+        """将文本转换为向量"""
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors='np'
+            )
+            feed = {}
+            for name in self.input_names:
+                if name in encoded:
+                    feed[name] = encoded[name].astype(np.int64)
+                else:
+                    feed[name] = np.zeros_like(encoded["input_ids"], dtype=np.int64)
+            hidden = self.session.run(None, feed)[0]
+
+            if self.pooling == "cls":
+                embeddings = hidden[:, 0]
+            else:
+                mask = encoded["attention_mask"][..., None].astype(np.float32)
+                embeddings = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            outputs.append(embeddings)
+
+        embeddings = np.vstack(outputs).astype(np.float32)
+        if normalize_embeddings:
+            embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+        return embeddings
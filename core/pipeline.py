@@ -0,0 +1,524 @@
+"""
+多阶段索引流水线模块
+
+扫描 → 解析 → 分块 → 编码 → 写入，各阶段拥有独立的工作线程池，
+阶段之间通过有界队列连接以形成背压，使磁盘I/O、文档解析和向量编码相互重叠。
+本模块不依赖 PyQt，可在无界面环境中使用。
+"""
+
+import os
+import time
+from datetime import datetime
+from queue import Queue, Empty
+from threading import Thread, Lock, Event
+from typing import Callable, Dict, List, Optional, Set
+from core.document_processor import ParallelDocumentParser
+from core.embedding import EmbeddingBatcher
+from utils.logger import Logger
+
+# 阶段结束标记
+_STOP = object()
+
+# 扫描阶段每凑够这么多文件写入一次任务队列并交给解析阶段
+_SCAN_EMIT_BATCH = 100
+
+
+class PipelineStage:
+    """
+    流水线中的一个阶段
+
+    从输入队列取出任务交给 handler 处理，handler 通过 emit 回调把结果送入下一阶段。
+    所有工作线程退出后，向下一阶段的每个工作线程发送结束标记。
+    """
+
+    def __init__(self, name: str, handler: Callable, workers: int = 1,
+                 queue_size: int = 64, flush: Optional[Callable] = None,
+                 on_error: Optional[Callable] = None,
+                 on_idle: Optional[Callable] = None, idle_interval: float = 0.1):
+        """
+        Args:
+            name: 阶段名称
+            handler: 处理函数，签名为 handler(item, emit)
+            workers: 工作线程数
+            queue_size: 输入队列容量，队列满时上游阻塞
+            flush: 可选，所有任务处理完毕后调用一次，签名为 flush(emit)
+            on_error: 可选，handler 抛出异常时以该任务为参数调用
+            on_idle: 可选，输入队列空闲 idle_interval 秒时调用，签名为 on_idle(emit)
+            idle_interval: 空闲检查间隔，单位秒
+        """
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.flush = flush
+        self.on_error = on_error
+        self.on_idle = on_idle
+        self.idle_interval = idle_interval
+        self.input = Queue(maxsize=queue_size)
+        self.next_stage: Optional['PipelineStage'] = None
+        self.logger = Logger.get_logger(__name__)
+
+        self.processed = 0
+        self.emitted = 0
+        self.errors = 0
+        self.busy_time = 0.0
+        self._stats_lock = Lock()
+        self._alive = 0
+        self._threads: List[Thread] = []
+        self._started_at = None
+        self._finished_at = None
+
+    def start(self):
+        """启动工作线程"""
+        self._started_at = time.perf_counter()
+        self._alive = self.workers
+        for i in range(self.workers):
+            thread = Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def join(self):
+        """等待所有工作线程退出"""
+        for thread in self._threads:
+            thread.join()
+
+    def emit(self, item):
+        """将结果送入下一阶段（下一阶段队列满时阻塞）"""
+        with self._stats_lock:
+            self.emitted += 1
+        if self.next_stage is not None:
+            self.next_stage.input.put(item)
+
+    def _run(self):
+        while True:
+            if self.on_idle is None:
+                item = self.input.get()
+            else:
+                try:
+                    item = self.input.get(timeout=self.idle_interval)
+                except Empty:
+                    self.on_idle(self.emit)
+                    continue
+            if item is _STOP:
+                break
+
+            started = time.perf_counter()
+            try:
+                self.handler(item, self.emit)
+            except Exception as e:
+                with self._stats_lock:
+                    self.errors += 1
+                self.logger.error(f"流水线阶段 {self.name} 处理失败: {str(e)}")
+                if self.on_error is not None:
+                    self.on_error(item)
+            finally:
+                with self._stats_lock:
+                    self.processed += 1
+                    self.busy_time += time.perf_counter() - started
+
+        with self._stats_lock:
+            self._alive -= 1
+            is_last = self._alive == 0
+
+        if is_last:
+            if self.flush is not None:
+                try:
+                    self.flush(self.emit)
+                except Exception as e:
+                    self.logger.error(f"流水线阶段 {self.name} 收尾失败: {str(e)}")
+            self._finished_at = time.perf_counter()
+            if self.next_stage is not None:
+                for _ in range(self.next_stage.workers):
+                    self.next_stage.input.put(_STOP)
+
+    def stats(self) -> Dict:
+        """返回阶段吞吐统计"""
+        with self._stats_lock:
+            end = self._finished_at or time.perf_counter()
+            elapsed = end - self._started_at if self._started_at else 0.0
+            return {
+                "name": self.name,
+                "workers": self.workers,
+                "processed": self.processed,
+                "emitted": self.emitted,
+                "errors": self.errors,
+                "queued": self.input.qsize(),
+                "busy_seconds": round(self.busy_time, 3),
+                "items_per_second": round(self.processed / elapsed, 2) if elapsed > 0 else 0.0,
+                # 工作线程的平均繁忙程度，接近1说明该阶段是瓶颈
+                "utilization": round(self.busy_time / (elapsed * self.workers), 3) if elapsed > 0 else 0.0
+            }
+
+
+class IndexingPipeline:
+    """
+    增量索引流水线
+
+    扫描阶段边遍历目录边比对文件清单，新增或修改的文件随即进入后续阶段，已删除的文件被清除。
+    所有目录比对完成后，内容与已删除文件相同的新文件视为移动，直接改写路径而不重新编码。
+
+    指定 job_id 时作为可恢复的索引任务运行：进入处理队列的文件先写入任务的文件队列，
+    写入阶段每隔 checkpoint_interval 秒保存一次索引（检查点），保存后才把这段时间内
+    处理完的文件标记为已完成。程序退出、崩溃或暂停后，用同一个 job_id 重新运行即从中断处继续。
+    """
+
+    def __init__(self, search_service, directories: List[str],
+                 files: Optional[List[str]] = None,
+                 parse_workers: Optional[int] = None,
+                 parse_mode: str = "thread",
+                 parse_timeout: float = 120.0,
+                 write_batch_size: int = 100,
+                 embed_batch_size: int = 256,
+                 embed_max_delay: float = 0.5,
+                 queue_size: int = 64,
+                 progress_callback: Optional[Callable[[int, int], None]] = None,
+                 stats_callback: Optional[Callable[[List[Dict]], None]] = None,
+                 stats_interval: float = 5.0,
+                 job_id: Optional[int] = None,
+                 checkpoint_interval: float = 30.0):
+        """
+        Args:
+            search_service: 搜索服务实例
+            directories: 要索引的目录列表
+            files: 另外要索引的文件列表（如文件监控合并后的变化），不做目录比对
+            parse_workers: 解析线程数（进程模式下为子进程数），默认使用CPU核心数
+            parse_mode: "thread" 在线程中解析；"process" 使用进程池并行解析
+            parse_timeout: 进程模式下单个文件的解析超时时间，单位秒
+            write_batch_size: 每次写入向量存储的文档数
+            embed_batch_size: 跨文档拼接后每次编码的分块数（编码时再按长度分桶）
+            embed_max_delay: 分块在编码批次中的最长等待时间，单位秒
+            queue_size: 阶段间队列容量
+            progress_callback: 进度回调，参数为 (已完成文件数, 已发现文件数)
+            stats_callback: 阶段统计回调，参数为各阶段的统计信息列表
+            stats_interval: 统计信息上报间隔，单位秒
+            job_id: 索引任务ID（见 VectorStore.create_index_job），为空时不记录任务进度
+            checkpoint_interval: 任务检查点间隔，单位秒
+        """
+        self.logger = Logger.get_logger(__name__)
+        self.search_service = search_service
+        self.directories = directories
+        self.files = files or []
+        self.write_batch_size = write_batch_size
+        self.progress_callback = progress_callback
+        self.stats_callback = stats_callback
+        self.stats_interval = stats_interval
+        self.job_id = job_id
+        self.checkpoint_interval = checkpoint_interval
+
+        self.total_files = 0
+        self.completed_files = 0
+        self._progress_lock = Lock()
+        self._write_batch = []
+        self._scan_new: List[str] = []
+        self._scan_deleted: List[str] = []
+        self._known_sizes: Optional[Set[int]] = None
+        # 已进入处理队列的文件，恢复任务时扫描不再重复加入
+        self._queued: Set[str] = set()
+        # 处理完毕、等待下一个检查点标记为已完成的文件
+        self._finished_paths: List[str] = []
+        self._last_checkpoint = time.monotonic()
+        self._checkpoint_lock = Lock()
+        self._stopped = Event()
+        self._pause = False
+        self._done = Event()
+
+        parse_workers = parse_workers or os.cpu_count() or 4
+        self.parallel_parser = None
+        if parse_mode == "process":
+            # 每个解析线程同一时刻只占用一个子进程，超时计时不包含排队时间
+            self.parallel_parser = ParallelDocumentParser(max_workers=parse_workers,
+                                                          timeout=parse_timeout)
+        self.batcher = EmbeddingBatcher(
+            search_service.embedding_service,
+            self._on_embedded,
+            batch_size=embed_batch_size,
+            max_delay=embed_max_delay,
+            error_callback=lambda doc, e: self._file_done([doc['file_path']])
+        )
+
+        # 单个文件处理失败时也计入进度
+        skip_file = lambda item: self._file_done([item if isinstance(item, str) else item['file_path']])
+        self.stages = [
+            PipelineStage("scan", self._scan, workers=1, queue_size=queue_size,
+                          flush=self._flush_scan),
+            PipelineStage("parse", self._parse, workers=parse_workers, queue_size=queue_size,
+                          on_error=skip_file),
+            PipelineStage("chunk", self._chunk, workers=1, queue_size=queue_size,
+                          on_error=skip_file),
+            # 编码阶段单线程运行，由批处理器跨文档拼批
+            PipelineStage("embed", self._embed, workers=1, queue_size=queue_size,
+                          on_error=skip_file,
+                          flush=lambda emit: self.batcher.flush(),
+                          on_idle=lambda emit: self.batcher.flush_if_due(),
+                          idle_interval=max(0.05, embed_max_delay / 4)),
+            PipelineStage("write", self._write, workers=1, queue_size=queue_size,
+                          flush=self._flush_writes),
+        ]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+
+    @classmethod
+    def from_config(cls, search_service, directories: List[str], config,
+                    files: Optional[List[str]] = None,
+                    write_batch_size: int = 100,
+                    progress_callback: Optional[Callable[[int, int], None]] = None,
+                    stats_callback: Optional[Callable[[List[Dict]], None]] = None,
+                    job_id: Optional[int] = None) -> 'IndexingPipeline':
+        """按配置文件中的 indexing.* 设置创建流水线"""
+        return cls(
+            search_service,
+            directories,
+            files=files,
+            parse_workers=config.get_value('indexing.parse_workers'),
+            parse_mode=config.get_value('indexing.parse_mode', 'thread'),
+            parse_timeout=config.get_value('indexing.parse_timeout', 120.0),
+            write_batch_size=write_batch_size,
+            embed_batch_size=config.get_value('indexing.embed_batch_size', 256),
+            embed_max_delay=config.get_value('indexing.embed_max_delay', 0.5),
+            queue_size=config.get_value('indexing.queue_size', 64),
+            progress_callback=progress_callback,
+            stats_callback=stats_callback,
+            job_id=job_id,
+            checkpoint_interval=config.get_value('indexing.checkpoint_interval', 30.0)
+        )
+
+    def run(self) -> List[Dict]:
+        """
+        运行流水线直至所有文件处理完毕
+
+        Returns:
+            各阶段的吞吐统计
+        """
+        if self.job_id is not None:
+            self._prepare_job()
+        for stage in self.stages:
+            stage.start()
+
+        reporter = Thread(target=self._report_stats, name="pipeline-stats", daemon=True)
+        reporter.start()
+
+        scan_stage = self.stages[0]
+        for directory in self.directories:
+            scan_stage.input.put(directory)
+        if self.files:
+            scan_stage.input.put(list(self.files))
+        for _ in range(scan_stage.workers):
+            scan_stage.input.put(_STOP)
+
+        try:
+            for stage in self.stages:
+                stage.join()
+        finally:
+            if self.parallel_parser is not None:
+                self.parallel_parser.shutdown()
+        self._done.set()
+        reporter.join()
+        if self.job_id is not None:
+            self._finish_job()
+
+        stats = self.get_stats()
+        for stage_stats in stats:
+            self.logger.info(f"流水线阶段统计: {stage_stats}")
+        cache_stats = self.search_service.embedding_service.cache_stats()
+        if cache_stats:
+            self.logger.info(f"嵌入缓存统计: {cache_stats}")
+        if self.stats_callback:
+            self.stats_callback(stats)
+        return stats
+
+    @property
+    def stopped(self) -> bool:
+        """是否已被 stop 中止（此时任务尚未完成）"""
+        return self._stopped.is_set()
+
+    def stop(self, pause: bool = True):
+        """
+        中止流水线（可在任意线程调用）：不再扫描和解析新文件，已在编码和写入的文件处理完后 run 返回
+
+        Args:
+            pause: True 时任务标记为已暂停，由用户继续；False 时保持运行状态，下次启动时自动恢复
+        """
+        self._pause = pause
+        self._stopped.set()
+
+    def _prepare_job(self):
+        """读取任务游标：已完成扫描的任务只处理队列中剩余的文件，否则重新扫描并跳过已在队列中的文件"""
+        vector_store = self.search_service.vector_store
+        job = vector_store.get_index_job(self.job_id)
+        if job is None:
+            raise ValueError(f"索引任务不存在: {self.job_id}")
+        pending = vector_store.get_index_job_files(self.job_id)
+        # 上一个检查点之后写入的结果可能没有随索引保存（异常退出），删除后重新处理
+        unsaved = vector_store.get_files_indexed_since(pending, job['checkpointed_at'] or job['created_at'])
+        if unsaved:
+            self.logger.info(f"恢复索引任务 {self.job_id}：{len(unsaved)} 个文件在检查点之后写入，重新处理")
+            self.search_service.remove_documents(unsaved)
+        if job['scan_completed']:
+            self.directories = []
+        elif not self.directories:
+            self.directories = job['directories']
+        self._queued.update(pending)
+        self.files = list(dict.fromkeys(pending + list(self.files)))
+        vector_store.update_index_job(self.job_id, status='running')
+        self.logger.info(f"索引任务 {self.job_id}：待处理 {len(pending)} 个文件，已完成 {job['completed_files']} 个，"
+                         f"{'需要' if self.directories else '无需'}扫描目录")
+
+    def _checkpoint(self, force: bool = False):
+        """保存索引，再把保存前处理完的文件标记为已完成"""
+        with self._checkpoint_lock:
+            if not force and time.monotonic() - self._last_checkpoint < self.checkpoint_interval:
+                return
+            # 检查点时间取在保存之前：之后写入清单的文件不能确认已随索引保存
+            checkpointed_at = datetime.now().isoformat()
+            with self._progress_lock:
+                finished, self._finished_paths = self._finished_paths, []
+            self.search_service.save_index()
+            self.search_service.vector_store.complete_index_job_files(self.job_id, finished, checkpointed_at)
+            self._last_checkpoint = time.monotonic()
+            self.logger.debug(f"索引任务 {self.job_id} 检查点：{len(finished)} 个文件已完成")
+
+    def _finish_job(self):
+        self._checkpoint(force=True)
+        vector_store = self.search_service.vector_store
+        if self.stopped:
+            vector_store.update_index_job(self.job_id, status='paused' if self._pause else 'running')
+            self.logger.info(f"索引任务 {self.job_id} 已{'暂停' if self._pause else '中止'}")
+        else:
+            vector_store.finish_index_job(self.job_id)
+            self.logger.info(f"索引任务 {self.job_id} 已完成")
+
+    def get_stats(self) -> List[Dict]:
+        """获取各阶段当前的吞吐统计"""
+        return [stage.stats() for stage in self.stages]
+
+    def _report_stats(self):
+        while not self._done.wait(self.stats_interval):
+            stats = self.get_stats()
+            self.logger.debug(f"流水线阶段统计: {stats}")
+            if self.stats_callback:
+                self.stats_callback(stats)
+
+    def _file_done(self, file_paths: List[str]):
+        with self._progress_lock:
+            self.completed_files += len(file_paths)
+            if self.job_id is not None:
+                self._finished_paths.extend(file_paths)
+            completed, total = self.completed_files, self.total_files
+        if self.progress_callback:
+            self.progress_callback(completed, total)
+
+    # 各阶段处理函数
+
+    def _scan(self, item, emit):
+        if isinstance(item, list):
+            # 指定的文件列表：已不存在的文件跳过，内容是否变化由解析阶段判断
+            self._emit_files([file_path for file_path in item if os.path.isfile(file_path)], emit)
+            return
+        if self._known_sizes is None:
+            self._known_sizes = self.search_service.vector_store.get_file_sizes()
+        # 边扫描边交给解析阶段（每凑够一小批写入一次任务队列）。大小与清单中某个文件相同的新文件
+        # 可能是移动过来的，与删除的文件一起暂存到所有目录比对完成，以便识别跨目录移动的文件
+        ready = []
+        for state, file_path, stat in self.search_service.iter_directory_changes(item):
+            if self.stopped:
+                return
+            if state == "deleted":
+                self._scan_deleted.append(file_path)
+            elif file_path in self._queued:
+                continue
+            elif state == "modified":
+                ready.append(file_path)
+            elif state == "new":
+                if stat.st_size in self._known_sizes:
+                    self._scan_new.append(file_path)
+                else:
+                    ready.append(file_path)
+            if len(ready) >= _SCAN_EMIT_BATCH:
+                self._emit_files(ready, emit)
+                ready = []
+        self._emit_files(ready, emit)
+
+    def _flush_scan(self, emit):
+        if self.stopped:
+            # 中止时不处理暂存的新增和删除，恢复任务时重新扫描
+            return
+        moved = []
+        try:
+            moved = self.search_service.relink_by_content(self._scan_new, self._scan_deleted)
+        except Exception as e:
+            self.logger.error(f"识别移动文件失败，按新增和删除处理: {str(e)}")
+        moved_sources = {src for src, _ in moved}
+        moved_targets = {dest for _, dest in moved}
+        deleted = [path for path in self._scan_deleted if path not in moved_sources]
+        if deleted:
+            self.search_service.remove_documents(deleted)
+        self._emit_files([path for path in self._scan_new if path not in moved_targets], emit)
+        if self.job_id is not None and self.directories:
+            self.search_service.vector_store.update_index_job(self.job_id, scan_completed=True)
+
+    def _emit_files(self, file_paths: List[str], emit):
+        if not file_paths:
+            return
+        if self.job_id is not None:
+            # 先写入任务队列再交给解析阶段，中断后这些文件不会遗漏
+            self.search_service.vector_store.add_index_job_files(self.job_id, file_paths)
+            self._queued.update(file_paths)
+        with self._progress_lock:
+            self.total_files += len(file_paths)
+        for file_path in file_paths:
+            emit(file_path)
+
+    def _parse(self, file_path: str, emit):
+        if self.stopped:
+            # 已中止：文件留在任务队列中，恢复时再处理
+            return
+        # 内容哈希未变化的文件只刷新清单
+        file_info = self.search_service.check_file_changed(file_path)
+        if file_info is None:
+            self.logger.info(f"文件 {file_path} 内容未变化，跳过。")
+            self._file_done([file_path])
+            return
+        if self.parallel_parser is not None:
+            doc_info = self.parallel_parser.parse(file_path)
+        else:
+            doc_info = self.search_service.doc_processor.parse_document(file_path)
+
+        emit({
+            'file_path': file_path,
+            'content': doc_info["content"],
+            'metadata': doc_info["metadata"],
+            'file_info': file_info
+        })
+
+    def _chunk(self, doc: Dict, emit):
+        content = doc.pop('content')
+        doc['chunks'] = self.search_service.doc_processor.create_chunks(content) if content else []
+        emit(doc)
+
+    def _embed(self, doc: Dict, emit):
+        if not doc['chunks']:
+            doc['embeddings'] = []
+            emit(doc)
+            return
+        self.batcher.add(doc, doc['chunks'])
+        self.batcher.flush_if_due()
+
+    def _on_embedded(self, doc: Dict, embeddings):
+        """批处理器回调：文档的全部分块编码完成"""
+        doc['embeddings'] = embeddings
+        self.stages[3].emit(doc)
+
+    def _write(self, doc: Dict, emit):
+        self._write_batch.append(doc)
+        if len(self._write_batch) >= self.write_batch_size:
+            self._flush_writes(emit)
+
+    def _flush_writes(self, emit):
+        if not self._write_batch:
+            return
+        batch, self._write_batch = self._write_batch, []
+        try:
+            self.search_service.vector_store.add_document_batch(batch)
+        finally:
+            self._file_done([doc['file_path'] for doc in batch])
+        if self.job_id is not None:
+            self._checkpoint()
@@ -1,9 +1,17 @@
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Tuple
 from .document_processor import DocumentProcessor
 from .embedding import EmbeddingService
+from .embedding_cache import EmbeddingCache
 from .vector_store import VectorStore
 import os
+import functools
+import hashlib
+import unicodedata
+from datetime import datetime
+from utils.config import Config
+from utils.scanner import DirectoryScanner
 from utils.logger import Logger
+from utils.lru_cache import LRUCache
 
 class SearchService:
     def __init__(self, index_file: str = os.path.join(os.getcwd(), "faiss.index")):
@@ -15,94 +23,564 @@ class SearchService:
         """
         self.logger = Logger.get_logger(__name__)
         self.logger.info("初始化搜索服务")
+        self.config = Config()
         self.doc_processor = DocumentProcessor()
-        self.embedding_service = EmbeddingService()
-        self.vector_store = VectorStore(index_file=index_file)
+        cache = None
+        if self.config.get_value('embedding_cache.enabled', True):
+            cache = EmbeddingCache(
+                max_entries=self.config.get_value('embedding_cache.max_entries', 200000)
+            )
+        self.embedding_service = EmbeddingService(
+            self.config.get_model_name(),
+            cache=cache,
+            backend=self.config.get_model_backend()
+        )
+        self.vector_store = VectorStore(
+            index_file=index_file,
+            index_factory=self.config.get_value('index.factory', 'Flat'),
+            nprobe=self.config.get_value('index.nprobe', 16),
+            ef_search=self.config.get_value('index.ef_search', 64),
+            promote_threshold=self.config.get_value('index.promote_threshold', 100000),
+            # index.mmap 需要 faiss 1.11 及以上版本，否则退回完整读入
+            mmap=self.config.get_value('index.mmap', False),
+            lazy_load=self.config.get_value('index.lazy_load', False),
+            compact_ratio=self.config.get_value('index.compact_ratio', 0.2),
+            compact_min_vectors=self.config.get_value('index.compact_min_vectors', 10000)
+        )
+        # 搜索结果缓存以索引版本号为键的一部分，索引变化后旧结果自然失效
+        cache_enabled = self.config.get_value('search_cache.enabled', True)
+        self.result_cache = LRUCache(
+            self.config.get_value('search_cache.max_results', 256) if cache_enabled else 0)
+        self.query_embedding_cache = LRUCache(
+            self.config.get_value('search_cache.max_query_embeddings', 128) if cache_enabled else 0)
+        # 查询向量的编码函数，HTTP 服务会替换为跨请求拼批的版本；查询只使用内存中的查询向量缓存
+        self.query_encoder = functools.partial(self.embedding_service.encode, use_cache=False)
         
-    def index_document(self, file_path: str):
-        """索引单个文档"""
-        self.logger.info("开始索引文档: %s", file_path)
-        # 解析文档
-        doc_info = self.doc_processor.parse_document(file_path)
+    @staticmethod
+    def get_file_signature(file_path: str) -> Dict:
+        """获取文件的大小和修改时间（不读取文件内容）"""
+        stat = os.stat(file_path)
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    @staticmethod
+    def compute_file_hash(file_path: str, block_size: int = 1024 * 1024) -> str:
+        """计算文件内容的SHA-256哈希"""
+        hasher = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    def iter_directory_changes(self, directory: str) -> Iterator[Tuple[str, str, Optional[os.stat_result]]]:
+        """
+        边扫描边将目录中的文件与文件清单比较（仅使用 stat 信息）
         
-        if not doc_info["content"]:
-            self.logger.warning("未能从文档提取内容: %s", file_path)
-            return
-            
-        # 分块
-        chunks = self.doc_processor.create_chunks(doc_info["content"])
+        先按扫描顺序产出 ("new" | "modified" | "unchanged", 文件路径, stat)，
+        扫描结束后产出清单中有记录但已不存在的文件 ("deleted", 文件路径, None)。
+        完整遍历后把受支持的文件数写入 directories.doc_count，目录管理界面直接显示该值。
+        """
+        records = self.vector_store.get_file_records(directory)
+        scanner = DirectoryScanner.from_config(self.config)
+        seen = set()
         
-        if not chunks:
-            print(f"Warning: No chunks created for {file_path}")
-            return
-            
-        # 生成向量
-        embeddings = self.embedding_service.encode(chunks)
-        
-        # 存储
-        self.vector_store.add_document(
-            file_path=file_path,
-            chunks=chunks,
-            embeddings=embeddings,
-            metadata=doc_info["metadata"]
+        for file_path, stat in scanner.iter_files(directory):
+            seen.add(file_path)
+            record = records.get(file_path)
+            if record is None:
+                yield "new", file_path, stat
+            elif record["size"] != stat.st_size or record["mtime"] != stat.st_mtime:
+                yield "modified", file_path, stat
+            else:
+                yield "unchanged", file_path, stat
+                
+        for file_path in records:
+            if file_path not in seen:
+                yield "deleted", file_path, None
+        # 未登记的目录（如子目录）不会更新任何行
+        self.vector_store.update_directory_status(directory, enabled=None, doc_count=len(seen))
+
+    def diff_directory(self, directory: str) -> Dict[str, List[str]]:
+        """
+        将目录当前状态与文件清单比较（仅使用 stat 信息）
+        
+        Returns:
+            包含 new、modified、deleted、unchanged 四个文件路径列表的字典
+        """
+        diff = {"new": [], "modified": [], "deleted": [], "unchanged": []}
+        for state, file_path, _ in self.iter_directory_changes(directory):
+            diff[state].append(file_path)
+        self.logger.info(
+            "目录比对完成 %s: 新增 %d, 修改 %d, 删除 %d, 未变化 %d",
+            directory, len(diff["new"]), len(diff["modified"]),
+            len(diff["deleted"]), len(diff["unchanged"])
         )
+        return diff
+
+    def check_file_changed(self, file_path: str) -> Optional[Dict]:
+        """
+        检查文件是否需要重新索引
+        
+        大小和修改时间一致时直接视为未变化；否则比较内容哈希，
+        内容相同则只刷新清单中的 stat 信息。
+        
+        Returns:
+            需要重新索引时返回文件信息（size、mtime、content_hash），否则返回 None
+        """
+        signature = self.get_file_signature(file_path)
+        record = self.vector_store.get_file_record(file_path)
+        if (record and record["size"] == signature["size"]
+                and record["mtime"] == signature["mtime"]):
+            return None
+            
+        content_hash = self.compute_file_hash(file_path)
+        if record and record["content_hash"] == content_hash:
+            self.vector_store.touch_file_record(file_path, signature["size"], signature["mtime"])
+            return None
+            
+        signature["content_hash"] = content_hash
+        return signature
+
+    def prepare_document(self, file_path: str, file_info: Dict) -> Dict:
+        """解析、分块并编码单个文档，返回可直接写入向量存储的文档数据"""
+        doc_info = self.doc_processor.parse_document(file_path)
+        chunks = []
+        if doc_info["content"]:
+            chunks = self.doc_processor.create_chunks(doc_info["content"])
+        else:
+            self.logger.warning("未能从文档提取内容: %s", file_path)
+            
+        # 空文档同样写入清单，避免下次重复解析
+        return {
+            'file_path': file_path,
+            'chunks': chunks,
+            'embeddings': self.embedding_service.encode(chunks) if chunks else [],
+            'metadata': doc_info["metadata"],
+            'file_info': file_info
+        }
+
+    def index_document(self, file_path: str, force: bool = False):
+        """索引单个文档，内容未变化时跳过"""
+        self.logger.info("开始索引文档: %s", file_path)
+        if force:
+            file_info = self.get_file_signature(file_path)
+            file_info["content_hash"] = self.compute_file_hash(file_path)
+        else:
+            file_info = self.check_file_changed(file_path)
+            if file_info is None:
+                self.logger.info("文档未变化，跳过: %s", file_path)
+                return
+                
+        self.vector_store.add_document_batch([self.prepare_document(file_path, file_info)])
+
+    def remove_documents(self, file_paths: List[str]):
+        """删除文档的索引数据"""
+        self.vector_store.remove_files(file_paths)
         
     def index_directory(self, directory: str):
-        """索引单个目录"""
+        """增量索引单个目录：跳过未变化文件，重新索引修改过的文件，清除已删除文件"""
         if not os.path.exists(directory):
             raise FileNotFoundError(f"目录不存在: {directory}")
         
-        # 获取目录下的所有文件
-        files = []
-        for root, _, filenames in os.walk(directory):
-            for filename in filenames:
-                if any(filename.lower().endswith(ext) for ext in self.config.get_file_extensions()):
-                    files.append(os.path.join(root, filename))
+        diff = self.diff_directory(directory)
+        # 目录内移动或重命名的文件改写路径，不重新索引
+        moved = self.relink_by_content(diff["new"], diff["deleted"])
+        moved_sources = {src for src, _ in moved}
+        moved_targets = {dest for _, dest in moved}
+        self.remove_documents([path for path in diff["deleted"] if path not in moved_sources])
                 
-        # 处理所有文件
-        for file in files:
-            self.index_document(file)
+        # 处理新增和修改的文件
+        for file in [path for path in diff["new"] if path not in moved_targets] + diff["modified"]:
+            try:
+                self.index_document(file)
+            except Exception as e:
+                self.logger.error("索引文档失败 %s: %s", file, str(e))
+        
+    def search(self, query: str, top_k: int = 50,
+               extensions: Optional[List[str]] = None, directory: Optional[str] = None,
+               modified_after: Optional[float] = None, modified_before: Optional[float] = None,
+               min_size: Optional[int] = None, max_size: Optional[int] = None,
+               mode: Optional[str] = None) -> List[Dict]:
+        """
+        搜索文档
+        
+        Args:
+            query: 查询文本
+            top_k: 返回的结果数
+            extensions: 只搜索这些扩展名的文件
+            directory: 只搜索该目录下的文件
+            modified_after / modified_before: 文件修改时间范围（时间戳）
+            min_size / max_size: 文件大小范围（字节）
+            mode: 检索方式，默认读取配置 search.mode：
+                "vector"    只用向量检索
+                "hybrid"    向量检索与全文检索（BM25）结果融合，编号等精确词也能排在前面
+                "prefilter" 先用全文检索筛选候选分块，再在候选中按向量排序，适合大型语料库
+        """
+        return self.hydrate_results(self.search_ids(
+            query, top_k, extensions=extensions, directory=directory,
+            modified_after=modified_after, modified_before=modified_before,
+            min_size=min_size, max_size=max_size, mode=mode))
+    
+    def search_ids(self, query: str, top_k: int = 50,
+                   extensions: Optional[List[str]] = None, directory: Optional[str] = None,
+                   modified_after: Optional[float] = None, modified_before: Optional[float] = None,
+                   min_size: Optional[int] = None, max_size: Optional[int] = None,
+                   mode: Optional[str] = None) -> List[Tuple[int, float]]:
+        """
+        与 search 相同，但只返回 (faiss_id, 相关度) 列表，不读取分块内容
+        
+        相关度越大越相关；分块的文件路径和文本可用 hydrate_results 或 vector_store.get_chunks 按需读取。
+        """
+        mode = mode or self.config.get_value('search.mode', 'hybrid')
+        query = self.normalize_query(query)
+        filters = dict(extensions=extensions, directory=directory,
+                       modified_after=modified_after, modified_before=modified_before,
+                       min_size=min_size, max_size=max_size)
+        settings = self._fusion_settings()
+        
+        # 版本号在搜索前读取：搜索期间索引发生变化时，结果存在旧版本号下，不会被后续搜索命中
+        cache_key = self._cache_key(query, top_k, mode, filters, settings)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
         
-    def search(self, query: str, top_k: int = 50) -> List[Dict]:
-        """搜索文档"""
         # 生成查询向量
-        query_vector = self.embedding_service.encode(query)
-        
-        # 搜索
-        results = self.vector_store.search(query_vector, top_k)
-        
-        # 格式化结果
-        formatted_results = []
-        for file_path, score, info in results:
-            formatted_results.append({
-                "file_path": file_path,
-                "score": 1.0 / (1.0 + score),  # 转换距离为相似度分数
-                "chunk_text": info["chunk_text"],
-                "metadata": info["metadata"]
-            })
-            
-        return formatted_results 
+        query_vector = self.encode_query(query)
+        
+        # 搜索，过滤条件在检索时生效，保证返回满足条件的 top_k 个结果
+        if mode == 'hybrid':
+            # 融合得分已经是 [0, 1] 的相关度
+            hits = self.vector_store.hybrid_hits(query_vector, query, top_k, **settings, **filters)
+        else:
+            hits = []
+            if mode == 'prefilter':
+                hits = self.vector_store.search_hits(
+                    query_vector, top_k, match=query,
+                    match_limit=self.config.get_value('search.prefilter_limit', 2000),
+                    **filters
+                )
+                if not hits:
+                    self.logger.info("关键词预过滤没有命中，改为全量向量检索")
+            if not hits:
+                hits = self.vector_store.search_hits(query_vector, top_k, **filters)
+            # 转换距离为相似度分数
+            hits = [(faiss_id, 1.0 / (1.0 + distance)) for faiss_id, distance in hits]
+        
+        # 缓存中只保存 ID 和分数，分块内容每次按需读取
+        self.result_cache.put(cache_key, tuple(hits))
+        return hits
+    
+    def search_preview(self, query: str, top_k: int = 50, mode: Optional[str] = None,
+                       **filters) -> Optional[List[Tuple[int, float]]]:
+        """
+        不编码查询的快速预览：只做全文检索，返回 (faiss_id, 相关度) 列表，供界面在语义结果返回前先显示
+        
+        完整结果已在缓存中、查询向量已缓存（完整搜索本身很快）或只用向量检索时返回 None，
+        此时调用方应直接等待 search_ids 的结果。参数与 search 相同。
+        """
+        mode = mode or self.config.get_value('search.mode', 'hybrid')
+        query = self.normalize_query(query)
+        if mode == 'vector' or not query:
+            return None
+        filters = dict(dict.fromkeys(('extensions', 'directory', 'modified_after', 'modified_before',
+                                      'min_size', 'max_size')), **filters)
+        cache_key = self._cache_key(query, top_k, mode, filters, self._fusion_settings())
+        if cache_key in self.result_cache or query in self.query_embedding_cache:
+            return None
+        # bm25() 越小越相关且通常为负数，换算为 [0, 1) 的相关度
+        return [(faiss_id, max(-bm25, 0.0) / (1.0 + max(-bm25, 0.0)))
+                for faiss_id, bm25 in self.vector_store.lexical_hits(query, top_k, **filters)]
+    
+    def hydrate_results(self, hits: List[Tuple[int, float]]) -> List[Dict]:
+        """读取 (faiss_id, 相关度) 列表对应的分块内容，转换为结果字典，已删除的分块被跳过"""
+        chunks = self.vector_store.get_chunks([faiss_id for faiss_id, _ in hits])
+        return [
+            {
+                "file_path": chunks[faiss_id]["file_path"],
+                "score": score,
+                "chunk_text": chunks[faiss_id]["chunk_text"],
+                "metadata": chunks[faiss_id]["metadata"]
+            }
+            for faiss_id, score in hits if faiss_id in chunks
+        ]
+    
+    def _fusion_settings(self) -> Dict:
+        """混合检索的融合参数"""
+        return dict(
+            fusion=self.config.get_value('search.fusion', 'rrf'),
+            rrf_k=self.config.get_value('search.rrf_k', 60),
+            vector_weight=self.config.get_value('search.vector_weight', 0.5),
+            candidate_pool=self.config.get_value('search.candidate_pool', 100),
+        )
+    
+    def _cache_key(self, query: str, top_k: int, mode: str, filters: Dict, settings: Dict) -> tuple:
+        """搜索结果缓存的键，包含当前索引版本号"""
+        extensions = filters.get('extensions')
+        return (
+            query, top_k, mode, self.vector_store.generation,
+            tuple(sorted(ext.lower() for ext in extensions)) if extensions else None,
+            filters.get('directory'), filters.get('modified_after'), filters.get('modified_before'),
+            filters.get('min_size'), filters.get('max_size'),
+            tuple(sorted(settings.items()))
+        )
+    
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """规范化查询文本：统一 Unicode 形式并合并空白，作为缓存键"""
+        return ' '.join(unicodedata.normalize('NFKC', query).split())
+    
+    def encode_query(self, query: str):
+        """生成查询向量，最近使用过的查询直接取缓存"""
+        query_vector = self.query_embedding_cache.get(query)
+        if query_vector is None:
+            query_vector = self.query_encoder(query)
+            self.query_embedding_cache.put(query, query_vector)
+        return query_vector
+    
+    def get_stats(self) -> Dict:
+        """索引规模、目录和缓存的统计信息"""
+        stats = self.vector_store.get_stats()
+        stats['directories'] = self.get_directories()
+        stats['caches'] = self.cache_stats()
+        return stats
+    
+    def cache_stats(self) -> Dict:
+        """搜索结果缓存、查询向量缓存和分块嵌入缓存的统计信息"""
+        return {
+            "results": self.result_cache.stats(),
+            "query_embeddings": self.query_embedding_cache.stats(),
+            "chunk_embeddings": self.embedding_service.cache_stats()
+        }
     
     def clear_all(self):
         """清空所有数据"""
         self.vector_store.clear_all()   
 
+    def warmup(self):
+        """预热：加载嵌入模型并执行一次编码，等待FAISS索引加载完成"""
+        self.embedding_service.warmup()
+        self.vector_store.wait_until_ready()
+
     def save_index(self):
         """保存索引"""
         self.vector_store.save_index()   
 
+    def index_directories(self, directories: Optional[List[str]] = None,
+                          progress_callback=None, stats_callback=None,
+                          resume: bool = True) -> List[Dict]:
+        """
+        用多阶段流水线增量索引目录并保存索引，不依赖界面
+        
+        以可恢复的索引任务运行：中途退出后再次调用会从中断处继续。
+        
+        Args:
+            directories: 要索引的目录，默认为所有启用的目录
+            progress_callback: 进度回调，参数为 (已完成文件数, 已发现文件数)
+            stats_callback: 阶段统计回调
+            resume: 存在目录相同的未完成任务时继续该任务，否则新建任务
+            
+        Returns:
+            各阶段的吞吐统计
+        """
+        from .pipeline import IndexingPipeline
+        
+        if directories is None:
+            directories = self.get_enabled_directories()
+        job = self.get_unfinished_index_job() if resume else None
+        if job is not None and set(job['directories']) == set(directories):
+            job_id = job['id']
+            self.logger.info(f"继续未完成的索引任务 {job_id}")
+        else:
+            job_id = self.create_index_job(directories)
+        pipeline = IndexingPipeline.from_config(
+            self, directories, self.config,
+            progress_callback=progress_callback,
+            stats_callback=stats_callback,
+            job_id=job_id
+        )
+        stats = pipeline.run()
+        self.save_index()
+        
+        now = datetime.now().isoformat()
+        for directory in directories:
+            self.update_directory_status(directory, enabled=None, last_update=now)
+        return stats
+
+    def apply_file_changes(self, changes: Dict[str, List], progress_callback=None,
+                           pipeline_callback=None) -> Dict[str, int]:
+        """
+        应用文件监控合并后的一批变化
+        
+        移动和重命名直接改写路径；新文件与本批删除的文件内容相同时同样视为移动；
+        其余删除的文件清除索引，新增和修改的文件用流水线索引。
+        
+        Args:
+            changes: FileMonitor 提交的变化批次（upserted、deleted、moved、deleted_directories）
+            progress_callback: 进度回调，参数为 (已完成文件数, 文件总数)
+            pipeline_callback: 流水线创建后、运行前的回调，参数为流水线，调用方可借此中止索引
+            
+        Returns:
+            本批改写路径、删除和检查的文件数
+        """
+        from .pipeline import IndexingPipeline
+        
+        # 移动事件：原路径有索引记录时改写路径，目标文件随后按 stat 检查是否另有修改
+        moves = [(src, dest) for src, dest in changes.get("moved", []) if os.path.exists(dest)]
+        relinked = self.vector_store.relink_files(moves)
+        relinked_sources = {src for src, _ in relinked}
+        
+        deleted = list(changes.get("deleted", []))
+        for directory in changes.get("deleted_directories", []):
+            deleted.extend(self.vector_store.get_file_records(directory))
+        deleted.extend(src for src, _ in changes.get("moved", []) if src not in relinked_sources)
+        
+        # 没有对应移动事件的新文件（如跨目录剪切、先删后建）按内容与删除的文件配对
+        upserted = changes.get("upserted", [])
+        new_files = [path for path in upserted if self.vector_store.get_file_record(path) is None]
+        matched = self.relink_by_content(new_files, deleted)
+        matched_sources = {src for src, _ in matched}
+        
+        removed = [path for path in dict.fromkeys(deleted) if path not in matched_sources]
+        if removed:
+            self.remove_documents(removed)
+        
+        if upserted:
+            pipeline = IndexingPipeline.from_config(
+                self, [], self.config, files=upserted, progress_callback=progress_callback)
+            if pipeline_callback:
+                pipeline_callback(pipeline)
+            pipeline.run()
+        return {"relinked": len(relinked) + len(matched), "removed": len(removed), "checked": len(upserted)}
+
+    def reconcile(self, directories: Optional[List[str]] = None,
+                  progress_callback=None, scan_callback=None,
+                  pipeline_callback=None, should_stop=None) -> Dict[str, int]:
+        """
+        启动对账：程序未运行期间发生的变化文件监控看不到，用文件清单与磁盘的 stat 信息比较补上
+        
+        比对只遍历目录、读取 stat，不打开文件；只有新增、修改和删除的文件交给 apply_file_changes，
+        其中内容与已删除文件相同的新文件按移动处理。目录不存在（如移动硬盘未连接）时跳过，保留其索引。
+        
+        中途停止时，尚未索引的文件在清单中仍是旧记录，下次对账会再次比对出来。
+        
+        Args:
+            directories: 要对账的目录，默认为所有启用的目录
+            progress_callback: 索引进度回调，参数为 (已完成文件数, 文件总数)
+            scan_callback: 比对进度回调，参数为 (已比对目录数, 目录总数)
+            pipeline_callback: 索引流水线创建后的回调，参数为流水线，调用方可借此中止索引
+            should_stop: 比对阶段在每个目录之间调用，返回 True 时不再处理变化直接返回
+            
+        Returns:
+            比对和处理的文件数
+        """
+        if directories is None:
+            directories = self.get_enabled_directories()
+        changes = {"upserted": [], "deleted": [], "moved": [], "deleted_directories": []}
+        unchanged = 0
+        scanned = []
+        for position, directory in enumerate(directories, start=1):
+            if should_stop and should_stop():
+                self.logger.info("启动对账已中止")
+                return {"relinked": 0, "removed": 0, "checked": 0, "unchanged": unchanged}
+            if os.path.isdir(directory):
+                diff = self.diff_directory(directory)
+                changes["upserted"].extend(diff["new"] + diff["modified"])
+                changes["deleted"].extend(diff["deleted"])
+                unchanged += len(diff["unchanged"])
+                scanned.append(directory)
+            else:
+                self.logger.warning("对账时目录不存在，跳过: %s", directory)
+            if scan_callback:
+                scan_callback(position, len(directories))
+        
+        result = {"relinked": 0, "removed": 0, "checked": 0}
+        if changes["upserted"] or changes["deleted"]:
+            result = self.apply_file_changes(changes, progress_callback, pipeline_callback)
+            self.save_index()
+        if should_stop and should_stop():
+            self.logger.info("启动对账已中止: %s", result)
+            result["unchanged"] = unchanged
+            return result
+        now = datetime.now().isoformat()
+        for directory in scanned:
+            self.update_directory_status(directory, enabled=None, last_update=now)
+        result["unchanged"] = unchanged
+        self.logger.info("启动对账完成: %s", result)
+        return result
+
+    def match_moved_files(self, new_paths: List[str], deleted: Dict[str, Dict]) -> List[Tuple[str, str]]:
+        """
+        按内容把新文件与已删除的文件配对
+        
+        只有大小与某个已删除文件相同的新文件才计算内容哈希，每个已删除文件最多配对一次。
+        
+        Args:
+            new_paths: 清单中没有记录的文件
+            deleted: 已删除文件的清单记录，以路径为键
+            
+        Returns:
+            (原路径, 新路径) 列表
+        """
+        by_size: Dict[int, List[Dict]] = {}
+        for record in deleted.values():
+            by_size.setdefault(record["size"], []).append(record)
+        
+        moves = []
+        for new_path in new_paths:
+            try:
+                candidates = by_size.get(self.get_file_signature(new_path)["size"])
+                if not candidates:
+                    continue
+                content_hash = self.compute_file_hash(new_path)
+            except OSError:
+                continue
+            for record in candidates:
+                if record["content_hash"] == content_hash:
+                    candidates.remove(record)
+                    moves.append((record["path"], new_path))
+                    break
+        return moves
+
+    def relink_by_content(self, new_paths: List[str], deleted_paths: List[str]) -> List[Tuple[str, str]]:
+        """
+        把内容与已删除文件相同的新文件视为移动，原地改写路径而不重新编码
+        
+        Returns:
+            已改写的 (原路径, 新路径) 列表，调用方不应再删除这些原路径或重新索引这些新路径
+        """
+        if not new_paths or not deleted_paths:
+            return []
+        deleted = {}
+        for path in deleted_paths:
+            record = self.vector_store.get_file_record(path)
+            if record is not None:
+                deleted[path] = record
+        moves = self.match_moved_files(new_paths, deleted)
+        if not moves:
+            return []
+        # 内容已按哈希确认一致，清单中的 stat 信息更新为新文件的
+        signatures = {}
+        for _, new_path in moves:
+            try:
+                signatures[new_path] = self.get_file_signature(new_path)
+            except OSError:
+                continue
+        return self.vector_store.relink_files(moves, signatures)
+
     def rebuild_index(self):
         """重建所有索引"""
         # 清空现有索引
         self.vector_store.clear_all()
         
-        # 获取所有启用的目录
-        enabled_dirs = [d for d in self.config.get_scan_directories() 
-                       if self.config.is_directory_enabled(d)]
-        
-        # 重新索引所有启用的目录
-        for directory in enabled_dirs:
-            self.index_directory(directory)   
+        # 以新的索引任务重新索引所有启用的目录，重建中途退出后继续该任务，不会再次清空
+        self.index_directories(self.get_enabled_directories(), resume=False)
+
+    def create_index_job(self, directories: List[str]) -> int:
+        """创建可恢复的索引任务（未完成的旧任务被取消），返回任务ID"""
+        return self.vector_store.create_index_job(directories)
+
+    def get_unfinished_index_job(self) -> Optional[Dict]:
+        """获取最近一个被中断或已暂停的索引任务"""
+        return self.vector_store.get_unfinished_index_job()
 
     def get_scan_directories(self) -> List[str]:
         """获取需要扫描的目录列表"""
@@ -126,10 +604,10 @@ class SearchService:
         """删除目录及其索引数据"""
         self.vector_store.remove_directory(path)
 
-    def update_directory_status(self, path: str, enabled: bool = True,
+    def update_directory_status(self, path: str, enabled: Optional[bool] = None,
                               last_update: Optional[str] = None,
                               doc_count: Optional[int] = None):
-        """更新目录状态"""
+        """更新目录状态，参数为 None 的字段保持不变"""
         self.vector_store.update_directory_status(path, enabled, last_update, doc_count)
 
     def get_enabled_directories(self) -> List[str]:
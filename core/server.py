@@ -0,0 +1,251 @@
+"""
+本地 HTTP/JSON 搜索与索引服务
+
+基于标准库 ThreadingHTTPServer，每个请求在独立线程中处理；
+并发请求的查询文本由 QueryEmbeddingBatcher 在很短的时间窗口内拼成一批统一编码。
+本模块不导入 PyQt，可在无界面的服务器上运行。
+
+接口：
+    GET  /search?q=文本&top_k=50&mode=hybrid&ext=.pdf&dir=目录&modified_after=时间戳...
+    POST /search   {"query": "文本", "top_k": 50, "mode": "hybrid", "extensions": [".pdf"], ...}
+    GET  /stats    索引规模、目录和缓存统计
+    POST /index    {"directories": ["目录"]}，在后台增量索引，省略时索引所有启用的目录
+    GET  /index    当前索引任务的状态
+"""
+
+import json
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+from threading import Lock, Thread
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+import numpy as np
+from utils.logger import Logger
+
+# 搜索接口接受的过滤参数及其类型
+_FILTERS = {
+    'directory': str,
+    'modified_after': float,
+    'modified_before': float,
+    'min_size': int,
+    'max_size': int,
+}
+
+
+class QueryEmbeddingBatcher:
+    """
+    跨请求拼批的查询编码器
+
+    第一个请求到达后最多再等待 max_delay 秒，期间到达的其他查询与它拼成一批，
+    一次前向计算完成后把向量分别交还给各请求线程。单个请求的额外延迟不超过 max_delay。
+    """
+
+    def __init__(self, embedding_service, max_batch_size: int = 32, max_delay: float = 0.005):
+        """
+        Args:
+            embedding_service: 嵌入服务实例
+            max_batch_size: 每批最多编码的查询数
+            max_delay: 凑批的最长等待时间，单位秒
+        """
+        self.logger = Logger.get_logger(__name__)
+        self.embedding_service = embedding_service
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.batches = 0
+        self.queries = 0
+        self._queue: Queue = Queue()
+        self._thread = Thread(target=self._run, name="query-embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def encode(self, query: str) -> np.ndarray:
+        """编码单个查询（阻塞到所在批次编码完成）"""
+        future: Future = Future()
+        self._queue.put((query, future))
+        return future.result()
+
+    def _run(self):
+        while True:
+            batch: List[Tuple[str, Future]] = [self._queue.get()]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except Empty:
+                    break
+
+            try:
+                vectors = self.embedding_service.encode([query for query, _ in batch], use_cache=False)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.queries += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                future.set_result(vector)
+
+    def stats(self) -> Dict:
+        """拼批统计"""
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "average_batch_size": self.queries / self.batches if self.batches else 0.0
+        }
+
+
+class IndexingJob:
+    """后台索引任务，同一时刻只运行一个"""
+
+    def __init__(self, search_service):
+        self.logger = Logger.get_logger(__name__)
+        self.search_service = search_service
+        self.lock = Lock()
+        self.status = {"state": "idle"}
+
+    def start(self, directories: Optional[List[str]] = None) -> bool:
+        """启动索引任务，已有任务运行时返回 False"""
+        with self.lock:
+            if self.status["state"] == "running":
+                return False
+            self.status = {"state": "running", "directories": directories,
+                           "completed": 0, "total": 0, "started_at": time.time()}
+        Thread(target=self._run, args=(directories,), name="http-indexing", daemon=True).start()
+        return True
+
+    def _run(self, directories: Optional[List[str]]):
+        try:
+            self.search_service.index_directories(directories, progress_callback=self._on_progress)
+            self._update(state="finished", finished_at=time.time())
+        except Exception as e:
+            self.logger.error("后台索引失败: %s", str(e))
+            self._update(state="failed", error=str(e), finished_at=time.time())
+
+    def _on_progress(self, completed: int, total: int):
+        self._update(completed=completed, total=total)
+
+    def _update(self, **values):
+        with self.lock:
+            self.status = dict(self.status, **values)
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return dict(self.status)
+
+
+class SearchRequestHandler(BaseHTTPRequestHandler):
+    """JSON 请求处理，服务对象通过 self.server 访问"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/search':
+            params = parse_qs(url.query)
+            request = {key: values[-1] for key, values in params.items() if key != 'ext'}
+            request['query'] = request.pop('q', request.get('query', ''))
+            if 'ext' in params:
+                request['extensions'] = params['ext']
+            self._search(request)
+        elif url.path == '/stats':
+            self._send(200, self.server.stats())
+        elif url.path == '/index':
+            self._send(200, self.server.indexing.get_status())
+        else:
+            self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            body = json.loads(self.rfile.read(length) or b'{}')
+        except (ValueError, UnicodeDecodeError):
+            self._send(400, {"error": "请求体不是有效的 JSON"})
+            return
+        if url.path == '/search':
+            self._search(body)
+        elif url.path == '/index':
+            if self.server.indexing.start(body.get('directories')):
+                self._send(202, self.server.indexing.get_status())
+            else:
+                self._send(409, {"error": "已有索引任务在运行", **self.server.indexing.get_status()})
+        else:
+            self._send(404, {"error": "not found"})
+
+    def _search(self, request: Dict):
+        query = str(request.get('query') or '').strip()
+        if not query:
+            self._send(400, {"error": "缺少查询文本"})
+            return
+        try:
+            kwargs = {key: cast(request[key]) for key, cast in _FILTERS.items()
+                      if request.get(key) not in (None, '')}
+            extensions = request.get('extensions')
+            if isinstance(extensions, str):
+                extensions = extensions.split(',')
+            started = time.perf_counter()
+            results = self.server.search_service.search(
+                query, int(request.get('top_k', 50)),
+                extensions=extensions or None, mode=request.get('mode') or None, **kwargs)
+        except (TypeError, ValueError) as e:
+            self._send(400, {"error": f"参数错误: {e}"})
+            return
+        except Exception as e:
+            self.server.logger.error("搜索失败: %s", str(e))
+            self._send(500, {"error": str(e)})
+            return
+        self._send(200, {"query": query, "took_ms": round((time.perf_counter() - started) * 1000, 2),
+                         "results": results})
+
+    def _send(self, status: int, payload: Dict):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        self.server.logger.debug("%s - %s", self.address_string(), format % args)
+
+
+class SearchServer(ThreadingHTTPServer):
+    """
+    本地搜索服务
+
+    默认只监听 127.0.0.1；接口没有鉴权，不应直接暴露到网络上。
+    """
+
+    daemon_threads = True
+
+    def __init__(self, search_service, host: str = "127.0.0.1", port: int = 8765,
+                 batch_size: int = 32, batch_delay: float = 0.005):
+        """
+        Args:
+            search_service: 搜索服务实例
+            host: 监听地址
+            port: 监听端口
+            batch_size: 查询编码每批最多拼接的查询数
+            batch_delay: 查询编码凑批的最长等待时间，单位秒
+        """
+        super().__init__((host, port), SearchRequestHandler)
+        self.logger = Logger.get_logger(__name__)
+        self.search_service = search_service
+        self.batcher = QueryEmbeddingBatcher(search_service.embedding_service, batch_size, batch_delay)
+        search_service.query_encoder = self.batcher.encode
+        self.indexing = IndexingJob(search_service)
+
+    def stats(self) -> Dict:
+        stats = self.search_service.get_stats()
+        stats['query_batching'] = self.batcher.stats()
+        stats['indexing'] = self.indexing.get_status()
+        return stats
+
+    def serve_forever(self, poll_interval: float = 0.5):
+        host, port = self.server_address[:2]
+        self.logger.info("搜索服务已启动: http://%s:%d", host, port)
+        super().serve_forever(poll_interval)
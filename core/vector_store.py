@@ -1,46 +1,176 @@
 import faiss
 import sqlite3
 import numpy as np
-from typing import List, Dict, Tuple, Optional
+from typing import List, Dict, Set, Tuple, Optional
 import json
 import os
+import re
 from utils.logger import Logger
+from .index_segments import SegmentedIndex, reconstruct_all
+from .index_shards import ShardedIndex
+from .fusion import reciprocal_rank_fusion, weighted_fusion
 from queue import Queue
-from threading import Lock
+from threading import Event, Lock, Thread
 import tempfile
+import weakref
+from datetime import datetime
 
 class VectorStore:
-    def __init__(self, dimension: int = 384, index_file: str = "faiss.index"):
+    def __init__(self, dimension: int = 384, index_file: str = "faiss.index",
+                 index_factory: str = "Flat", nprobe: int = 16, ef_search: int = 64,
+                 promote_threshold: int = 100000, max_train_size: int = 200000,
+                 mmap: bool = False, lazy_load: bool = False, load_wait_timeout: float = 10.0,
+                 compact_ratio: float = 0.2, compact_min_vectors: int = 10000):
         """
         初始化向量存储
         
         Args:
             dimension: 向量维度
             index_file: FAISS索引文件路径
+            index_factory: FAISS index_factory 描述串，如 "Flat"、"IVF4096,PQ48"、"HNSW32"
+            nprobe: IVF类索引搜索时探查的聚类数
+            ef_search: HNSW类索引搜索时的候选队列长度
+            promote_threshold: 向量数达到该值时由暴力索引升级为 index_factory 指定的索引
+            max_train_size: 训练近似索引时最多使用的样本向量数
+            mmap: 以内存映射方式打开索引文件，向量数据按需从磁盘换入，多个进程共享页缓存
+                （需要 faiss 1.11 及以上版本的 IO_FLAG_MMAP_IFC，旧版本退回完整读入）
+            lazy_load: 在后台线程中加载索引，构造函数立即返回
+            load_wait_timeout: 索引尚未加载完成时，搜索最多等待的秒数，超时返回空结果
+            compact_ratio: 增量段中的向量数或删除数超过基础段的该比例时在后台合并
+            compact_min_vectors: 增量向量数低于该值时不因比例触发合并
         """
         self.logger = Logger.get_logger(__name__)
-        self.logger.info("初始化向量存储，维度: %d, 索引文件: %s", dimension, index_file)
+        self.logger.info("初始化向量存储，维度: %d, 索引文件: %s, 索引类型: %s",
+                         dimension, index_file, index_factory)
         self.index_file = index_file
+        self.shard_dir = os.path.join(os.path.dirname(os.path.abspath(index_file)), "shards")
         self.dimension = dimension
+        self.index_factory = index_factory
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.promote_threshold = promote_threshold
+        self.max_train_size = max_train_size
+        self.mmap = mmap
+        self.load_wait_timeout = load_wait_timeout
+        self.compact_ratio = compact_ratio
+        self.compact_min_vectors = compact_min_vectors
         self.db_lock = Lock()
+        self._index = None
+        self._index_ready = Event()
+        # 索引内容或可搜索范围每次变化时加一，用作搜索结果缓存的失效标记
+        self.generation = 0
+        
+        # 连接数据库
+        self._setup_database()
+        self._init_next_id()
         
         # 加载FAISS索引
-        if os.path.exists(index_file):
-            try:
-                self.index = faiss.read_index(index_file)
-                self.logger.info("已加载现有索引，包含 %d 个向量", self.index.ntotal)
-            except Exception as e:
-                self.logger.error("加载索引失败: %s，创建新索引", str(e))
-                self.index = faiss.IndexFlatL2(dimension)
+        if lazy_load:
+            Thread(target=self._load_index, name="faiss-index-loader", daemon=True).start()
         else:
-            self.index = faiss.IndexFlatL2(dimension)
+            self._load_index()
             
-        # 连接数据库
-        self._setup_database()
+    @property
+    def index(self) -> ShardedIndex:
+        """目录分片索引，后台加载尚未完成时等待加载结束"""
+        self._index_ready.wait()
+        return self._index
+        
+    @index.setter
+    def index(self, value: ShardedIndex):
+        self._index = value
+        
+    def is_index_ready(self) -> bool:
+        """索引是否已加载完成"""
+        return self._index_ready.is_set()
+        
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """等待索引加载完成，返回是否已完成"""
+        return self._index_ready.wait(timeout)
+        
+    def _load_index(self):
+        """加载各分片的基础段和增量段（可能在后台线程中执行），完成后唤醒等待索引的调用方"""
+        started = datetime.now()
+        # 使用独立连接读取目录表：写入方持有 db_lock 等待索引加载，这里不能再申请 db_lock
+        conn = sqlite3.connect('documents.db')
+        try:
+            create_shard = weakref.WeakMethod(self._create_shard)
+            self._index = ShardedIndex(lambda key: create_shard()(key))
+            for path, enabled in conn.execute('SELECT path, enabled FROM directories'):
+                self._index.add_shard(path, bool(enabled))
+            self._index.rebalance(lambda ids: self._paths_by_id(conn.cursor(), ids))
+            self.logger.info("已加载现有索引，%d 个分片，包含 %d 个向量，耗时 %.2f 秒%s",
+                             len(self._index.shards), self._index.ntotal,
+                             (datetime.now() - started).total_seconds(),
+                             "（内存映射）" if self.mmap else "")
+        except Exception as e:
+            self.logger.error("加载索引失败: %s", str(e))
+            if self._index is None:
+                # 分片无法加载时退回空索引，保证界面仍可使用
+                new_index = weakref.WeakMethod(self._new_index)
+                shard_file = weakref.WeakMethod(self._shard_file)
+                self._index = ShardedIndex(lambda key: new_index()(shard_file()(key)))
+        finally:
+            conn.close()
+            # 索引中可能有数据库里没有的ID（例如上次异常退出），新ID需要避开
+            ids = self._index.ids()
+            if len(ids):
+                self._next_id = max(self._next_id, int(ids.max()) + 1)
+            self._bump_generation()
+            self._index_ready.set()
+            
+    def _shard_file(self, key: str) -> str:
+        """分片的基础段文件：默认分片沿用 index_file，目录分片保存在 shards/ 下"""
+        if key == ShardedIndex.DEFAULT:
+            return self.index_file
+        return ShardedIndex.shard_file(self.shard_dir, key)
+        
+    def _create_shard(self, key: str) -> SegmentedIndex:
+        """创建分片并加载已有的基础段和增量段"""
+        index_file = self._shard_file(key)
+        base = None
+        try:
+            if os.path.exists(index_file):
+                base = self._read_index_file(index_file)
+        except Exception as e:
+            self.logger.error("加载索引失败: %s，创建新索引: %s", index_file, str(e))
+        os.makedirs(os.path.dirname(os.path.abspath(index_file)), exist_ok=True)
+        shard = self._new_index(index_file, base)
+        shard.load_segments()
+        return shard
+        
+    @staticmethod
+    def _paths_by_id(cursor, ids) -> Dict[int, str]:
+        """查询向量ID对应的文件路径"""
+        paths = {}
+        ids = [int(i) for i in ids]
+        for start in range(0, len(ids), 10000):
+            cursor.execute('''
+            SELECT faiss_id, file_path FROM documents
+            WHERE faiss_id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(ids[start:start + 10000]),))
+            paths.update(cursor.fetchall())
+        return paths
+        
+    def _read_index_file(self, path: str):
+        """读取基础段文件，开启 mmap 时向量数据直接映射自文件（映射的数据只读，基础段不会被修改）"""
+        if self.mmap and not hasattr(faiss, 'IO_FLAG_MMAP_IFC'):
+            self.logger.warning("faiss %s 不支持内存映射读取索引（需要 1.11 及以上版本），改为完整读入",
+                                getattr(faiss, '__version__', '未知版本'))
+        elif self.mmap:
+            try:
+                index = faiss.read_index(path, faiss.IO_FLAG_MMAP_IFC)
+                # 旧版索引需要重建ID映射，映射的只读数据无法直接复用
+                if isinstance(index, faiss.IndexIDMap2):
+                    return self._prepare_loaded_index(index)
+            except RuntimeError as e:
+                self.logger.warning("内存映射打开索引失败: %s，改为完整读入", str(e))
+        return self._prepare_loaded_index(faiss.read_index(path))
         
     def _setup_database(self):
         """在当前线程中设置数据库连接"""
-        self.conn = sqlite3.connect('documents.db')
+        # 索引线程与界面线程共用同一连接，由 db_lock 保证串行访问
+        self.conn = sqlite3.connect('documents.db', check_same_thread=False)
         cursor = self.conn.cursor()
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS documents (
@@ -53,6 +183,8 @@ class VectorStore:
             UNIQUE(file_path, chunk_index)
         )
         ''')
+        # 搜索结果按 faiss_id 回查文档内容
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_faiss_id ON documents(faiss_id)')
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS directories (
             path TEXT PRIMARY KEY,
@@ -61,21 +193,268 @@ class VectorStore:
             doc_count INTEGER DEFAULT 0
         )
         ''')
+        # 文件清单：记录已索引文件的大小、修改时间和内容哈希，用于增量索引
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS files (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            content_hash TEXT NOT NULL,
+            chunk_count INTEGER DEFAULT 0,
+            indexed_at TEXT,
+            ext TEXT
+        )
+        ''')
+        # 旧版本的文件清单没有扩展名列，补充并按路径回填
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(files)')}
+        if 'ext' not in columns:
+            cursor.execute('ALTER TABLE files ADD COLUMN ext TEXT')
+            paths = [row[0] for row in cursor.execute('SELECT path FROM files')]
+            cursor.executemany('UPDATE files SET ext = ? WHERE path = ?',
+                               [(self._file_ext(path), path) for path in paths])
+        # 索引任务：持久化的任务游标，程序退出或崩溃后从中断处继续
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS index_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            directories TEXT NOT NULL,
+            status TEXT NOT NULL,
+            scan_completed INTEGER DEFAULT 0,
+            created_at TEXT,
+            updated_at TEXT,
+            checkpointed_at TEXT
+        )
+        ''')
+        # 任务中已进入处理队列的文件，done 为 1 表示处理结果已随检查点保存
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS index_job_files (
+            job_id INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            done INTEGER DEFAULT 0,
+            PRIMARY KEY (job_id, path)
+        )
+        ''')
+        # 搜索过滤条件使用的列
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_ext ON files(ext)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_mtime ON files(mtime)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_size ON files(size)')
+        self._setup_fts(cursor)
         self.conn.commit()
 
+    def _setup_fts(self, cursor):
+        """
+        创建与 documents.chunk_text 同步的 FTS5 全文索引
+        
+        使用外部内容表，由触发器随 documents 的增删改同步；优先使用 trigram 分词器，
+        中文和零件号、合同编号之类的标识符都可以按子串匹配。SQLite 不支持 FTS5 时关闭全文检索。
+        """
+        self._fts_enabled = False
+        self._fts_trigram = False
+        # INSERT OR REPLACE 删除旧行时只有开启递归触发器才会触发删除触发器
+        cursor.execute('PRAGMA recursive_triggers = ON')
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'documents_fts'")
+        row = cursor.fetchone()
+        try:
+            if row is None:
+                try:
+                    cursor.execute('''
+                    CREATE VIRTUAL TABLE documents_fts USING fts5(
+                        chunk_text, content='documents', content_rowid='id', tokenize='trigram'
+                    )
+                    ''')
+                except sqlite3.OperationalError:
+                    # SQLite 3.34 之前没有 trigram 分词器
+                    cursor.execute('''
+                    CREATE VIRTUAL TABLE documents_fts USING fts5(
+                        chunk_text, content='documents', content_rowid='id'
+                    )
+                    ''')
+                # 为已有的分块建立全文索引
+                cursor.execute("INSERT INTO documents_fts(documents_fts) VALUES ('rebuild')")
+                cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'documents_fts'")
+                row = cursor.fetchone()
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS documents_fts_insert AFTER INSERT ON documents BEGIN
+                INSERT INTO documents_fts(rowid, chunk_text) VALUES (new.id, new.chunk_text);
+            END
+            ''')
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS documents_fts_delete AFTER DELETE ON documents BEGIN
+                INSERT INTO documents_fts(documents_fts, rowid, chunk_text) VALUES ('delete', old.id, old.chunk_text);
+            END
+            ''')
+            # 只有分块文本变化时才需要更新全文索引，文件移动只改写 file_path；旧版本的触发器对任何更新都生效
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'documents_fts_update'")
+            trigger = cursor.fetchone()
+            if trigger is not None and 'UPDATE OF' not in trigger[0]:
+                cursor.execute('DROP TRIGGER documents_fts_update')
+            cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS documents_fts_update AFTER UPDATE OF chunk_text ON documents BEGIN
+                INSERT INTO documents_fts(documents_fts, rowid, chunk_text) VALUES ('delete', old.id, old.chunk_text);
+                INSERT INTO documents_fts(rowid, chunk_text) VALUES (new.id, new.chunk_text);
+            END
+            ''')
+        except sqlite3.OperationalError as e:
+            self.logger.warning("SQLite 不支持 FTS5，关闭全文检索: %s", str(e))
+            return
+        self._fts_enabled = True
+        self._fts_trigram = 'trigram' in row[0]
+
+    @staticmethod
+    def _file_ext(path: str) -> str:
+        """文件扩展名（小写，带点），用于按类型过滤"""
+        return os.path.splitext(path)[1].lower()
+
+    def _new_index(self, index_file: str, base=None) -> SegmentedIndex:
+        """
+        创建单个分片的分段索引
+        
+        向量使用稳定的64位ID（即 documents.faiss_id），删除和替换不会改变其他向量的ID。
+        新增向量先进入暴力检索的增量段，合并时由 _build_base 构建基础段。
+        """
+        # 通过弱引用回调，避免与分段索引形成引用环而推迟 __del__ 中的保存
+        build_base = weakref.WeakMethod(self._build_base)
+        read_base = weakref.WeakMethod(self._read_index_file)
+        return SegmentedIndex(
+            index_file, self.dimension, base=base,
+            build_base=lambda vectors, ids: build_base()(vectors, ids),
+            read_base=lambda path: read_base()(path),
+            reopen_base=self.mmap,
+            compact_ratio=self.compact_ratio,
+            compact_min_vectors=self.compact_min_vectors
+        )
+        
+    def _prepare_loaded_index(self, index):
+        """
+        处理从文件加载的索引：旧版本保存的索引没有ID映射，
+        向量在索引中的位置就是 faiss_id，按位置包装为 IndexIDMap2。
+        """
+        if not isinstance(index, faiss.IndexIDMap2):
+            self.logger.info("为旧版索引建立ID映射，包含 %d 个向量", index.ntotal)
+            vectors = reconstruct_all(index)
+            empty = faiss.clone_index(index)
+            empty.reset()
+            wrapped = faiss.IndexIDMap2(empty)
+            if index.ntotal > 0:
+                wrapped.add_with_ids(vectors, np.arange(index.ntotal, dtype=np.int64))
+            index = wrapped
+        self._tune_index(index)
+        return index
+        
+
+    def _init_next_id(self):
+        """根据数据库中已用的最大ID确定下一个可分配的ID（加载索引后再与索引中的ID比较）"""
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT MAX(faiss_id) FROM documents')
+        max_db_id = cursor.fetchone()[0]
+        self._next_id = max_db_id + 1 if max_db_id is not None else 0
+        if self._index_ready.is_set():
+            ids = self._index.ids()
+            if len(ids):
+                self._next_id = max(self._next_id, int(ids.max()) + 1)
+        
+    def _allocate_ids(self, count: int) -> np.ndarray:
+        """分配一段新的向量ID（调用方需持有 db_lock）"""
+        ids = np.arange(self._next_id, self._next_id + count, dtype=np.int64)
+        self._next_id += count
+        return ids
+        
+    def _tune_index(self, index=None):
+        """为近似索引设置搜索参数 nprobe / efSearch，默认作用于所有分片的基础段"""
+        if index is None:
+            for shard in self._index.all_shards():
+                self._tune_index(shard.base)
+            return
+        try:
+            faiss.extract_index_ivf(index).nprobe = self.nprobe
+        except RuntimeError:
+            pass  # 非IVF索引
+        inner = faiss.downcast_index(index.index)
+        if hasattr(inner, 'hnsw'):
+            inner.hnsw.efSearch = self.ef_search
+            
+    def set_search_params(self, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+        """调整近似索引的搜索参数，在召回率和延迟之间权衡"""
+        with self.db_lock:
+            if nprobe is not None:
+                self.nprobe = nprobe
+            if ef_search is not None:
+                self.ef_search = ef_search
+            self._tune_index()
+            self._bump_generation()
+            
+    def _bump_generation(self):
+        """索引内容、可搜索的目录或搜索参数变化后调用，使之前缓存的搜索结果失效"""
+        self.generation += 1
+            
+    def _build_base(self, vectors: np.ndarray, ids: np.ndarray):
+        """
+        合并增量段时构建新的基础段
+        
+        向量数达到 promote_threshold 后构建 index_factory 指定的近似索引，
+        需要训练的索引（IVF、PQ等）用最多 max_train_size 个样本重新训练；否则使用暴力索引。
+        """
+        ntotal = len(ids)
+        if self.index_factory.strip().upper() == "FLAT" or ntotal < self.promote_threshold:
+            base = faiss.IndexFlatL2(self.dimension)
+        else:
+            self.logger.info(f"向量数达到 {ntotal}，基础段使用 {self.index_factory}")
+            base = faiss.index_factory(self.dimension, self.index_factory, faiss.METRIC_L2)
+            if not base.is_trained:
+                sample = vectors
+                if ntotal > self.max_train_size:
+                    rng = np.random.default_rng(0)
+                    sample = vectors[rng.choice(ntotal, self.max_train_size, replace=False)]
+                base.train(sample)
+        index = faiss.IndexIDMap2(base)
+        if ntotal:
+            index.add_with_ids(vectors, ids)
+        self._tune_index(index)
+        return index
+        
+    def _maybe_compact(self):
+        """增量足够多时在后台合并增量段"""
+        self.index.compact_if_needed()
+            
     def add_document_batch(self, documents: List[Dict]):
-        """批量添加文档，在同一个事务中处理"""
+        """
+        批量添加文档，在同一个事务中处理
+        
+        已索引过的文件原地替换：沿用原有分块的 faiss_id，只为新增分块分配ID，
+        多余的旧分块连同向量一起删除，代价与变化的分块数成正比。
+        """
         with self.db_lock:
             cursor = self.conn.cursor()
             try:
                 cursor.execute('BEGIN TRANSACTION')
                 
-                start_idx = self.index.ntotal
                 all_embeddings = []
+                all_ids = []
+                all_paths = []
+                stale_ids = []
                 
                 for doc in documents:
                     embeddings = doc['embeddings']
+                    chunk_count = len(doc['chunks'])
+                    
+                    # 沿用该文件已有分块的ID
+                    cursor.execute(
+                        'SELECT chunk_index, faiss_id FROM documents WHERE file_path = ?',
+                        (doc['file_path'],)
+                    )
+                    existing = dict(cursor.fetchall())
+                    stale_ids.extend(existing.values())
+                    cursor.execute(
+                        'DELETE FROM documents WHERE file_path = ? AND chunk_index >= ?',
+                        (doc['file_path'], chunk_count)
+                    )
+                    
+                    new_ids = iter(self._allocate_ids(
+                        sum(1 for i in range(chunk_count) if i not in existing)))
+                    doc_ids = [existing[i] if i in existing else int(next(new_ids))
+                               for i in range(chunk_count)]
                     all_embeddings.extend(embeddings)
+                    all_ids.extend(doc_ids)
+                    all_paths.extend([doc['file_path']] * chunk_count)
                     
                     for i, chunk in enumerate(doc['chunks']):
                         cursor.execute('''
@@ -87,20 +466,40 @@ class VectorStore:
                             i,
                             chunk,
                             json.dumps(doc.get('metadata', {})),
-                            start_idx + i
+                            doc_ids[i]
                         ))
                     
-                    start_idx += len(doc['chunks'])
+                    # 更新文件清单
+                    file_info = doc.get('file_info')
+                    if file_info:
+                        cursor.execute('''
+                        INSERT OR REPLACE INTO files
+                        (path, size, mtime, content_hash, chunk_count, indexed_at, ext)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ''', (
+                            doc['file_path'],
+                            file_info['size'],
+                            file_info['mtime'],
+                            file_info['content_hash'],
+                            chunk_count,
+                            datetime.now().isoformat(),
+                            self._file_ext(doc['file_path'])
+                        ))
                 
-                # 批量添加向量到FAISS
+                # 先移除被替换的旧向量，再批量添加新向量
+                self.index.remove_ids(stale_ids)
                 if all_embeddings:
-                    self.index.add(np.array(all_embeddings))
+                    self.index.add_with_ids(np.array(all_embeddings, dtype=np.float32),
+                                            np.array(all_ids, dtype=np.int64), all_paths)
                 
                 cursor.execute('COMMIT')
-                self.logger.info(f"批量添加完成，新增 {len(all_embeddings)} 个向量")
+                self._bump_generation()
+                self._maybe_compact()
+                self.logger.info(f"批量添加完成，写入 {len(all_embeddings)} 个向量，替换 {len(stale_ids)} 个旧向量")
                 
             except Exception as e:
                 cursor.execute('ROLLBACK')
+                self._bump_generation()  # 索引可能已部分更新
                 self.logger.error(f"批量添加失败: {str(e)}")
                 raise
 
@@ -114,132 +513,613 @@ class VectorStore:
         
         with self.db_lock:  # 使用锁确保线程安全
             cursor = self.conn.cursor()
+            faiss_ids = []
             try:
                 # 开始事务
                 cursor.execute('BEGIN TRANSACTION')
                 
-                # 获取当前FAISS索引的大小作为起始ID
-                start_idx = self.index.ntotal
+                # 为新向量分配稳定ID
+                faiss_ids = self._allocate_ids(len(chunks))
                 
                 # 添加向量到FAISS
-                self.index.add(embeddings)
+                self.index.add_with_ids(np.asarray(embeddings, dtype=np.float32), faiss_ids,
+                                        [file_path] * len(chunks))
                 
                 # 添加文档信息到SQLite
                 for i, chunk in enumerate(chunks):
                     cursor.execute('''
                     INSERT OR REPLACE INTO documents (file_path, chunk_index, chunk_text, metadata, faiss_id)
                     VALUES (?, ?, ?, ?, ?)
-                    ''', (file_path, i, chunk, json.dumps(metadata or {}), start_idx + i))
+                    ''', (file_path, i, chunk, json.dumps(metadata or {}), int(faiss_ids[i])))
                     
                 # 提交事务
                 self.conn.commit()
+                self._bump_generation()
+                self._maybe_compact()
                 self.logger.info(f"添加文档成功，FAISS索引中的向量数量: {self.index.ntotal}")
                 
             except Exception as e:
                 # 回滚事务
                 cursor.execute('ROLLBACK')
                 # 回滚FAISS索引 - 移除刚添加的向量
-                if self.index.ntotal > start_idx:
-                    self._rollback_faiss(start_idx)
+                self._rollback_faiss(faiss_ids)
+                self._bump_generation()
                 self.logger.error(f"添加文档失败: {str(e)}")
                 raise
 
-    def search(self, query_vector: np.ndarray, top_k: int = 50) -> List[Tuple[str, float, Dict]]:
-        """搜索最相似的文档"""
+    def get_file_record(self, file_path: str) -> Optional[Dict]:
+        """获取单个文件的清单记录"""
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+            SELECT path, size, mtime, content_hash, chunk_count
+            FROM files WHERE path = ?
+            ''', (file_path,))
+            row = cursor.fetchone()
+        if not row:
+            return None
+        return {
+            'path': row[0],
+            'size': row[1],
+            'mtime': row[2],
+            'content_hash': row[3],
+            'chunk_count': row[4]
+        }
+
+    def get_file_records(self, directory: str) -> Dict[str, Dict]:
+        """获取目录下所有文件的清单记录，以路径为键"""
+        prefix = os.path.join(directory, '')
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            # 使用范围查询以利用主键索引，同时避免 LIKE 对路径中 % 和 _ 的误匹配
+            cursor.execute('''
+            SELECT path, size, mtime, content_hash, chunk_count
+            FROM files WHERE path >= ? AND path < ?
+            ''', (prefix, prefix + '\uffff'))
+            rows = cursor.fetchall()
+        return {
+            row[0]: {
+                'path': row[0],
+                'size': row[1],
+                'mtime': row[2],
+                'content_hash': row[3],
+                'chunk_count': row[4]
+            }
+            for row in rows
+        }
+
+    def get_file_sizes(self) -> Set[int]:
+        """获取清单中出现过的所有文件大小，用于快速排除不可能是移动的新文件"""
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT DISTINCT size FROM files')
+            return {row[0] for row in cursor.fetchall()}
+
+    def touch_file_record(self, file_path: str, size: int, mtime: float):
+        """内容未变化时仅更新文件清单中的大小和修改时间"""
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(
+                'UPDATE files SET size = ?, mtime = ? WHERE path = ?',
+                (size, mtime, file_path)
+            )
+            self.conn.commit()
+            self._bump_generation()  # 修改时间和大小参与搜索过滤
+
+    def relink_files(self, moves: List[Tuple[str, str]],
+                     signatures: Optional[Dict[str, Dict]] = None) -> List[Tuple[str, str]]:
+        """
+        文件移动或重命名后原地改写分块和清单中的路径，沿用原有的向量，不重新解析和编码
+        
+        目标路径上原有的索引数据视为已被覆盖而删除；向量按新路径移到所属目录的分片。
+        
+        Args:
+            moves: (原路径, 新路径) 列表，按顺序处理，支持连续移动
+            signatures: 新路径的 {"size", "mtime"}，提供时同时更新清单中的 stat 信息
+                        （内容已按哈希确认一致时使用；否则保留原值，由后续的变化检查决定是否重新索引）
+            
+        Returns:
+            实际改写的 (原路径, 新路径) 列表，原路径没有清单记录的移动被跳过
+        """
+        signatures = signatures or {}
+        relinked = []
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN TRANSACTION')
+                for old_path, new_path in moves:
+                    if old_path == new_path:
+                        continue
+                    cursor.execute('SELECT 1 FROM files WHERE path = ?', (old_path,))
+                    if cursor.fetchone() is None:
+                        continue
+                    # 目标路径上原有的文件已被覆盖
+                    self._remove_files_locked(cursor, [new_path])
+                    cursor.execute('DELETE FROM files WHERE path = ?', (new_path,))
+                    
+                    cursor.execute('SELECT faiss_id FROM documents WHERE file_path = ?', (old_path,))
+                    faiss_ids = [row[0] for row in cursor.fetchall()]
+                    cursor.execute('UPDATE documents SET file_path = ? WHERE file_path = ?', (new_path, old_path))
+                    cursor.execute('UPDATE files SET path = ?, ext = ? WHERE path = ?',
+                                   (new_path, self._file_ext(new_path), old_path))
+                    signature = signatures.get(new_path)
+                    if signature:
+                        cursor.execute('UPDATE files SET size = ?, mtime = ? WHERE path = ?',
+                                       (signature['size'], signature['mtime'], new_path))
+                    self.index.relocate(faiss_ids, new_path)
+                    relinked.append((old_path, new_path))
+                cursor.execute('COMMIT')
+            except Exception as e:
+                cursor.execute('ROLLBACK')
+                self.logger.error(f"改写文件路径失败: {str(e)}")
+                raise
+            finally:
+                self._bump_generation()
+        if relinked:
+            self.logger.info("已改写 %d 个移动文件的路径，沿用原有向量", len(relinked))
+        return relinked
+
+    def remove_files(self, file_paths: List[str]):
+        """删除文件的所有分块记录、向量和清单记录"""
+        if not file_paths:
+            return
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute('BEGIN TRANSACTION')
+                removed = self._remove_files_locked(cursor, file_paths)
+                cursor.execute('DELETE FROM files WHERE path IN (SELECT value FROM json_each(?))',
+                               (json.dumps(list(file_paths)),))
+                cursor.execute('COMMIT')
+                self.logger.info(f"已删除 {len(file_paths)} 个文件的索引，移除 {removed} 个向量")
+            except Exception as e:
+                cursor.execute('ROLLBACK')
+                self.logger.error(f"删除文件索引失败: {str(e)}")
+                raise
+
+    def _remove_files_locked(self, cursor, file_paths: List[str]) -> int:
+        """在当前事务中删除文件的分块记录和对应向量（调用方需持有 db_lock）
+        
+        Returns:
+            int: 移除的向量数量
+        """
+        paths_json = json.dumps(list(file_paths))
+        cursor.execute('''
+        SELECT faiss_id FROM documents
+        WHERE file_path IN (SELECT value FROM json_each(?))
+        ''', (paths_json,))
+        removed_ids = [row[0] for row in cursor.fetchall()]
+        if not removed_ids:
+            return 0
+        
+        cursor.execute('''
+        DELETE FROM documents
+        WHERE file_path IN (SELECT value FROM json_each(?))
+        ''', (paths_json,))
+        
+        self.index.remove_ids(removed_ids)
+        self._bump_generation()
+        return len(removed_ids)
+
+    # ---- 索引任务 ----
+
+    def create_index_job(self, directories: List[str]) -> int:
+        """创建索引任务，尚未完成的旧任务标记为已取消，返回任务ID"""
+        now = datetime.now().isoformat()
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+            UPDATE index_jobs SET status = 'cancelled', updated_at = ?
+            WHERE status IN ('running', 'paused')
+            ''', (now,))
+            cursor.execute('''
+            DELETE FROM index_job_files
+            WHERE job_id IN (SELECT id FROM index_jobs WHERE status = 'cancelled')
+            ''')
+            cursor.execute('''
+            INSERT INTO index_jobs (directories, status, created_at, updated_at)
+            VALUES (?, 'running', ?, ?)
+            ''', (json.dumps(list(directories)), now, now))
+            self.conn.commit()
+            return cursor.lastrowid
+
+    def get_index_job(self, job_id: int) -> Optional[Dict]:
+        """获取索引任务及其文件进度"""
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+            SELECT id, directories, status, scan_completed, created_at, updated_at, checkpointed_at,
+                   (SELECT COUNT(*) FROM index_job_files WHERE job_id = index_jobs.id),
+                   (SELECT COUNT(*) FROM index_job_files WHERE job_id = index_jobs.id AND done = 1)
+            FROM index_jobs WHERE id = ?
+            ''', (job_id,))
+            row = cursor.fetchone()
+        if not row:
+            return None
+        return {
+            'id': row[0],
+            'directories': json.loads(row[1]),
+            'status': row[2],
+            'scan_completed': bool(row[3]),
+            'created_at': row[4],
+            'updated_at': row[5],
+            'checkpointed_at': row[6],
+            'total_files': row[7],
+            'completed_files': row[8]
+        }
+
+    def get_unfinished_index_job(self) -> Optional[Dict]:
+        """获取最近一个未完成（运行中被中断或已暂停）的索引任务"""
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+            SELECT id FROM index_jobs WHERE status IN ('running', 'paused')
+            ORDER BY id DESC LIMIT 1
+            ''')
+            row = cursor.fetchone()
+        return self.get_index_job(row[0]) if row else None
+
+    def update_index_job(self, job_id: int, status: Optional[str] = None,
+                         scan_completed: Optional[bool] = None):
+        """更新索引任务状态"""
+        updates = ["updated_at = ?"]
+        values = [datetime.now().isoformat()]
+        if status is not None:
+            updates.append("status = ?")
+            values.append(status)
+        if scan_completed is not None:
+            updates.append("scan_completed = ?")
+            values.append(int(scan_completed))
+        values.append(job_id)
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(f"UPDATE index_jobs SET {', '.join(updates)} WHERE id = ?", values)
+            self.conn.commit()
+
+    def add_index_job_files(self, job_id: int, file_paths: List[str]):
+        """把即将处理的文件加入任务队列（已在队列中的文件保持原状态）"""
+        if not file_paths:
+            return
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.executemany(
+                'INSERT OR IGNORE INTO index_job_files (job_id, path) VALUES (?, ?)',
+                [(job_id, path) for path in file_paths]
+            )
+            self.conn.commit()
+
+    def complete_index_job_files(self, job_id: int, file_paths: List[str], checkpointed_at: str):
+        """检查点保存后，在同一事务中把文件标记为已完成并记录检查点时间"""
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+            UPDATE index_job_files SET done = 1
+            WHERE job_id = ? AND path IN (SELECT value FROM json_each(?))
+            ''', (job_id, json.dumps(list(file_paths))))
+            cursor.execute('UPDATE index_jobs SET checkpointed_at = ?, updated_at = ? WHERE id = ?',
+                           (checkpointed_at, datetime.now().isoformat(), job_id))
+            self.conn.commit()
+
+    def get_index_job_files(self, job_id: int, done: bool = False) -> List[str]:
+        """获取任务中未完成（或已完成）的文件"""
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT path FROM index_job_files WHERE job_id = ? AND done = ?',
+                           (job_id, int(done)))
+            return [row[0] for row in cursor.fetchall()]
+
+    def finish_index_job(self, job_id: int):
+        """任务完成：删除其文件队列，只保留任务记录"""
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('DELETE FROM index_job_files WHERE job_id = ?', (job_id,))
+            cursor.execute("UPDATE index_jobs SET status = 'completed', updated_at = ? WHERE id = ?",
+                           (datetime.now().isoformat(), job_id))
+            self.conn.commit()
+
+    def get_files_indexed_since(self, file_paths: List[str], since: Optional[str]) -> List[str]:
+        """file_paths 中在 since 之后（含）写入清单的文件，since 为空时返回所有有记录的文件"""
+        if not file_paths:
+            return []
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+            SELECT path FROM files
+            WHERE path IN (SELECT value FROM json_each(?)) AND (? IS NULL OR indexed_at >= ?)
+            ''', (json.dumps(list(file_paths)), since, since))
+            return [row[0] for row in cursor.fetchall()]
+
+    def search(self, query_vector: np.ndarray, top_k: int = 50,
+               extensions: Optional[List[str]] = None, directory: Optional[str] = None,
+               modified_after: Optional[float] = None, modified_before: Optional[float] = None,
+               min_size: Optional[int] = None, max_size: Optional[int] = None,
+               match: Optional[str] = None, match_limit: int = 2000) -> List[Tuple[str, float, Dict]]:
+        """
+        搜索最相似的文档
+        
+        过滤条件按文件清单中的元数据筛选，只有已记录在 files 表中的文件参与过滤搜索。
+        
+        Args:
+            query_vector: 查询向量
+            top_k: 返回的结果数
+            extensions: 只搜索这些扩展名的文件，如 [".pdf", "docx"]
+            directory: 只搜索该目录下的文件
+            modified_after / modified_before: 文件修改时间范围（时间戳，含边界）
+            min_size / max_size: 文件大小范围（字节，含边界）
+            match: 关键词预过滤：只在全文检索该文本得到的前 match_limit 个分块中做向量检索
+            match_limit: 关键词预过滤保留的候选分块数
+        """
+        return self._hydrate(self.search_hits(
+            query_vector, top_k, extensions=extensions, directory=directory,
+            modified_after=modified_after, modified_before=modified_before,
+            min_size=min_size, max_size=max_size, match=match, match_limit=match_limit))
+
+    def search_hits(self, query_vector: np.ndarray, top_k: int = 50, match: Optional[str] = None,
+                    match_limit: int = 2000, **filters) -> List[Tuple[int, float]]:
+        """与 search 相同，但只返回按距离排序的 (faiss_id, 距离) 列表，不读取分块内容"""
         self.logger.info("执行搜索，top_k: %d", top_k)
+        if match is not None:
+            candidate_ids = np.array([faiss_id for faiss_id, _ in
+                                      self._lexical_hits(match, match_limit, **filters)], dtype=np.int64)
+        else:
+            candidate_ids = self._filter_ids(**filters)
+        return self._vector_hits(query_vector, top_k, candidate_ids)
+
+    def lexical_search(self, query_text: str, top_k: int = 50, **filters) -> List[Tuple[str, float, Dict]]:
+        """
+        全文检索（FTS5 BM25），结果中的分数为 bm25() 的值（越小越相关）
         
-         #打印index中的向量数量
-        print(f"FAISS索引中的向量数量: {self.index.ntotal}")
+        Args:
+            query_text: 查询文本
+            top_k: 返回的结果数
+            **filters: 与 search 相同的元数据过滤条件
+        """
+        return self._hydrate(self.lexical_hits(query_text, top_k, **filters))
+
+    def lexical_hits(self, query_text: str, top_k: int = 50, **filters) -> List[Tuple[int, float]]:
+        """与 lexical_search 相同，但只返回 (faiss_id, bm25分数) 列表"""
+        return self._lexical_hits(query_text, top_k, **filters)
 
-        #检查数据库状态
-        #self.debug_check_database()
+    def hybrid_search(self, query_vector: np.ndarray, query_text: str, top_k: int = 50,
+                      fusion: str = "rrf", rrf_k: int = 60, vector_weight: float = 0.5,
+                      candidate_pool: int = 100, **filters) -> List[Tuple[str, float, Dict]]:
+        """
+        混合检索：向量检索和全文检索各取 candidate_pool 个候选，融合排序后取 top_k
+        
+        Args:
+            query_vector: 查询向量
+            query_text: 查询文本
+            top_k: 返回的结果数
+            fusion: 融合方式，"rrf"（倒数排名融合）或 "weighted"（归一化分数加权）
+            rrf_k: RRF 的平滑常数
+            vector_weight: 向量检索的权重，关键词检索的权重为 1 - vector_weight（两种融合方式都适用）
+            candidate_pool: 每路检索取回的候选数，不少于 top_k
+            **filters: 与 search 相同的元数据过滤条件
+            
+        Returns:
+            (文件路径, 融合得分, 信息) 列表，得分在 [0, 1] 区间，越大越相关
+        """
+        return self._hydrate(self.hybrid_hits(
+            query_vector, query_text, top_k, fusion=fusion, rrf_k=rrf_k,
+            vector_weight=vector_weight, candidate_pool=candidate_pool, **filters))
 
+    def hybrid_hits(self, query_vector: np.ndarray, query_text: str, top_k: int = 50,
+                    fusion: str = "rrf", rrf_k: int = 60, vector_weight: float = 0.5,
+                    candidate_pool: int = 100, **filters) -> List[Tuple[int, float]]:
+        """与 hybrid_search 相同，但只返回按融合得分排序的 (faiss_id, 得分) 列表"""
+        pool = max(top_k, candidate_pool)
+        candidate_ids = self._filter_ids(**filters)
+        vector_hits = self._vector_hits(query_vector, pool, candidate_ids)
+        lexical_hits = self._lexical_hits(query_text, pool, **filters)
+        if fusion == "weighted":
+            fused = weighted_fusion(vector_hits, lexical_hits, vector_weight)
+        else:
+            fused = reciprocal_rank_fusion(
+                [[faiss_id for faiss_id, _ in vector_hits], [faiss_id for faiss_id, _ in lexical_hits]],
+                k=rrf_k, weights=[2 * vector_weight, 2 * (1.0 - vector_weight)])
+        self.logger.debug("混合检索：向量 %d 个，关键词 %d 个，融合后 %d 个",
+                          len(vector_hits), len(lexical_hits), len(fused))
+        return fused[:top_k]
+
+    def _vector_hits(self, query_vector: np.ndarray, top_k: int,
+                     candidate_ids: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """向量检索，返回按距离排序的 (faiss_id, 距离) 列表"""
+        # 索引仍在后台加载时最多等待 load_wait_timeout 秒，超时返回空结果
+        if not self._index_ready.wait(self.load_wait_timeout):
+            self.logger.warning("FAISS索引仍在加载中，本次搜索返回空结果")
+            return []
+        
         # 检查索引是否为空
         if self.index.ntotal == 0:
             self.logger.warning("FAISS索引为空，无法执行搜索")
             return []
         
+        if candidate_ids is not None and len(candidate_ids) == 0:
+            return []
+        
         # 搜索最相似的向量
-        distances, indices = self.index.search(query_vector.reshape(1, -1), top_k)
+        distances, indices = self.index.search(
+            np.asarray(query_vector, dtype=np.float32).reshape(1, -1), top_k, candidate_ids)
+        return [(int(idx), float(distance))
+                for distance, idx in zip(distances[0], indices[0])
+                if idx >= 0]  # FAISS可能返回-1表示无结果
+
+    @staticmethod
+    def _fts_query(text: str, trigram: bool) -> str:
+        """
+        把用户输入转换为 FTS5 查询：按空白切分的各词作为短语以 OR 连接
         
-        results = []
-        cursor = self.conn.cursor()
+        编号之类带连字符的词整体作为短语，保证精确匹配；trigram 分词器只能匹配至少三个字符的短语，
+        中文没有空格分隔，连续的汉字拆成重叠的三字短语，否则整句必须原样出现才能命中。
+        """
+        cjk = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]')
+        phrases = []
+        for word in text.split():
+            word = re.sub(r'^\W+|\W+$', '', word)
+            if trigram and cjk.search(word):
+                for token in re.findall(r'\w+', word):
+                    if len(token) > 3 and cjk.search(token):
+                        phrases.extend(token[i:i + 3] for i in range(len(token) - 2))
+                    elif len(token) >= 3:
+                        phrases.append(token)
+            elif word and (not trigram or len(word) >= 3):
+                phrases.append(word)
+        unique = dict.fromkeys(phrases)
+        return ' OR '.join('"' + phrase.replace('"', '""') + '"' for phrase in unique)
+
+    def _lexical_hits(self, query_text: str, top_k: int, **filters) -> List[Tuple[int, float]]:
+        """全文检索，返回按 bm25 排序的 (faiss_id, bm25分数) 列表，只包含参与搜索的分片中的向量"""
+        if not self._fts_enabled:
+            return []
+        fts_query = self._fts_query(query_text, self._fts_trigram)
+        if not fts_query:
+            return []
+        conditions, params = self._filter_conditions(**filters)
+        join = 'JOIN files f ON f.path = d.file_path' if conditions else ''
+        where = ''.join(' AND ' + condition for condition in conditions)
         
-        for i, (distance, idx) in enumerate(zip(distances[0], indices[0])):
-            if idx < 0:  # FAISS可能返回-1表示无结果
-                continue
-                
-            #打印idx的值
-            print(f"idx的值: {idx}")
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(f'''
+                SELECT d.faiss_id, bm25(documents_fts) AS score
+                FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid {join}
+                WHERE documents_fts MATCH ?{where}
+                ORDER BY score LIMIT ?
+                ''', [fts_query] + params + [top_k])
+                hits = [(row[0], row[1]) for row in cursor.fetchall()]
+            except sqlite3.OperationalError as e:
+                self.logger.warning("全文检索失败: %s", str(e))
+                return []
+        
+        # 停用目录的分块不参与搜索
+        if hits and self._index_ready.wait(self.load_wait_timeout):
+            searchable = self.index.searchable_mask(np.array([faiss_id for faiss_id, _ in hits], dtype=np.int64))
+            hits = [hit for hit, keep in zip(hits, searchable) if keep]
+        return hits
 
-            # 使用faiss_id查询对应的文档信息
-            print(f"正在执行SQL查询: faiss_id = {idx}")
-            cursor.execute('''
-            SELECT COUNT(*) FROM documents
-            ''')
-            total_count = cursor.fetchone()[0]
-            print(f"数据库中总记录数: {total_count}")
-
-            #查询faiss_id等于76的值，查询语句中不用占位符，直接写76
-            # cursor.execute('''
-            # SELECT file_path, chunk_text, metadata FROM documents
-            # WHERE faiss_id = 76
-            # ''')
-      
-            # 先拼接SQL语句
-            sql = f'''
-            SELECT file_path, chunk_text, metadata FROM documents
-            WHERE faiss_id = {idx}
-            '''
-            # 执行拼接后的SQL语句
-            cursor.execute(sql)
-            
-            # 检查SQL执行是否成功
-            if cursor.rowcount == -1:
-                print("查询执行成功，但没有找到匹配记录")
-            else:
-                print(f"查询找到 {cursor.rowcount} 条记录")
-            
-            row = cursor.fetchone()
-            if row:
-                file_path, chunk_text, metadata = row
-                results.append((
-                    file_path,
-                    float(distance),
-                    {
-                        "chunk_text": chunk_text,
-                        "metadata": json.loads(metadata)
-                    }
-                ))
-            else:
+    def _filter_conditions(self, extensions: Optional[List[str]] = None, directory: Optional[str] = None,
+                           modified_after: Optional[float] = None, modified_before: Optional[float] = None,
+                           min_size: Optional[int] = None,
+                           max_size: Optional[int] = None) -> Tuple[List[str], List]:
+        """把元数据过滤条件转换为 files 表（别名 f）上的 SQL 条件和参数"""
+        conditions = []
+        params = []
+        if extensions:
+            exts = [ext.lower() if ext.startswith('.') else '.' + ext.lower() for ext in extensions]
+            conditions.append('f.ext IN (SELECT value FROM json_each(?))')
+            params.append(json.dumps(exts))
+        if directory:
+            # 与 get_file_records 相同，使用主键上的范围查询
+            prefix = os.path.join(directory, '')
+            conditions.append('f.path >= ? AND f.path < ?')
+            params.extend([prefix, prefix + '\uffff'])
+        for column, op, value in (('mtime', '>=', modified_after), ('mtime', '<=', modified_before),
+                                  ('size', '>=', min_size), ('size', '<=', max_size)):
+            if value is not None:
+                conditions.append(f'f.{column} {op} ?')
+                params.append(value)
+        return conditions, params
+
+    def _filter_ids(self, **filters) -> Optional[np.ndarray]:
+        """
+        由文件清单的索引列解析满足过滤条件的向量ID
+        
+        Returns:
+            候选向量ID数组，没有过滤条件时返回 None
+        """
+        conditions, params = self._filter_conditions(**filters)
+        if not conditions:
+            return None
+        
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute(f'''
+            SELECT d.faiss_id FROM files f JOIN documents d ON d.file_path = f.path
+            WHERE {' AND '.join(conditions)}
+            ''', params)
+            candidate_ids = np.fromiter((row[0] for row in cursor), dtype=np.int64)
+        self.logger.debug("过滤条件匹配 %d 个向量", len(candidate_ids))
+        return candidate_ids
+
+    def _hydrate(self, hits: List[Tuple[int, float]]) -> List[Tuple[str, float, Dict]]:
+        """
+        用一次查询取回命中向量对应的文档信息，结果保持 hits 的排名顺序
+        
+        Args:
+            hits: (faiss_id, 距离或得分) 列表
+        """
+        if not hits:
+            return []
+        
+        chunks = self.get_chunks([faiss_id for faiss_id, _ in hits])
+        results = []
+        for faiss_id, distance in hits:
+            chunk = chunks.get(faiss_id)
+            if chunk is None:
                 # 记录不一致问题
-                self.logger.error(f"数据不一致: FAISS索引包含ID {idx}，但在数据库中未找到对应记录")
-                
+                self.logger.error(f"数据不一致: FAISS索引包含ID {faiss_id}，但在数据库中未找到对应记录")
+                continue
+            results.append((
+                chunk["file_path"],
+                distance,
+                {
+                    "chunk_text": chunk["chunk_text"],
+                    "metadata": chunk["metadata"]
+                }
+            ))
         return results
 
+    def get_chunks(self, faiss_ids) -> Dict[int, Dict]:
+        """
+        用一次查询读取分块的文件路径、文本和元数据
+        
+        Returns:
+            faiss_id 到 {"file_path", "chunk_text", "metadata"} 的字典，已删除的分块不在其中
+        """
+        faiss_ids = [int(faiss_id) for faiss_id in faiss_ids]
+        if not faiss_ids:
+            return {}
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('''
+            SELECT faiss_id, file_path, chunk_text, metadata FROM documents
+            WHERE faiss_id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(faiss_ids),))
+            rows = cursor.fetchall()
+        return {
+            faiss_id: {"file_path": file_path, "chunk_text": chunk_text, "metadata": json.loads(metadata)}
+            for faiss_id, file_path, chunk_text, metadata in rows
+        }
+
     def save_index(self):
-        """保存FAISS索引到文件"""
+        """保存FAISS索引
+        
+        只把上次保存之后的变化追加为一个增量段，耗时与变化量成正比；
+        基础段由后台合并任务重写。索引未加载完成时没有需要保存的变化。
+        """
+        if not self._index_ready.is_set():
+            return
         try:
-            self.logger.info(f"正在保存索引到 {os.path.abspath(self.index_file)}")
-            faiss.write_index(self.index, self.index_file)
-            self.logger.info(f"索引已保存，包含 {self.index.ntotal} 个向量")
+            if self.index.save():
+                self.logger.info(f"索引已保存，包含 {self.index.ntotal} 个向量")
+            self._maybe_compact()
         except Exception as e:
             self.logger.error(f"保存索引失败: {e}")
             
     def clear_all(self):
         """清空所有数据"""
+        self._index_ready.wait()  # 避免后台加载完成后覆盖清空后的索引
         # 清空 SQLite 数据
         cursor = self.conn.cursor()
         cursor.execute('DELETE FROM documents')
+        cursor.execute('DELETE FROM files')
         self.conn.commit()
         
-        # 重置 FAISS 索引
-        dimension = self.index.d  # 保存当前维度
-        self.index = faiss.IndexFlatL2(dimension)  # 创建新的空索引
-        
-        # 删除索引文件
-        if os.path.exists(self.index_file):
-            os.remove(self.index_file)
+        # 重置 FAISS 索引，删除基础段和增量段文件
+        self.index.reset()
+        self._next_id = 0
+        self._bump_generation()
             
         print("所有数据已清空")
 
@@ -257,25 +1137,12 @@ class VectorStore:
         for record in records:
             print(f"faiss_id: {record[0]}, file_path: {record[1]}") 
 
-    def _rollback_faiss(self, original_size):
-        """回滚FAISS索引到指定大小"""
-        if self.index.ntotal <= original_size:
+    def _rollback_faiss(self, faiss_ids):
+        """回滚FAISS索引，移除本次新增的向量"""
+        if len(faiss_ids) == 0:
             return
-        
-        # 创建新索引并只复制原始大小的向量
-        temp_index = faiss.IndexFlatL2(self.dimension)
-        
-        if original_size > 0:
-            # 获取原始向量
-            vectors = faiss.rev_swig_ptr(self.index.get_xb(), original_size * self.dimension)
-            vectors = vectors.reshape(original_size, self.dimension)
-            
-            # 添加到新索引
-            temp_index.add(vectors)
-        
-        # 替换当前索引
-        self.index = temp_index
-        self.logger.info(f"FAISS索引已回滚到 {original_size} 个向量") 
+        self.index.remove_ids(faiss_ids)
+        self.logger.info(f"FAISS索引已回滚，移除 {len(faiss_ids)} 个向量") 
 
     def check_consistency(self):
         """检查FAISS索引和SQLite数据库的一致性"""
@@ -289,14 +1156,15 @@ class VectorStore:
             self.logger.warning(f"数据不一致: FAISS索引包含 {faiss_count} 个向量，但数据库有 {db_count} 条记录")
             return False
         
-        # 检查faiss_id范围
-        cursor.execute('SELECT MIN(faiss_id), MAX(faiss_id) FROM documents')
-        min_id, max_id = cursor.fetchone()
-        
-        if min_id is not None and max_id is not None:
-            if min_id != 0 or max_id != faiss_count - 1:
-                self.logger.warning(f"数据ID不连续: faiss_id范围 [{min_id}, {max_id}]，但索引大小为 {faiss_count}")
-                return False
+        # 检查数据库中的 faiss_id 与索引中的ID是否一一对应
+        cursor.execute('SELECT DISTINCT faiss_id FROM documents')
+        db_ids = {row[0] for row in cursor.fetchall()}
+        index_ids = set(self.index.ids().tolist())
+        if db_ids != index_ids:
+            missing = len(db_ids - index_ids)
+            orphaned = len(index_ids - db_ids)
+            self.logger.warning(f"数据ID不一致: {missing} 个记录在索引中缺失，{orphaned} 个向量没有对应记录")
+            return False
         
         self.logger.info(f"数据一致性检查通过: {faiss_count} 个向量")
         return True 
@@ -321,7 +1189,7 @@ class VectorStore:
                 temp_index_path = os.path.join(tempfile.gettempdir(), "temp_faiss.index")
                 
                 # 导出FAISS索引到临时文件
-                faiss.write_index(self.index, temp_index_path)
+                self.index.write_full(temp_index_path)
                 self.logger.info(f"FAISS索引已导出到临时文件，包含 {self.index.ntotal} 个向量")
                 
                 # 复制到目标位置
@@ -352,6 +1220,7 @@ class VectorStore:
         Returns:
             bool: 是否成功导入
         """
+        self._index_ready.wait()  # 避免后台加载完成后覆盖导入的索引
         try:
             with self.db_lock:
                 # 首先检查文件是否存在
@@ -362,9 +1231,8 @@ class VectorStore:
                 # 关闭当前连接
                 self.conn.close()
                 
-                # 导入FAISS索引
-                self.index = faiss.read_index(index_path)
-                self.logger.info(f"已导入FAISS索引，包含 {self.index.ntotal} 个向量")
+                # 读取FAISS索引，数据库导入成功后再替换当前索引
+                imported_index = self._prepare_loaded_index(faiss.read_index(index_path))
                 
                 # 备份当前数据库
                 if os.path.exists('documents.db'):
@@ -382,6 +1250,13 @@ class VectorStore:
                 # 重新连接数据库
                 self._setup_database()
                 
+                # 导入FAISS索引，再按目录分到各分片
+                self.index.reset(imported_index)
+                self.index.rebalance(lambda ids: self._paths_by_id(self.conn.cursor(), ids))
+                self._init_next_id()
+                self._bump_generation()
+                self.logger.info(f"已导入FAISS索引，包含 {self.index.ntotal} 个向量")
+                
                 # 验证一致性
                 is_consistent = self.check_consistency()
                 self.logger.info(f"导入后数据一致性检查: {is_consistent}")
@@ -403,15 +1278,6 @@ class VectorStore:
             except:
                 pass
                 
-            # 重新加载原始索引
-            try:
-                if os.path.exists(self.index_file):
-                    self.index = faiss.read_index(self.index_file)
-                else:
-                    self.index = faiss.IndexFlatL2(self.dimension)
-            except:
-                self.index = faiss.IndexFlatL2(self.dimension)
-                
             return False 
 
     def init_db(self):
@@ -429,6 +1295,30 @@ class VectorStore:
             ''')
             self.conn.commit()
 
+    def get_stats(self) -> Dict:
+        """文件数、分块数、向量数和分片信息"""
+        with self.db_lock:
+            cursor = self.conn.cursor()
+            cursor.execute('SELECT COUNT(*) FROM files')
+            files = cursor.fetchone()[0]
+            cursor.execute('SELECT COUNT(*) FROM documents')
+            chunks = cursor.fetchone()[0]
+        stats = {
+            'files': files,
+            'chunks': chunks,
+            'index_ready': self.is_index_ready(),
+            'generation': self.generation,
+            'full_text_search': self._fts_enabled
+        }
+        if self.is_index_ready():
+            shards = self.index.all_shards()
+            stats.update({
+                'vectors': self.index.ntotal,
+                'shards': len(shards),
+                'segments': sum(shard.segment_count() for shard in shards)
+            })
+        return stats
+
     def get_directories(self) -> List[Dict]:
         """获取所有目录及其状态"""
         with self.db_lock:
@@ -448,7 +1338,7 @@ class VectorStore:
             ]
 
     def add_directory(self, path: str):
-        """添加目录"""
+        """添加目录，并为其创建索引分片"""
         with self.db_lock:
             cursor = self.conn.cursor()
             cursor.execute('''
@@ -456,21 +1346,34 @@ class VectorStore:
             VALUES (?, 1, NULL)
             ''', (path,))
             self.conn.commit()
+            cursor.execute('SELECT enabled FROM directories WHERE path = ?', (path,))
+            self.index.add_shard(path, bool(cursor.fetchone()[0]))
+            # 目录下已在默认分片中的文件移到新分片
+            self.index.rebalance(lambda ids: self._paths_by_id(cursor, ids))
+            self._bump_generation()
 
     def remove_directory(self, path: str):
         """删除目录及其相关数据"""
         with self.db_lock:
             cursor = self.conn.cursor()
-            # 删除目录记录
+            # 删除目录记录，直接删除其分片文件
             cursor.execute('DELETE FROM directories WHERE path = ?', (path,))
-            # 删除该目录下的所有文档记录
-            cursor.execute('DELETE FROM documents WHERE file_path LIKE ?', (f"{path}%",))
+            self.index.drop_shard(path)
+            self._bump_generation()
+            # 删除该目录下的所有文档记录，以及其他分片中残留的向量
+            prefix = os.path.join(path, '')
+            cursor.execute('''
+            SELECT DISTINCT file_path FROM documents WHERE file_path >= ? AND file_path < ?
+            ''', (prefix, prefix + '\uffff'))
+            self._remove_files_locked(cursor, [row[0] for row in cursor.fetchall()])
+            cursor.execute('DELETE FROM files WHERE path >= ? AND path < ?',
+                           (prefix, prefix + '\uffff'))
             self.conn.commit()
 
-    def update_directory_status(self, path: str, enabled: bool = True, 
+    def update_directory_status(self, path: str, enabled: Optional[bool] = None,
                               last_update: Optional[str] = None,
                               doc_count: Optional[int] = None):
-        """更新目录状态"""
+        """更新目录状态，参数为 None 的字段保持不变"""
         with self.db_lock:
             cursor = self.conn.cursor()
             updates = []
@@ -489,4 +1392,7 @@ class VectorStore:
                 sql = f"UPDATE directories SET {', '.join(updates)} WHERE path = ?"
                 values.append(path)
                 cursor.execute(sql, values)
-                self.conn.commit() 
\ No newline at end of file
+                self.conn.commit()
+            if enabled is not None:
+                self.index.set_enabled(path, enabled)
+                self._bump_generation() 
\ No newline at end of file
@@ -1,119 +1,389 @@
 """
 后台工作线程模块，处理耗时操作
+
+主窗口启动时导入本模块，搜索服务和索引流水线在线程中按需导入，
+避免 sentence_transformers、torch、faiss 拖慢窗口显示。
 """
 
 from PyQt6.QtCore import QThread, pyqtSignal
-from typing import List, Dict
+from typing import List, Dict, Optional, TYPE_CHECKING
 import os
-from core.search_service import SearchService
-from queue import Queue
-import numpy as np
+import time
+from queue import Empty, Queue
+from threading import Condition, Lock
+from utils.config import Config
 from utils.logger import Logger
 
+if TYPE_CHECKING:
+    from core.search_service import SearchService
+
 class IndexingWorker(QThread):
     """
     后台索引线程
     
-    用于在后台处理文档索引，避免阻塞UI线程
+    用于在后台处理文档索引，避免阻塞UI线程。索引以可恢复的任务运行，
+    暂停或程序退出后可用任务ID创建新的线程从中断处继续。
     
     Signals:
         progress (int): 发送索引进度 (0-100)
         finished: 索引完成时发送
+        paused: 索引被暂停或中止时发送，任务尚未完成
         error (str): 发送错误信息
         batch_ready (list): 发送批处理数据
+        stage_stats (list): 发送流水线各阶段的吞吐统计
     """
     
     progress = pyqtSignal(int)
     finished = pyqtSignal()
+    paused = pyqtSignal()
     error = pyqtSignal(str)
     batch_ready = pyqtSignal(list)  # 发送批处理数据
+    stage_stats = pyqtSignal(list)  # 发送各阶段吞吐统计
     
-    def __init__(self, search_service: SearchService, directories: List[str], batch_size: int = 100):
+    def __init__(self, search_service: 'SearchService', directories: List[str], batch_size: int = 100,
+                 job_id: Optional[int] = None):
         """
         初始化索引工作线程
         
         Args:
             search_service: 搜索服务实例
             directories: 要索引的目录列表
-            batch_size: 批处理大小
+            batch_size: 每次写入向量存储的文档数
+            job_id: 要继续的索引任务ID，为空时新建任务
         """
         super().__init__()
         self.search_service = search_service
         self.directories = directories
         self.batch_size = batch_size
-        self.current_batch = []
+        self.job_id = job_id
+        self.config = Config()
         self.logger = Logger.get_logger(__name__)
+        self._pipeline = None
+        self._stop_request: Optional[bool] = None
+        self._stop_lock = Lock()
+        
+    def pause(self):
+        """暂停索引：任务标记为已暂停，等待用户继续"""
+        self._request_stop(pause=True)
+        
+    def stop(self):
+        """中止索引并等待线程结束：任务保持运行状态，下次启动时自动恢复"""
+        self._request_stop(pause=False)
+        self.wait()
+        
+    def _request_stop(self, pause: bool):
+        with self._stop_lock:
+            self._stop_request = pause
+            if self._pipeline is not None:
+                self._pipeline.stop(pause=pause)
         
     def run(self):
         """
-        执行索引任务
+        执行增量索引任务
         
-        遍历所有目录，统计并处理文件，发送进度信息
-        如果发生错误，发送错误信号
+        通过多阶段流水线（扫描 → 解析 → 分块 → 编码 → 写入）处理各目录，
+        发送进度和各阶段吞吐信息。如果发生错误，发送错误信号
         """
 
         self.logger.info("run debug：函数开始")
 
         try:
-            total_files = sum(1 for directory in self.directories 
-                            for _, _, files in os.walk(directory) 
-                            for _ in files)
-            processed_files = 0
+            from core.pipeline import IndexingPipeline
+            
+            if self.job_id is None:
+                self.job_id = self.search_service.create_index_job(self.directories)
+            pipeline = IndexingPipeline.from_config(
+                self.search_service,
+                self.directories,
+                self.config,
+                write_batch_size=self.batch_size,
+                progress_callback=self._on_progress,
+                stats_callback=self.stage_stats.emit,
+                job_id=self.job_id
+            )
+            with self._stop_lock:
+                self._pipeline = pipeline
+                if self._stop_request is not None:
+                    pipeline.stop(pause=self._stop_request)
+            pipeline.run()
+            
+            if pipeline.stopped:
+                self.paused.emit()
+                self.logger.info(f"索引任务 {self.job_id} 已暂停。")
+            else:
+                self.finished.emit()
+                self.logger.info("索引完成。")
+            
+        except Exception as e:
+            self.error.emit(str(e)) 
+            self.logger.error(f"索引过程出错: {str(e)}")
+
+    def _on_progress(self, completed: int, total: int):
+        """流水线进度回调，扫描仍在进行时总数会继续增长"""
+        if total > 0:
+            self.progress.emit(int(completed / total * 100))
+
+
+class WarmupWorker(QThread):
+    """
+    启动预热线程
+    
+    在后台导入并创建搜索服务、加载嵌入模型和FAISS索引，完成后把服务对象交给主窗口。
+    窗口因此可以立即显示，预热完成后搜索框即可使用，首次搜索不再有冷启动延迟。
+    
+    Signals:
+        status (str): 当前预热阶段的说明
+        ready (object): 预热完成，参数为 SearchService 实例
+        error (str): 预热失败时发送错误信息
+    """
+    
+    status = pyqtSignal(str)
+    ready = pyqtSignal(object)
+    error = pyqtSignal(str)
+    
+    def __init__(self):
+        super().__init__()
+        self.logger = Logger.get_logger(__name__)
+        
+    def run(self):
+        started = time.perf_counter()
+        try:
+            self.status.emit("正在加载索引...")
+            from core.search_service import SearchService
+            search_service = SearchService()
+            
+            self.status.emit("正在加载模型...")
+            search_service.warmup()
+            
+            self.logger.info("启动预热完成，耗时 %.2f 秒", time.perf_counter() - started)
+            self.ready.emit(search_service)
+        except Exception as e:
+            self.logger.error(f"启动预热失败: {str(e)}")
+            self.error.emit(str(e))
 
-            self.logger.info(f"run debug：开始索引文档，总文件数: {total_files}")
-            self.logger.info("run debug：开始索引文档")
-            for directory in self.directories:
-                for root, _, files in os.walk(directory):
-                    for file in files:
-                        try:
-                            file_path = os.path.join(root, file)
-                            self.logger.info(f"开始处理文件: {file_path}")
-                            
-                            # 处理单个文档
-                            doc_info = self.search_service.doc_processor.parse_document(file_path)
-                            if not doc_info["content"]:
-                                self.logger.info(f"文件 {file_path} 内容为空，跳过。")
-                                continue
-                                
-                            chunks = self.search_service.doc_processor.create_chunks(doc_info["content"])
-                            if not chunks:
-                                self.logger.info(f"文件 {file_path} 分块为空，跳过。")
-                                continue
-                                
-                            embeddings = self.search_service.embedding_service.encode(chunks)
-                            self.logger.info(f"文件 {file_path} 编码完成。")
-                            
-                            # 添加到当前批次
-                            self.current_batch.append({
-                                'file_path': file_path,
-                                'chunks': chunks,
-                                'embeddings': embeddings,
-                                'metadata': doc_info["metadata"]
-                            })
-                            self.logger.info(f"文件 {file_path} 添加到批次中。")
-                            
-                            # 如果达到批处理大小，处理批次
-                            if len(self.current_batch) >= self.batch_size:
-                                self.search_service.vector_store.add_document_batch(self.current_batch)
-                                self.current_batch = []
-                                self.logger.info("批次数据已处理。")
-                            
-                            processed_files += 1
-                            progress = int((processed_files / total_files) * 100)
-                            self.progress.emit(progress)
-                            self.logger.info(f"索引进度: {progress}%")
-                            
-                        except Exception as e:
-                            self.logger.error(f"处理文件出错 {file}: {str(e)}")
-                            
-            # 处理最后的批次
-            if self.current_batch:
-                self.search_service.vector_store.add_document_batch(self.current_batch)
-                self.logger.info("发送最后的批次数据。")
+
+class SearchWorker(QThread):
+    """
+    后台搜索线程
+    
+    常驻线程，只保留最新一次提交的请求：输入过程中连续提交时，尚未开始的旧请求直接丢弃，
+    已在执行的旧请求完成后不再发送结果。每个请求先发送不需要编码查询的关键词预览，
+    再发送完整结果，界面据此逐步刷新。结果只包含 (faiss_id, 相关度)，分块内容由界面按需读取。
+    
+    Signals:
+        partial_results (int, list): 请求编号和关键词预览结果
+        results_ready (int, list): 请求编号和完整结果
+        error (int, str): 请求编号和错误信息
+    """
+    
+    partial_results = pyqtSignal(int, list)
+    results_ready = pyqtSignal(int, list)
+    error = pyqtSignal(int, str)
+    
+    def __init__(self, search_service: 'SearchService'):
+        super().__init__()
+        self.logger = Logger.get_logger(__name__)
+        self.search_service = search_service
+        self._condition = Condition()
+        self._pending = None
+        self._latest_id = 0
+        self._stopped = False
+        
+    def submit(self, query: str, top_k: int = 50, **kwargs) -> int:
+        """
+        提交搜索请求，取代所有尚未完成的请求
+        
+        Args:
+            query: 查询文本
+            top_k: 返回的结果数
+            **kwargs: 传给 SearchService.search_ids 的过滤条件和检索方式
+            
+        Returns:
+            请求编号，结果信号携带该编号
+        """
+        with self._condition:
+            self._latest_id += 1
+            self._pending = (self._latest_id, query, top_k, kwargs)
+            self._condition.notify()
+            return self._latest_id
+            
+    def cancel(self):
+        """作废所有尚未完成的请求"""
+        with self._condition:
+            self._latest_id += 1
+            self._pending = None
+            
+    def is_stale(self, request_id: int) -> bool:
+        """请求是否已被更新的请求取代"""
+        return request_id != self._latest_id
+        
+    def stop(self):
+        """停止线程，等待正在执行的请求结束"""
+        with self._condition:
+            self._stopped = True
+            self._pending = None
+            self._condition.notify()
+        self.wait()
+        
+    def run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                request_id, query, top_k, kwargs = self._pending
+                self._pending = None
                 
-            self.finished.emit()
-            self.logger.info("索引完成。")
+            started = time.perf_counter()
+            try:
+                preview = self.search_service.search_preview(query, top_k, **kwargs)
+                if self.is_stale(request_id):
+                    continue
+                if preview:
+                    self.partial_results.emit(request_id, preview)
+                    
+                results = self.search_service.search_ids(query, top_k, **kwargs)
+                if self.is_stale(request_id):
+                    self.logger.debug("丢弃过期的搜索结果: %s", query)
+                    continue
+                self.logger.info("搜索完成 %s，耗时 %.1f ms", query, (time.perf_counter() - started) * 1000)
+                self.results_ready.emit(request_id, results)
+            except Exception as e:
+                self.logger.error(f"搜索失败: {str(e)}")
+                if not self.is_stale(request_id):
+                    self.error.emit(request_id, str(e))
+
+
+class FileChangeWorker(QThread):
+    """
+    文件变化索引线程
+    
+    FileMonitor 的回调只把合并后的变化批次放入队列，由本线程依次交给
+    SearchService.apply_file_changes；处理期间排队的多个批次合并后一起处理。
+    
+    Signals:
+        changes_applied (dict): 一批变化处理完成，参数为处理结果
+        error (str): 处理失败时发送错误信息
+    """
+    
+    changes_applied = pyqtSignal(dict)
+    error = pyqtSignal(str)
+    
+    def __init__(self, search_service: 'SearchService'):
+        super().__init__()
+        self.logger = Logger.get_logger(__name__)
+        self.search_service = search_service
+        self._queue: Queue = Queue()
+        
+    def submit(self, changes: Dict[str, List]):
+        """提交变化批次（可在任意线程调用）"""
+        self._queue.put(changes)
+        
+    def stop(self):
+        """停止线程：已提交的批次（包括 FileMonitor 停止时刷出的最后一批）合并处理完后退出"""
+        self._queue.put(None)
+        self.wait()
+        
+    @staticmethod
+    def _merge(changes: Dict[str, List], more: Dict[str, List]) -> Dict[str, List]:
+        """按先后顺序合并两个批次；删除先于索引执行，后到的删除会使先到的新增被跳过"""
+        merged = {key: list(changes.get(key, [])) + list(more.get(key, []))
+                  for key in ("upserted", "deleted", "moved", "deleted_directories")}
+        merged["upserted"] = list(dict.fromkeys(merged["upserted"]))
+        return merged
+        
+    def run(self):
+        while True:
+            changes = self._queue.get()
+            if changes is None:
+                return
+            stopping = False
+            while True:
+                try:
+                    more = self._queue.get_nowait()
+                except Empty:
+                    break
+                if more is None:
+                    stopping = True
+                    break
+                changes = self._merge(changes, more)
             
+            try:
+                result = self.search_service.apply_file_changes(changes)
+                self.changes_applied.emit(result)
+            except Exception as e:
+                self.logger.error(f"处理文件变化失败: {str(e)}")
+                self.error.emit(str(e))
+            if stopping:
+                return
+
+
+class ReconcileWorker(QThread):
+    """
+    启动对账线程
+    
+    比对文件清单与磁盘（只读取 stat），把程序未运行期间的变化交给增量索引。
+    
+    Signals:
+        progress (int): 进度 (0-100)，比对阶段占前 10%
+        status (str): 当前阶段的说明
+        reconciled (dict): 对账完成，参数为处理的文件数统计
+        error (str): 对账失败时发送错误信息
+    """
+    
+    progress = pyqtSignal(int)
+    status = pyqtSignal(str)
+    reconciled = pyqtSignal(dict)
+    error = pyqtSignal(str)
+    
+    def __init__(self, search_service: 'SearchService', directories: List[str]):
+        super().__init__()
+        self.logger = Logger.get_logger(__name__)
+        self.search_service = search_service
+        self.directories = directories
+        self._pipeline = None
+        self._stop_requested = False
+        self._stop_lock = Lock()
+        
+    def stop(self):
+        """中止对账并等待线程结束：正在编码和写入的文件处理完后保存索引，其余变化留给下次启动时的对账"""
+        with self._stop_lock:
+            self._stop_requested = True
+            if self._pipeline is not None:
+                self._pipeline.stop(pause=False)
+        self.wait()
+        
+    def _set_pipeline(self, pipeline):
+        with self._stop_lock:
+            self._pipeline = pipeline
+            if self._stop_requested:
+                pipeline.stop(pause=False)
+        
+    def run(self):
+        started = time.perf_counter()
+        try:
+            self.status.emit("正在检查离线期间的文件变化...")
+            result = self.search_service.reconcile(
+                self.directories,
+                progress_callback=self._on_progress,
+                scan_callback=self._on_scan,
+                pipeline_callback=self._set_pipeline,
+                should_stop=lambda: self._stop_requested
+            )
+            if self._stop_requested:
+                self.logger.info("启动对账已中止，耗时 %.2f 秒", time.perf_counter() - started)
+                return
+            self.logger.info("启动对账完成，耗时 %.2f 秒", time.perf_counter() - started)
+            self.reconciled.emit(result)
         except Exception as e:
-            self.error.emit(str(e)) 
-            self.logger.error(f"索引过程出错: {str(e)}")
\ No newline at end of file
+            self.logger.error(f"启动对账失败: {str(e)}")
+            self.error.emit(str(e))
+            
+    def _on_scan(self, scanned: int, total: int):
+        self.progress.emit(int(scanned / total * 10))
+        
+    def _on_progress(self, completed: int, total: int):
+        if total > 0:
+            self.status.emit(f"正在更新离线期间变化的文件 {completed}/{total}")
+            self.progress.emit(10 + int(completed / total * 90))
@@ -0,0 +1,168 @@
+"""
+DocSeeker 命令行入口（无界面）
+
+与图形界面共用当前目录下的 config.json、documents.db 和 faiss.index，不导入 PyQt6，
+可在服务器上定时运行增量索引或为其他工具提供本地搜索服务。
+
+用法:
+    python docseeker.py index [目录 ...]          增量索引指定目录（会登记为索引目录），默认索引所有启用的目录
+    python docseeker.py search 查询文本 [-k 10] [--mode hybrid] [--ext .pdf] [--dir 目录] [--json]
+    python docseeker.py stats [--json]
+    python docseeker.py export 索引文件 数据库文件
+    python docseeker.py serve [--host 127.0.0.1] [--port 8765]
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+
+
+def _parse_time(value: str) -> float:
+    """时间参数：时间戳或 ISO 格式日期（如 2024-01-31、2024-01-31T08:00）"""
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def _print_json(payload):
+    print(json.dumps(payload, ensure_ascii=False, indent=2, default=str))
+
+
+def cmd_index(service, args) -> int:
+    directories = None
+    if args.directories:
+        directories = [os.path.abspath(directory) for directory in args.directories]
+        for directory in directories:
+            if not os.path.isdir(directory):
+                print(f"目录不存在: {directory}", file=sys.stderr)
+                return 1
+            service.add_directory(directory)
+    elif not service.get_enabled_directories():
+        print("没有启用的索引目录，请指定要索引的目录", file=sys.stderr)
+        return 1
+
+    def on_progress(completed: int, total: int):
+        if not args.quiet:
+            print(f"\r已处理 {completed}/{total} 个文件", end='', file=sys.stderr, flush=True)
+
+    stats = service.index_directories(directories, progress_callback=on_progress)
+    if not args.quiet:
+        print(file=sys.stderr)
+        for stage in stats:
+            print(f"{stage['name']:<6} 处理 {stage['processed']:>6}  错误 {stage['errors']:>4}  "
+                  f"{stage['items_per_second']:>8.1f}/s", file=sys.stderr)
+    return 0
+
+
+def cmd_search(service, args) -> int:
+    results = service.search(
+        args.query, args.top_k, mode=args.mode,
+        extensions=args.ext, directory=args.dir,
+        modified_after=args.after, modified_before=args.before,
+        min_size=args.min_size, max_size=args.max_size
+    )
+    if args.json:
+        _print_json(results)
+        return 0
+    for rank, result in enumerate(results, start=1):
+        snippet = ' '.join(result['chunk_text'].split())[:120]
+        print(f"{rank:>3}. {result['score']:.3f}  {result['file_path']}\n     {snippet}")
+    if not results:
+        print("没有找到结果", file=sys.stderr)
+    return 0
+
+
+def cmd_stats(service, args) -> int:
+    stats = service.get_stats()
+    if args.json:
+        _print_json(stats)
+        return 0
+    print(f"文件: {stats['files']}  分块: {stats['chunks']}  向量: {stats.get('vectors', '加载中')}  "
+          f"分片: {stats.get('shards', '-')}  增量段: {stats.get('segments', '-')}")
+    for directory in stats['directories']:
+        state = '启用' if directory['enabled'] else '停用'
+        print(f"  [{state}] {directory['path']}  最后更新: {directory['last_update'] or '-'}")
+    for name, cache in stats['caches'].items():
+        if cache:
+            print(f"缓存 {name}: {cache['entries']}/{cache['max_entries']} 条，命中率 {cache['hit_ratio']:.1%}")
+    return 0
+
+
+def cmd_export(service, args) -> int:
+    service.save_index()
+    if not service.vector_store.export_data(os.path.abspath(args.index_path), os.path.abspath(args.db_path)):
+        print("导出失败，详见日志", file=sys.stderr)
+        return 1
+    print(f"已导出到 {args.index_path} 和 {args.db_path}")
+    return 0
+
+
+def cmd_serve(service, args) -> int:
+    from core.server import SearchServer
+
+    server = SearchServer(service, args.host, args.port,
+                          batch_size=args.batch_size, batch_delay=args.batch_delay / 1000)
+    print(f"搜索服务已启动: http://{args.host}:{args.port}  (Ctrl+C 退出)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.save_index()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="docseeker", description="DocSeeker 文档语义搜索（命令行）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index = subparsers.add_parser("index", help="增量索引目录")
+    index.add_argument("directories", nargs="*", help="要索引的目录，默认索引所有启用的目录")
+    index.add_argument("-q", "--quiet", action="store_true", help="不输出进度")
+    index.set_defaults(handler=cmd_index)
+
+    search = subparsers.add_parser("search", help="搜索文档")
+    search.add_argument("query")
+    search.add_argument("-k", "--top-k", type=int, default=10)
+    search.add_argument("--mode", choices=["vector", "hybrid", "prefilter"], help="检索方式，默认读取配置")
+    search.add_argument("--ext", action="append", help="只搜索该扩展名，可重复")
+    search.add_argument("--dir", help="只搜索该目录下的文件")
+    search.add_argument("--after", type=_parse_time, help="修改时间不早于（时间戳或 ISO 日期）")
+    search.add_argument("--before", type=_parse_time, help="修改时间不晚于（时间戳或 ISO 日期）")
+    search.add_argument("--min-size", type=int, help="最小文件大小（字节）")
+    search.add_argument("--max-size", type=int, help="最大文件大小（字节）")
+    search.add_argument("--json", action="store_true", help="以 JSON 输出")
+    search.set_defaults(handler=cmd_search)
+
+    stats = subparsers.add_parser("stats", help="索引统计")
+    stats.add_argument("--json", action="store_true", help="以 JSON 输出")
+    stats.set_defaults(handler=cmd_stats)
+
+    export = subparsers.add_parser("export", help="导出索引和数据库")
+    export.add_argument("index_path")
+    export.add_argument("db_path")
+    export.set_defaults(handler=cmd_export)
+
+    serve = subparsers.add_parser("serve", help="启动本地 HTTP/JSON 搜索服务")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+    serve.add_argument("--batch-size", type=int, default=32, help="查询编码每批最多拼接的查询数")
+    serve.add_argument("--batch-delay", type=float, default=5.0, help="查询编码凑批的最长等待时间（毫秒）")
+    serve.set_defaults(handler=cmd_serve)
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    from core.search_service import SearchService
+
+    service = SearchService()
+    return args.handler(service, args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
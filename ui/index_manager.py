@@ -4,11 +4,14 @@ from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTreeWidget,
 from PyQt6.QtCore import Qt
 from datetime import datetime
 import os
+from typing import TYPE_CHECKING
 from utils.config import Config
-from core.search_service import SearchService
+
+if TYPE_CHECKING:
+    from core.search_service import SearchService
 
 class IndexManagerDialog(QDialog):
-    def __init__(self, search_service: SearchService, parent=None):
+    def __init__(self, search_service: 'SearchService', parent=None):
         super().__init__(parent)
         self.search_service = search_service
         self.config = Config()
@@ -82,11 +85,8 @@ class IndexManagerDialog(QDialog):
             
             # 获取目录信息
             enabled = directory['enabled']
-            doc_count = self.get_document_count(directory['path'])
-            self.search_service.update_directory_status(
-                directory['path'], 
-                doc_count=doc_count
-            )
+            # 文档数由索引和启动对账扫描时写入，打开对话框不再遍历目录
+            doc_count = directory['doc_count']
             
             last_update = directory['last_update']
             if last_update:
@@ -103,7 +103,7 @@ class IndexManagerDialog(QDialog):
                         last_update = None
             
             # 设置各列内容
-            item.setText(1, str(doc_count))
+            item.setText(1, str(doc_count) if last_update else "-")
             item.setText(2, last_update.strftime("%Y-%m-%d %H:%M:%S") if last_update else "从未")
             
             # 将复选框移到最后一列"检索"中
@@ -117,14 +117,6 @@ class IndexManagerDialog(QDialog):
             
             self.dir_tree.addTopLevelItem(item)
         
-    def get_document_count(self, directory: str) -> int:
-        """获取目录中的文档数量"""
-        count = 0
-        for root, _, files in os.walk(directory):
-            count += sum(1 for f in files if any(f.lower().endswith(ext) 
-                        for ext in self.config.get_file_extensions()))
-        return count
-        
     def add_directory(self):
         """添加新目录"""
         directory = QFileDialog.getExistingDirectory(self, "选择文档目录")
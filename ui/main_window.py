@@ -3,18 +3,20 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from PyQt6.QtWidgets import (QDialog, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
-                            QLineEdit, QPushButton, QTextEdit, QListWidget, 
+                            QLineEdit, QPushButton, QTextEdit, QListView, 
                             QFileDialog, QProgressBar, QMessageBox, QLabel,
                             QApplication)
-from PyQt6.QtCore import Qt, QThread, pyqtSignal
+from PyQt6.QtCore import Qt, QThread, QTimer, pyqtSignal
 from PyQt6.QtGui import QIcon
-from typing import List, Dict
-from core.search_service import SearchService
-from core.workers import IndexingWorker
+from typing import List, Dict, Optional, Tuple
+# 搜索服务由 WarmupWorker 在后台导入和创建，这里不导入 core.search_service
+from core.workers import FileChangeWorker, IndexingWorker, ReconcileWorker, SearchWorker, WarmupWorker
 from utils.config import Config
 from utils.file_monitor import FileMonitor
 from utils.logger import Logger
+from utils.scanner import DirectoryScanner
 from ui.settings_dialog import SettingsDialog
+from ui.results_model import ResultsModel
 from .index_manager import IndexManagerDialog
 from datetime import datetime
 
@@ -24,20 +26,24 @@ class MainWindow(QMainWindow):
         self.logger = Logger.get_logger(__name__)
         self.logger.info("初始化主窗口")
         self.config = Config()
-        self.search_service = SearchService()
+        # 模型和索引在后台预热，窗口先显示；预热完成前搜索服务为 None
+        self.search_service = None
+        self.search_worker = None
+        self.index_worker = None
+        # 已暂停、等待用户继续的索引任务
+        self._paused_job = None
+        # 启动时先恢复被中断的索引任务，完成后再进行启动对账
+        self._reconcile_after_indexing = False
+        self._search_request_id = 0
+        self._service_actions = []
         self.init_ui()
+        self._start_warmup()
         
         # # 首次运行检查
         # if self.config.is_first_run():
         #     self.show_first_run_dialog()
         
-        # # 初始化文件监控
-        # self.file_monitor = FileMonitor(
-        #     directories=self.config.get_scan_directories(),
-        #     file_extensions=self.config.get_file_extensions(),
-        #     callback=self.handle_file_change
-        # )
-        # self.file_monitor.start()
+        # 文件监控在搜索服务预热完成后启动，见 _start_file_monitor
         
     def init_ui(self):
         """初始化界面"""
@@ -59,13 +65,22 @@ class MainWindow(QMainWindow):
         self.search_button.clicked.connect(self.perform_search)
         # 连接回车键到搜索功能
         self.search_input.returnPressed.connect(self.perform_search)
+        # 实时搜索：输入停顿一段时间后再搜索，避免每次按键都编码查询
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.timeout.connect(self.perform_search)
+        self.search_input.textChanged.connect(self._on_search_text_changed)
         search_layout.addWidget(self.search_input)
         search_layout.addWidget(self.search_button)
         main_layout.addLayout(search_layout)
         
         # 结果显示区域
-        self.results_list = QListWidget()
-        self.results_list.itemClicked.connect(self.show_result_detail)
+        # 结果列表只保存ID和分数，分块内容在行可见或被选中时才读取
+        self.results_model = ResultsModel(parent=self)
+        self.results_list = QListView()
+        self.results_list.setUniformItemSizes(True)
+        self.results_list.setModel(self.results_model)
+        self.results_list.selectionModel().currentChanged.connect(self.show_result_detail)
         main_layout.addWidget(self.results_list)
         
         # 详情显示区域
@@ -76,7 +91,7 @@ class MainWindow(QMainWindow):
         # 底部工具栏
         tools_layout = QHBoxLayout()
         self.index_button = QPushButton('更新索引')
-        self.index_button.clicked.connect(self.start_indexing)
+        self.index_button.clicked.connect(self._on_index_button_clicked)
         tools_layout.addWidget(self.index_button)
         
         # 进度条
@@ -88,6 +103,103 @@ class MainWindow(QMainWindow):
         
         # 创建菜单栏
         self._create_menu_bar()
+        self._set_service_ready(False)
+        
+    def _start_warmup(self):
+        """在后台加载搜索服务、嵌入模型和索引"""
+        self.warmup_worker = WarmupWorker()
+        self.warmup_worker.status.connect(self.statusBar().showMessage)
+        self.warmup_worker.ready.connect(self._on_warmup_ready)
+        self.warmup_worker.error.connect(self._on_warmup_error)
+        self.warmup_worker.start()
+        
+    def _on_warmup_ready(self, search_service):
+        """预热完成，启用搜索和索引功能"""
+        self.search_service = search_service
+        self.results_model.set_vector_store(search_service.vector_store)
+        self.search_worker = SearchWorker(search_service)
+        self.search_worker.partial_results.connect(self._on_partial_results)
+        self.search_worker.results_ready.connect(self._on_search_results)
+        self.search_worker.error.connect(self._on_search_error)
+        self.search_worker.start()
+        self._set_service_ready(True)
+        self.statusBar().showMessage('就绪', 3000)
+        self.search_input.setFocus()
+        # 先启动监控再对账，对账期间发生的变化不会遗漏（重复的变化检查代价很小）
+        self._start_file_monitor()
+        job = search_service.get_unfinished_index_job()
+        if job is not None and job['status'] == 'running':
+            # 上次退出或崩溃时索引任务尚未完成，从中断处继续
+            self.logger.info("恢复被中断的索引任务 %d", job['id'])
+            self._reconcile_after_indexing = True
+            self.start_indexing(job)
+            return
+        if job is not None:
+            self._paused_job = job
+            self._update_index_button()
+        self._start_reconcile()
+        
+    def _start_file_monitor(self):
+        """监控启用目录的文件变化，合并后的变化交给后台线程增量索引"""
+        if not self.config.get_value('monitor.enabled', True):
+            return
+        self.file_change_worker = FileChangeWorker(self.search_service)
+        self.file_change_worker.changes_applied.connect(self._on_file_changes_applied)
+        self.file_change_worker.error.connect(
+            lambda error_msg: self.statusBar().showMessage(f"索引更新失败: {error_msg}", 5000))
+        self.file_change_worker.start()
+        
+        self.file_monitor = FileMonitor(
+            directories=self.search_service.get_enabled_directories(),
+            file_extensions=self.config.get_file_extensions(),
+            callback=self.file_change_worker.submit,
+            debounce_seconds=self.config.get_value('monitor.debounce_seconds', 1.0),
+            max_delay=self.config.get_value('monitor.max_delay', 10.0),
+            ignore_patterns=self.config.get_value('scan.ignore_patterns')
+        )
+        self.file_monitor.start()
+        
+    def _start_reconcile(self):
+        """在后台同步程序未运行期间的文件变化（只比较 stat 信息），显示进度"""
+        directories = self.search_service.get_enabled_directories()
+        if not directories or not self.config.get_value('monitor.reconcile_on_startup', True):
+            return
+        self.index_button.setEnabled(False)
+        self.progress_bar.show()
+        self.progress_bar.setValue(0)
+        
+        self.reconcile_worker = ReconcileWorker(self.search_service, directories)
+        self.reconcile_worker.progress.connect(self.update_progress)
+        self.reconcile_worker.status.connect(self.statusBar().showMessage)
+        self.reconcile_worker.reconciled.connect(self._on_reconciled)
+        self.reconcile_worker.error.connect(self._on_reconcile_error)
+        self.reconcile_worker.start()
+        
+    def _on_reconciled(self, result: Dict):
+        """启动对账完成"""
+        self.index_button.setEnabled(True)
+        self.progress_bar.hide()
+        self.statusBar().showMessage(
+            f"离线期间的变化已同步: 检查 {result['checked']} 个文件，移动 {result['relinked']} 个，"
+            f"删除 {result['removed']} 个，{result['unchanged']} 个未变化", 5000)
+        
+    def _on_reconcile_error(self, error_msg: str):
+        self.index_button.setEnabled(True)
+        self.progress_bar.hide()
+        self.statusBar().showMessage(f"同步离线变化失败: {error_msg}", 5000)
+        
+    def _on_warmup_error(self, error_msg: str):
+        self.statusBar().showMessage('加载失败')
+        QMessageBox.critical(self, "错误", f"加载搜索服务失败：{error_msg}")
+        
+    def _set_service_ready(self, ready: bool):
+        """启用或停用依赖搜索服务的控件"""
+        self.search_input.setEnabled(ready)
+        self.search_button.setEnabled(ready)
+        self.index_button.setEnabled(ready)
+        self.search_input.setPlaceholderText('输入搜索内容...' if ready else '正在加载模型和索引...')
+        for action in self._service_actions:
+            action.setEnabled(ready)
         
     def _create_menu_bar(self):
         """创建菜单栏"""
@@ -105,6 +217,7 @@ class MainWindow(QMainWindow):
         # 添加建立索引菜单项
         index_action = file_menu.addAction('建立索引')
         index_action.triggered.connect(self._build_index)
+        self._service_actions.append(index_action)
         
         file_menu.addSeparator()
         
@@ -114,6 +227,7 @@ class MainWindow(QMainWindow):
         
         import_action = file_menu.addAction('导入数据')
         import_action.triggered.connect(self._import_data)
+        self._service_actions.extend([export_action, import_action])
         
         file_menu.addSeparator()
         
@@ -125,6 +239,7 @@ class MainWindow(QMainWindow):
         
         index_manage_action = settings_menu.addAction('索引管理') 
         index_manage_action.triggered.connect(self._index_manage)
+        self._service_actions.append(index_manage_action)
 
         file_types_action = settings_menu.addAction('选项')
         file_types_action.triggered.connect(self._manage_file_types)
@@ -150,92 +265,209 @@ class MainWindow(QMainWindow):
             self.config.set_first_run(False)
             self.start_indexing()
             
+    def _on_search_text_changed(self, text: str):
+        """输入变化时重新计时，开启实时搜索时停顿后自动搜索"""
+        if not self.config.get_value('ui.real_time_search', True) or self.search_worker is None:
+            return
+        if not text.strip():
+            # 清空输入时作废进行中的搜索并清空结果
+            self.search_timer.stop()
+            self.search_worker.cancel()
+            self.results_model.clear()
+            self.detail_text.clear()
+            return
+        self.search_timer.start(self.config.get_value('ui.search_debounce_ms', 250))
+        
     def perform_search(self):
-        self.logger.info("执行搜索")
-        query = self.search_input.text()
+        """把搜索请求交给后台线程，结果通过信号返回"""
+        self.search_timer.stop()
+        query = self.search_input.text().strip()
         if not query:
             self.logger.warning("搜索内容为空")
             return
             
-        self.results_list.clear()
-        results = self.search_service.search(query)
-        
-        for result in results:
-            item_text = f"{os.path.basename(result['file_path'])} - {result['score']:.2f}"
-            self.results_list.addItem(item_text)
-            # 存储完整结果数据
-            self.results_list.item(self.results_list.count() - 1).setData(Qt.ItemDataRole.UserRole, result)
+        if self.search_worker is None:
+            self.statusBar().showMessage("索引正在加载，请稍后再搜索", 3000)
+            return
             
-    def show_result_detail(self, item):
-        """显示结果详情"""
-        result = item.data(Qt.ItemDataRole.UserRole)
+        self.logger.info("执行搜索")
+        self._search_request_id = self.search_worker.submit(query)
+        self.statusBar().showMessage("正在搜索...")
+        
+    def _on_partial_results(self, request_id: int, results: List[Tuple[int, float]]):
+        """先显示关键词预览结果"""
+        if request_id != self._search_request_id:
+            return
+        self._show_results(results)
+        self.statusBar().showMessage(f"已显示 {len(results)} 个关键词匹配结果，正在进行语义搜索...")
+        
+    def _on_search_results(self, request_id: int, results: List[Tuple[int, float]]):
+        """显示完整结果，替换预览结果"""
+        if request_id != self._search_request_id:
+            return
+        self._show_results(results)
+        self.statusBar().showMessage(f"找到 {len(results)} 个结果", 3000)
+        
+    def _on_search_error(self, request_id: int, error_msg: str):
+        if request_id != self._search_request_id:
+            return
+        self.statusBar().showMessage(f"搜索失败: {error_msg}", 5000)
+        
+    def _show_results(self, results: List[Tuple[int, float]]):
+        """用 (faiss_id, 相关度) 列表替换列表内容"""
+        self.detail_text.clear()
+        self.results_model.set_results(results)
+        
+    def show_result_detail(self, index):
+        """显示当前选中结果的详情"""
+        result = index.data(ResultsModel.ResultRole) if index.isValid() else None
+        if result is None:
+            self.detail_text.clear()
+            return
         detail = f"文件: {result['file_path']}\n"
         detail += f"相关度: {result['score']:.2f}\n"
         detail += f"匹配内容:\n{result['chunk_text']}"
         self.detail_text.setText(detail)
         
-    def start_indexing(self):
-        """开始索引文档"""
-        self.search_service.vector_store.clear_all()
-        directories = self.config.get_scan_directories()
+    def _on_index_button_clicked(self):
+        """索引按钮：未在索引时开始或继续索引，索引进行中时暂停"""
+        if self.index_worker is not None and self.index_worker.isRunning():
+            self.index_button.setEnabled(False)
+            self.statusBar().showMessage('正在暂停索引，等待处理中的文件写入...')
+            self.index_worker.pause()
+        else:
+            self.start_indexing(self._paused_job)
+            
+    def _update_index_button(self):
+        """按索引状态切换按钮文字"""
+        if self.index_worker is not None and self.index_worker.isRunning():
+            self.index_button.setText('暂停索引')
+        elif self._paused_job is not None:
+            self.index_button.setText('继续索引')
+            self.index_button.setToolTip(
+                f"已完成 {self._paused_job['completed_files']}/{self._paused_job['total_files']} 个文件")
+        else:
+            self.index_button.setText('更新索引')
+            self.index_button.setToolTip('')
+        
+    def start_indexing(self, job: Optional[Dict] = None):
+        """
+        开始增量索引文档
+        
+        Args:
+            job: 要继续的未完成索引任务，为空时为所有启用的目录新建任务（未完成的旧任务被取消）
+        """
+        directories = job['directories'] if job else self.search_service.get_enabled_directories()
         if not directories:
             QMessageBox.warning(self, "警告", "请先添加要索引的目录！")
             return
+        if self.index_worker is not None and self.index_worker.isRunning():
+            self.statusBar().showMessage('索引正在进行中', 3000)
+            return
             
-        self.index_button.setEnabled(False)
+        self._paused_job = None
         self.progress_bar.show()
         self.progress_bar.setValue(0)
+        if job:
+            self.statusBar().showMessage(
+                f"继续索引任务：已完成 {job['completed_files']}/{job['total_files']} 个文件")
         
         # 创建并启动索引线程
-        self.index_worker = IndexingWorker(self.search_service, directories)
+        self.index_worker = IndexingWorker(self.search_service, directories,
+                                           job_id=job['id'] if job else None)
         self.index_worker.progress.connect(self.update_progress)
         self.index_worker.finished.connect(self.indexing_finished)
+        self.index_worker.paused.connect(self.indexing_paused)
         self.index_worker.error.connect(self.indexing_error)
         self.index_worker.batch_ready.connect(self.process_index_batch)
+        self.index_worker.stage_stats.connect(self.update_stage_stats)
         self.index_worker.start()
+        self._update_index_button()
         
     def update_progress(self, value):
         """更新进度条"""
         self.progress_bar.setValue(value)
         
+    def update_stage_stats(self, stats: List[Dict]):
+        """在状态栏显示流水线各阶段吞吐"""
+        summary = ' | '.join(
+            f"{stage['name']} {stage['items_per_second']:.1f}/s (队列 {stage['queued']})"
+            for stage in stats
+        )
+        self.statusBar().showMessage(summary)
+        
     def indexing_finished(self):
         """索引完成处理"""
         # 更新所有已处理目录的时间戳
         now = datetime.now()
-        for directory in self.config.get_scan_directories():
-            self.config.set_directory_last_update(directory, now)
+        for directory in self.search_service.get_enabled_directories():
+            self.search_service.update_directory_status(directory, enabled=None, last_update=now.isoformat())
         
-        self.index_button.setEnabled(True)
-        self.progress_bar.hide()
+        self._on_indexing_stopped()
         QMessageBox.information(self, "完成", "文档索引更新完成！")
+        self._start_deferred_reconcile()
+        
+    def indexing_paused(self):
+        """索引已暂停，任务进度已保存"""
+        self._on_indexing_stopped()
+        job = self.search_service.get_unfinished_index_job()
+        if job is not None and job['status'] == 'paused':
+            self._paused_job = job
+            self._update_index_button()
+            self.statusBar().showMessage(
+                f"索引已暂停：已完成 {job['completed_files']}/{job['total_files']} 个文件", 5000)
+        self._start_deferred_reconcile()
         
     def indexing_error(self, error_msg):
         """索引错误处理"""
-        self.index_button.setEnabled(True)
-        self.progress_bar.hide()
+        self._on_indexing_stopped()
         QMessageBox.critical(self, "错误", f"索引过程出错：{error_msg}")
+        self._start_deferred_reconcile()
         
-    def handle_file_change(self, event_type: str, file_path: str):
-        """处理文件变化事件"""
-        try:
-            if event_type in ['created', 'modified']:
-                # 更新单个文件的索引
-                self.search_service.index_document(file_path)
-                # 更新目录时间戳
-                directory = os.path.dirname(file_path)
-                self.config.set_directory_last_update(directory, datetime.now())
-                self.statusBar().showMessage(f"已更新文件索引: {os.path.basename(file_path)}", 3000)
-        except Exception as e:
-            self.status_bar().showMessage(f"索引更新失败: {str(e)}", 5000)
+    def _on_indexing_stopped(self):
+        # 信号在 run 返回前发出，等待线程真正结束后再切换按钮状态
+        self.index_worker.wait()
+        self.index_button.setEnabled(True)
+        self.progress_bar.hide()
+        self._update_index_button()
+        
+    def _start_deferred_reconcile(self):
+        """启动时为恢复索引任务推迟的对账"""
+        if self._reconcile_after_indexing:
+            self._reconcile_after_indexing = False
+            self._start_reconcile()
+        
+    def _on_file_changes_applied(self, result: Dict):
+        """文件监控的一批变化已写入索引"""
+        self.statusBar().showMessage(
+            f"已更新文件索引: 检查 {result['checked']} 个文件，移动 {result['relinked']} 个文件，"
+            f"删除 {result['removed']} 个文件", 3000)
 
     def closeEvent(self, event):
         """窗口关闭事件处理"""
         try:
-            # 保存索引
-            self.search_service.save_index()
-            # 停止文件监控
+            # 预热线程仍在运行时等待其结束，避免线程对象在运行中被销毁
+            if self.warmup_worker.isRunning():
+                self.statusBar().showMessage('正在等待加载完成...')
+                self.warmup_worker.wait()
+            if self.search_worker is not None:
+                self.search_worker.stop()
+            # 索引任务中止后保持运行状态，下次启动时从中断处继续
+            if self.index_worker is not None and self.index_worker.isRunning():
+                self.statusBar().showMessage('正在保存索引进度...')
+                self.index_worker.stop()
+            # 对账中止后，未处理的变化由下次启动时的对账补上
+            if hasattr(self, 'reconcile_worker') and self.reconcile_worker.isRunning():
+                self.statusBar().showMessage('正在停止文件同步...')
+                self.reconcile_worker.stop()
+            # 停止文件监控并刷出最后一批变化，等待这些变化写入后再保存索引
             if hasattr(self, 'file_monitor'):
                 self.file_monitor.stop()
+            if hasattr(self, 'file_change_worker'):
+                self.file_change_worker.stop()
+            # 保存索引
+            if self.search_service is not None:
+                self.search_service.save_index()
             event.accept()
         except Exception as e:
             print(f"关闭窗口时出错: {e}")
@@ -246,7 +478,8 @@ class MainWindow(QMainWindow):
         directory = QFileDialog.getExistingDirectory(self, "选择文档目录")
         if directory:
             self.config.add_scan_directory(directory)
-            self.file_monitor.update_directories(self.config.get_scan_directories())
+            if hasattr(self, 'file_monitor'):
+                self.file_monitor.update_directories(self.config.get_scan_directories())
             self.start_indexing()
 
     def _manage_directories(self):
@@ -259,6 +492,8 @@ class MainWindow(QMainWindow):
         dialog = SettingsDialog(self)
         if dialog.exec() == QDialog.DialogCode.Accepted:
             print("选项框确认")
+            # 重新读取配置，使实时搜索等界面选项立即生效
+            self.config = Config()
         else:
             print("选项框取消")
     
@@ -301,20 +536,22 @@ class MainWindow(QMainWindow):
             self.setEnabled(False)  # 禁用整个窗口
             
             # 直接在主线程中处理所有文件
+            scanner = DirectoryScanner.from_config(self.config)
+            doc_counts = {}
             for directory in directories:
-                for root, _, files in os.walk(directory['path']):
-                    for file in files:
-                        if any(file.lower().endswith(ext) for ext in self.config.get_file_extensions()):
-                            file_path = os.path.join(root, file)
-                            try:
-                                self.search_service.index_document(file_path)
-                            except Exception as e:
-                                print(f"Error processing {file}: {str(e)}")
+                doc_counts[directory['path']] = 0
+                for file_path, _ in scanner.iter_files(directory['path']):
+                    doc_counts[directory['path']] += 1
+                    try:
+                        self.search_service.index_document(file_path)
+                    except Exception as e:
+                        print(f"Error processing {file_path}: {str(e)}")
             
             # 添加更新时间戳代码
             now = datetime.now()
             for directory in directories:
-                self.search_service.update_directory_status(directory['path'], last_update=now.isoformat())
+                self.search_service.update_directory_status(directory['path'], last_update=now.isoformat(),
+                                                            doc_count=doc_counts[directory['path']])
             
             # 显式保存索引
             self.search_service.save_index()
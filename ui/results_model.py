@@ -0,0 +1,100 @@
+"""
+搜索结果列表模型
+
+模型只保存结果的 faiss_id 和相关度，文件路径、分块文本和元数据在行显示或被选中时
+才从 VectorStore 读取。读取按页批量进行，结果保存在一个小型 LRU 缓存中，
+结果数再多，内存占用和刷新列表的耗时也只与可见的行数有关。
+"""
+
+import os
+from typing import Dict, List, Optional, Tuple
+from PyQt6.QtCore import QAbstractListModel, QModelIndex, Qt
+from utils.logger import Logger
+from utils.lru_cache import LRUCache
+
+
+class ResultsModel(QAbstractListModel):
+    """
+    搜索结果模型，配合 QListView 使用
+
+    Roles:
+        DisplayRole: "文件名 - 相关度"
+        ToolTipRole: 文件完整路径
+        ResultRole: 完整结果字典（file_path、score、chunk_text、metadata）
+        ScoreRole: 相关度
+    """
+
+    ResultRole = Qt.ItemDataRole.UserRole
+    ScoreRole = Qt.ItemDataRole.UserRole + 1
+
+    def __init__(self, vector_store=None, page_size: int = 50, cache_size: int = 500, parent=None):
+        """
+        Args:
+            vector_store: 读取分块内容的向量存储，可以稍后用 set_vector_store 设置
+            page_size: 缓存未命中时一次读取的行数
+            cache_size: 最多缓存的分块数
+        """
+        super().__init__(parent)
+        self.logger = Logger.get_logger(__name__)
+        self.vector_store = vector_store
+        self.page_size = page_size
+        self.chunk_cache = LRUCache(cache_size)
+        self._hits: List[Tuple[int, float]] = []
+
+    def set_vector_store(self, vector_store):
+        self.vector_store = vector_store
+        self.chunk_cache.clear()
+
+    def set_results(self, hits: List[Tuple[int, float]]):
+        """用 (faiss_id, 相关度) 列表替换全部结果"""
+        # 文件重新索引时沿用原有分块的 faiss_id，移动后路径也会改写，缓存的分块只在同一组结果内有效
+        self.beginResetModel()
+        self.chunk_cache.clear()
+        self._hits = list(hits)
+        self.endResetModel()
+
+    def clear(self):
+        self.set_results([])
+
+    def rowCount(self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._hits)
+
+    def data(self, index: QModelIndex, role: int = Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._hits):
+            return None
+        if role == self.ScoreRole:
+            return self._hits[index.row()][1]
+        if role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole, self.ResultRole):
+            return None
+
+        result = self.result(index.row())
+        if result is None:
+            return "（文档已从索引中删除）" if role == Qt.ItemDataRole.DisplayRole else None
+        if role == Qt.ItemDataRole.DisplayRole:
+            return f"{os.path.basename(result['file_path'])} - {result['score']:.2f}"
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return result['file_path']
+        return result
+
+    def result(self, row: int) -> Optional[Dict]:
+        """第 row 行的完整结果，分块已被删除时返回 None"""
+        faiss_id, score = self._hits[row]
+        chunk = self.chunk_cache.get(faiss_id)
+        if chunk is None:
+            chunk = self._fetch_page(row).get(faiss_id)
+            if chunk is None:
+                return None
+        return dict(chunk, score=score)
+
+    def _fetch_page(self, row: int) -> Dict[int, Dict]:
+        """读取 row 所在页中尚未缓存的分块并放入缓存"""
+        if self.vector_store is None:
+            return {}
+        start = row - row % self.page_size
+        page_ids = [faiss_id for faiss_id, _ in self._hits[start:start + self.page_size]
+                    if faiss_id not in self.chunk_cache]
+        chunks = self.vector_store.get_chunks(page_ids)
+        for faiss_id, chunk in chunks.items():
+            self.chunk_cache.put(faiss_id, chunk)
+        self.logger.debug("读取结果第 %d 行所在页，%d 个分块", row, len(chunks))
+        return chunks
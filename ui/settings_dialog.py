@@ -171,8 +171,14 @@ class SettingsDialog(QDialog):
             'all-mpnet-base-v2'
         ])
         
+        self.backend_label = QLabel('推理后端:')
+        self.backend_combo = QComboBox()
+        self.backend_combo.addItems(['torch', 'onnx', 'onnx-int8'])
+        
         model_layout.addWidget(self.model_label)
         model_layout.addWidget(self.model_combo)
+        model_layout.addWidget(self.backend_label)
+        model_layout.addWidget(self.backend_combo)
         model_layout.addStretch()
         
         self.model_page.setLayout(model_layout)
@@ -225,6 +231,9 @@ class SettingsDialog(QDialog):
         index = self.model_combo.findText(model_name)
         if index >= 0:
             self.model_combo.setCurrentIndex(index)
+        index = self.backend_combo.findText(self.config.get_model_backend())
+        if index >= 0:
+            self.backend_combo.setCurrentIndex(index)
             
     def apply_settings(self):
         """应用设置"""
@@ -246,6 +255,7 @@ class SettingsDialog(QDialog):
         
         # 保存模型设置
         self.config.set_value('model.name', self.model_combo.currentText())
+        self.config.set_value('model_backend', self.backend_combo.currentText())
         
         # 保存配置文件
         self.config.save_config()
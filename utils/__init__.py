@@ -4,5 +4,7 @@
 
 from .config import Config
 from .file_monitor import FileMonitor
+from .lru_cache import LRUCache
+from .scanner import DirectoryScanner
 
-__all__ = ['Config', 'FileMonitor'] 
\ No newline at end of file
+__all__ = ['Config', 'FileMonitor', 'LRUCache', 'DirectoryScanner'] 
\ No newline at end of file
@@ -9,6 +9,7 @@ class Config:
         self.default_config = {
             "file_extensions": [".pdf", ".docx", ".doc", ".txt", ".pptx"],
             "model_name": "paraphrase-multilingual-MiniLM-L12-v2",
+            "model_backend": "torch",
             "chunk_size": 512,
             "chunk_overlap": 50,
             "index_path": "documents.db",
@@ -51,6 +52,15 @@ class Config:
         self.config["model_name"] = model_name
         self.save_config()
         
+    def get_model_backend(self) -> str:
+        """获取推理后端（torch、onnx 或 onnx-int8）"""
+        return self.config.get("model_backend", "torch")
+    
+    def set_model_backend(self, backend: str):
+        """设置推理后端"""
+        self.config["model_backend"] = backend
+        self.save_config()
+        
     def is_first_run(self) -> bool:
         """检查是否首次运行"""
         return self.config.get("first_run", True)
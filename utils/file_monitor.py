@@ -4,95 +4,261 @@
 
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from typing import List, Callable
+from typing import Callable, Dict, List, Optional
 import os
 import time
-from threading import Lock
+from threading import Condition, Thread
+from utils.logger import Logger
+from utils.scanner import DirectoryScanner
+
+# 视为文件内容可能变化的事件类型（closed 为写入后关闭文件）
+_UPSERT_EVENTS = ('created', 'modified', 'closed')
+
 
 class FileMonitor:
     """
     文件监控器，用于监控文档目录的变化
-    
+
     特点：
     1. 支持多目录监控
-    2. 防抖动处理，避免频繁触发
-    3. 支持文件过滤
-    4. 线程安全
+    2. 按路径合并事件：同一文件在合并窗口内的多次创建、修改、删除、移动只保留最终状态
+    3. 合并后的变化整批交给回调，回调在独立的线程中执行，不占用 watchdog 的事件线程
+    4. 与目录扫描使用相同的过滤规则（扩展名和忽略模式）
+    5. 线程安全
+
+    回调收到的变化批次为字典：
+        upserted: 新增或修改的文件（包括移动的目标路径）
+        deleted: 已删除的文件
+        moved: (原路径, 新路径) 列表，新路径同时出现在 upserted 中
+        deleted_directories: 被删除或移出监控范围的目录，其下已索引的文件都应删除
     """
-    
-    def __init__(self, 
-                 directories: List[str], 
+
+    def __init__(self,
+                 directories: List[str],
                  file_extensions: List[str],
-                 callback: Callable[[str, str], None],
-                 debounce_seconds: float = 1.0):
+                 callback: Callable[[Dict[str, List]], None],
+                 debounce_seconds: float = 1.0,
+                 max_delay: float = 10.0,
+                 max_batch_size: int = 1000,
+                 ignore_patterns: Optional[List[str]] = None):
         """
         初始化文件监控器
-        
+
         Args:
             directories: 要监控的目录列表
             file_extensions: 要监控的文件扩展名列表
-            callback: 文件变化时的回调函数，接收事件类型和文件路径两个参数
-            debounce_seconds: 防抖动时间，单位秒
+            callback: 变化批次的回调函数，参数为变化批次字典
+            debounce_seconds: 合并窗口，连续这么长时间没有新事件时提交批次，单位秒
+            max_delay: 持续有事件时，批次中最早的事件最多等待的时间，单位秒
+            max_batch_size: 批次中的路径数达到该值时立即提交
+            ignore_patterns: 忽略的文件名或目录名 glob 模式，默认与 DirectoryScanner 相同
         """
+        self.logger = Logger.get_logger(__name__)
         self.directories = directories
         self.file_extensions = [ext.lower() for ext in file_extensions]
+        self.ignore_patterns = ignore_patterns
+        self.scanner = DirectoryScanner(self.file_extensions, ignore_patterns)
         self.callback = callback
         self.debounce_seconds = debounce_seconds
-        
-        self.observer = Observer()
-        self.lock = Lock()
-        self.last_event_time = 0
+        self.max_delay = max_delay
+        self.max_batch_size = max_batch_size
+
+        self.observer = None
+        self.lock = Condition()
+        # 路径 -> "upsert" 或 "delete"，同一路径只保留最后的状态
+        self._changes: Dict[str, str] = {}
+        # 移动目标路径 -> 最初的路径，连续移动合并为一次
+        self._moves: Dict[str, str] = {}
+        self._deleted_directories: List[str] = []
+        self._first_event_time = 0.0
+        self._last_event_time = 0.0
+        self._running = False
+        self._flusher: Optional[Thread] = None
         self.handler = self._create_event_handler()
-        
+
     def _create_event_handler(self) -> FileSystemEventHandler:
         """创建文件系统事件处理器"""
-        
+
         monitor = self
-        
+
         class Handler(FileSystemEventHandler):
             def on_any_event(self, event):
-                # 忽略目录事件
-                if event.is_directory:
+                try:
+                    monitor._record(event)
+                except Exception as e:
+                    monitor.logger.error("处理文件事件失败 %s: %s", event, str(e))
+
+        return Handler()
+
+    def _matches(self, path: str) -> bool:
+        """检查文件扩展名和忽略模式"""
+        return self.scanner.accepts(path, self._watched_root(path))
+
+    def _record(self, event):
+        """把事件合并到待提交的变化中"""
+        # 事件路径由 watchdog 以注册时的目录字符串拼接而成，与扫描写入清单的路径形式一致，不做规范化
+        src_path = event.src_path
+        dest_path = getattr(event, 'dest_path', None) or None
+
+        with self.lock:
+            if event.is_directory:
+                # 目录内文件的创建、修改会各自产生事件；目录被删除或移出时子文件不一定有事件
+                if event.event_type == 'deleted':
+                    self._deleted_directories.append(src_path)
+                elif event.event_type == 'moved' and not self._is_watched(dest_path):
+                    self._deleted_directories.append(src_path)
+                else:
                     return
-                    
-                # 检查文件扩展名
-                if not any(event.src_path.lower().endswith(ext) 
-                          for ext in monitor.file_extensions):
+            elif event.event_type == 'moved':
+                if not self._record_move(src_path, dest_path):
                     return
-                    
-                with monitor.lock:
-                    current_time = time.time()
-                    # 防抖动处理
-                    if current_time - monitor.last_event_time < monitor.debounce_seconds:
-                        return
-                    monitor.last_event_time = current_time
-                    
-                # 调用回调函数
-                monitor.callback(event.event_type, event.src_path)
-                
-        return Handler()
-        
+            elif not self._matches(src_path):
+                return
+            elif event.event_type == 'deleted':
+                self._record_delete(src_path)
+            elif event.event_type in _UPSERT_EVENTS:
+                self._changes[src_path] = 'upsert'
+            else:
+                return
+
+            now = time.monotonic()
+            if not self._first_event_time:
+                self._first_event_time = now
+            self._last_event_time = now
+            self.lock.notify_all()
+
+    def _record_delete(self, path: str):
+        origin = self._moves.pop(path, None)
+        if origin is not None:
+            # 文件移动后又被删除：原路径上的索引数据同样需要删除
+            self._changes[origin] = 'delete'
+        self._changes[path] = 'delete'
+
+    def _record_move(self, src_path: str, dest_path: str) -> bool:
+        """合并移动事件，事件与监控的文件类型无关时返回 False"""
+        src_matches, dest_matches = self._matches(src_path), self._matches(dest_path)
+        if not src_matches and not dest_matches:
+            return False
+        if not dest_matches or not self._is_watched(dest_path):
+            # 改成了不监控的扩展名或移出监控目录，相当于删除
+            if not src_matches:
+                return False
+            self._record_delete(src_path)
+            return True
+        if not src_matches:
+            self._changes[dest_path] = 'upsert'
+            return True
+
+        origin = self._moves.pop(src_path, src_path)
+        self._changes.pop(src_path, None)
+        replaced = self._moves.pop(dest_path, None)
+        if replaced is not None and replaced != origin:
+            # 目标路径上原本是另一个移动过来的文件，它已被覆盖
+            self._changes[replaced] = 'delete'
+        if origin != dest_path:
+            self._moves[dest_path] = origin
+        self._changes[dest_path] = 'upsert'
+        return True
+
+    def _is_watched(self, path: str) -> bool:
+        """路径是否位于监控的目录下"""
+        return self._watched_root(path) is not None
+
+    def _watched_root(self, path: str) -> Optional[str]:
+        """路径所在的最深监控目录，不在任何监控目录下时返回 None（与 ShardedIndex.route 相同的前缀匹配）"""
+        best = None
+        for directory in self.directories:
+            if (path == directory or path.startswith(os.path.join(directory, ''))) and \
+                    (best is None or len(directory) > len(best)):
+                best = directory
+        return best
+
+    def _has_pending_locked(self) -> bool:
+        return bool(self._changes or self._deleted_directories)
+
+    def _take_batch_locked(self) -> Dict[str, List]:
+        """取出当前合并的全部变化"""
+        batch = {
+            "upserted": [path for path, state in self._changes.items() if state == 'upsert'],
+            "deleted": [path for path, state in self._changes.items() if state == 'delete'],
+            "moved": [(origin, dest) for dest, origin in self._moves.items()],
+            "deleted_directories": self._deleted_directories,
+        }
+        self._changes = {}
+        self._moves = {}
+        self._deleted_directories = []
+        self._first_event_time = 0.0
+        return batch
+
+    def _flush_loop(self):
+        """等待合并窗口结束后提交批次"""
+        while True:
+            with self.lock:
+                while self._running and not self._has_pending_locked():
+                    self.lock.wait()
+                if not self._running:
+                    return
+                while self._running:
+                    now = time.monotonic()
+                    deadline = min(self._last_event_time + self.debounce_seconds,
+                                   self._first_event_time + self.max_delay)
+                    if now >= deadline or len(self._changes) >= self.max_batch_size:
+                        break
+                    self.lock.wait(deadline - now)
+                if not self._running:
+                    return
+                batch = self._take_batch_locked()
+            self._deliver(batch)
+
+    def _deliver(self, batch: Dict[str, List]):
+        self.logger.info(
+            "文件变化: 新增或修改 %d, 删除 %d, 移动 %d, 删除目录 %d",
+            len(batch["upserted"]), len(batch["deleted"]),
+            len(batch["moved"]), len(batch["deleted_directories"])
+        )
+        try:
+            self.callback(batch)
+        except Exception as e:
+            self.logger.error("处理文件变化失败: %s", str(e))
+
     def start(self):
         """启动文件监控"""
+        # Observer 线程停止后不能再次启动，每次启动都新建
+        self.observer = Observer()
         for directory in self.directories:
             if os.path.exists(directory):
                 self.observer.schedule(self.handler, directory, recursive=True)
             else:
-                print(f"Warning: Directory not found: {directory}")
-                
+                self.logger.warning("监控目录不存在: %s", directory)
+
+        with self.lock:
+            self._running = True
+        self._flusher = Thread(target=self._flush_loop, name="file-monitor-flush", daemon=True)
+        self._flusher.start()
         self.observer.start()
-        
+
     def stop(self):
-        """停止文件监控"""
-        self.observer.stop()
-        self.observer.join()
-        
+        """停止文件监控，尚未提交的变化立即提交"""
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        with self.lock:
+            self._running = False
+            self.lock.notify_all()
+            batch = self._take_batch_locked() if self._has_pending_locked() else None
+        if self._flusher is not None:
+            self._flusher.join()
+            self._flusher = None
+        if batch is not None:
+            self._deliver(batch)
+
     def update_directories(self, directories: List[str]):
         """更新监控目录列表"""
         self.stop()
         self.directories = directories
         self.start()
-        
+
     def update_extensions(self, extensions: List[str]):
         """更新监控文件类型"""
-        self.file_extensions = [ext.lower() for ext in extensions] 
\ No newline at end of file
+        self.file_extensions = [ext.lower() for ext in extensions]
+        self.scanner = DirectoryScanner(self.file_extensions, self.ignore_patterns)
@@ -0,0 +1,75 @@
+"""
+线程安全的内存 LRU 缓存
+"""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """
+    内存中的最近最少使用缓存
+
+    特点：
+    1. 条目数超过上限时淘汰最久未访问的条目
+    2. 统计命中与未命中次数
+    3. 线程安全
+    """
+
+    def __init__(self, max_entries: int = 256):
+        """
+        Args:
+            max_entries: 最多缓存的条目数，为 0 时不缓存
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """查询缓存，未命中时返回 None"""
+        with self.lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """写入缓存，超过容量时淘汰最久未访问的条目"""
+        if self.max_entries <= 0 or value is None:
+            return
+        with self.lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空缓存（保留命中统计）"""
+        with self.lock:
+            self._entries.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        """是否已缓存（不更新访问顺序和命中统计）"""
+        with self.lock:
+            return key in self._entries
+            
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        """获取缓存统计信息"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0
+            }
@@ -0,0 +1,109 @@
+"""
+目录扫描模块，索引、对账、文件监控和目录管理共用的文件遍历与过滤规则
+"""
+
+import fnmatch
+import os
+import re
+from typing import Iterable, Iterator, List, Optional, Tuple
+from utils.logger import Logger
+
+# 默认忽略的文件和目录：Office 临时锁文件、版本库元数据、依赖和缓存目录、Windows 系统目录
+DEFAULT_IGNORE_PATTERNS = [
+    "~$*",
+    ".git",
+    ".svn",
+    ".hg",
+    "__pycache__",
+    "node_modules",
+    "$RECYCLE.BIN",
+    "System Volume Information",
+]
+
+
+class DirectoryScanner:
+    """
+    基于 os.scandir 的单遍目录扫描器
+
+    特点：
+    1. 单遍遍历，边扫描边产出 (文件路径, stat)，调用方无需等待整个目录扫描完成
+    2. 只产出扩展名受支持的文件，图片、二进制等文件不会进入解析
+    3. 忽略模式按文件名或目录名做 glob 匹配，匹配的目录整棵跳过
+    4. 直接使用目录项的 stat 信息（Windows 上不需要额外的系统调用），不打开任何文件
+    5. 不进入指向目录的符号链接，无法访问的目录和文件被跳过
+    """
+
+    def __init__(self, extensions: Iterable[str], ignore_patterns: Optional[Iterable[str]] = None):
+        """
+        Args:
+            extensions: 要扫描的文件扩展名列表，如 [".pdf", ".docx"]
+            ignore_patterns: 忽略的文件名或目录名 glob 模式，默认为 DEFAULT_IGNORE_PATTERNS
+        """
+        self.logger = Logger.get_logger(__name__)
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        if ignore_patterns is None:
+            ignore_patterns = DEFAULT_IGNORE_PATTERNS
+        # 统一按小写匹配，Windows 上文件名不区分大小写；所有模式合并为一个正则，每个目录项只匹配一次
+        self.ignore_patterns: List[str] = [pattern.lower() for pattern in ignore_patterns]
+        self._ignore_regex = None
+        if self.ignore_patterns:
+            self._ignore_regex = re.compile(
+                '|'.join(fnmatch.translate(pattern) for pattern in self.ignore_patterns))
+
+    @classmethod
+    def from_config(cls, config) -> 'DirectoryScanner':
+        """按配置文件中的 file_extensions 和 scan.ignore_patterns 创建扫描器"""
+        return cls(config.get_file_extensions(),
+                   config.get_value('scan.ignore_patterns', DEFAULT_IGNORE_PATTERNS))
+
+    def is_ignored(self, name: str) -> bool:
+        """文件名或目录名是否匹配忽略模式"""
+        return self._ignore_regex is not None and self._ignore_regex.match(name.lower()) is not None
+
+    def matches(self, name: str) -> bool:
+        """文件名是否为受支持的扩展名且不被忽略"""
+        return name.lower().endswith(self.extensions) and not self.is_ignored(name)
+
+    def accepts(self, path: str, root: Optional[str] = None) -> bool:
+        """
+        路径是否会被扫描到：文件名受支持，且 root 以下的各级目录都不被忽略
+
+        Args:
+            path: 文件路径
+            root: 扫描的根目录，其本身及以上的目录不参与忽略匹配；为空时检查所有上级目录
+        """
+        if not self.matches(os.path.basename(path)):
+            return False
+        parent = os.path.dirname(path)
+        if root is not None:
+            try:
+                parent = os.path.relpath(parent, root)
+            except ValueError:
+                # Windows 上不同盘符的路径
+                return False
+        return not any(self.is_ignored(part) for part in parent.split(os.sep)
+                       if part and part not in (os.curdir, os.pardir))
+
+    def iter_files(self, directory: str) -> Iterator[Tuple[str, os.stat_result]]:
+        """遍历目录，产出受支持文件的 (文件路径, stat)"""
+        stack = [directory]
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except OSError as e:
+                self.logger.debug("无法访问目录 %s: %s", e.filename, e.strerror)
+                continue
+            with entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not self.is_ignored(entry.name):
+                                stack.append(entry.path)
+                        elif self.matches(entry.name) and entry.is_file():
+                            yield entry.path, entry.stat()
+                    except OSError:
+                        continue
+
+    def count(self, directory: str) -> int:
+        """统计目录下受支持的文件数"""
+        return sum(1 for _ in self.iter_files(directory))